@@ -30,6 +30,7 @@ def initialize_session_state():
     st.session_state.setdefault('preferences_completed', False)
     st.session_state.setdefault('movie_ratings', [])
     st.session_state.setdefault('selected_movies', [])
+    st.session_state.setdefault('ratings_job_id', None)
 
 
 def main():
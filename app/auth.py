@@ -5,7 +5,6 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 import streamlit as st
-from app.similarity_calculator import calculate_similarities_for_new_user
 
 
 def show_auth_form(db_manager):
@@ -85,26 +84,24 @@ def logout_user():
     st.session_state.messages = []
     st.session_state.movie_ratings = []
     st.session_state.is_new_user = False
+    st.session_state.ratings_job_id = None
     return True, "Sesión cerrada correctamente."
 
 
 def process_user_ratings(db_manager, user_id, movie_ratings):
-    """Procesa y guarda las valoraciones del usuario y calcula similitudes."""
+    """
+    Guarda las valoraciones del usuario y encola el cálculo de similitudes en segundo plano.
+
+    El id del trabajo queda en ``st.session_state.ratings_job_id`` para mostrar su estado.
+    """
     try:
         success, message = db_manager.save_movie_ratings(user_id, movie_ratings)
         if not success:
             return False, message
 
-        if len(movie_ratings) >= 3:
-            with st.spinner("Calculando recomendaciones personalizadas..."):
-                similitudes_count = calculate_similarities_for_new_user(
-                    db_manager.connector,
-                    user_id,
-                    movie_ratings
-                )
-                if similitudes_count > 0:
-                    st.success(f"¡Se encontraron {similitudes_count} usuarios con gustos similares!")
-
+        st.session_state.ratings_job_id = db_manager.job_queue.submit(
+            "ratings_changed", user_id, movie_ratings=movie_ratings
+        )
         return True, "¡Valoraciones guardadas exitosamente! Ahora puedes usar el chatbot."
     except Exception as e:
-        return False, f"Error al procesar las valoraciones: {str(e)}"
\ No newline at end of file
+        return False, f"Error al procesar las valoraciones: {str(e)}"
@@ -1,10 +1,16 @@
 from pymongo import MongoClient
 from datetime import datetime
+import os
 import uuid
 import hashlib
 from recomendador.Neo4jConector import Neo4jConector
 from recomendador.CompleteRecommendationSystem import Neo4jRecommendationSystem
+from recomendador.FactorModel import FactorModel
+from recomendador.RecommendationStore import RecommendationStore
 from recomendador.ChatbotRecommender import ChatbotRecommender
+from preprocesamiento.pair_statistics import EstadisticasPares
+from app.job_queue import JobQueue
+from app.similarity_calculator import calculate_similarities_for_new_user
 
 
 class DatabaseManager:
@@ -14,15 +20,38 @@ class DatabaseManager:
         NEO4J_URI = "neo4j://localhost:7687"
         NEO4J_USER = "neo4j"
         NEO4J_PASSWORD = "Virt1234*"
+        # Almacén de estadísticos por par generado por preprocesamiento/main.py
+        ESTADISTICAS_PARES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocesamiento",
+                                          "estadisticas_pares.sqlite")
+        # Factores ALS del criterio "modelo", también generados por preprocesamiento/main.py
+        MODELO_ALS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocesamiento", "modelo_als")
+        # Top-N precalculado por recomendador/precompute.py
+        RECOMENDACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "recomendador",
+                                       "recomendaciones.sqlite")
+        self.recommendation_store = RecommendationStore(RECOMENDACIONES) if os.path.exists(RECOMENDACIONES) else None
 
         try:
             self.connector = Neo4jConector(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
-            self.system = Neo4jRecommendationSystem(self.connector)
+            self.system = Neo4jRecommendationSystem(self.connector,
+                                                    factor_model=FactorModel.cargar_si_existe(MODELO_ALS),
+                                                    recommendation_store=self.recommendation_store)
+            # Recomendaciones personalizadas en una sola consulta (candidatos y detalles juntos)
+            self.system.combined_query_mode = True
+            # Consultas por criterio de sesiones concurrentes agrupadas en micro-lotes de 5 ms
+            self.system.micro_batching = True
             self.recommender = ChatbotRecommender(self.system)
             self.connection_error = None
         except Exception as e:
             self.connection_error = str(e)
 
+        # Sin el almacén las similitudes de un usuario se recalculan consultando Neo4j
+        self.estadisticas_pares = EstadisticasPares(ESTADISTICAS_PARES) if os.path.exists(ESTADISTICAS_PARES) else None
+
+        # Diario de los trabajos en segundo plano; la cola es única por proceso y la comparten las sesiones
+        TRABAJOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trabajos.sqlite")
+        self.job_queue = JobQueue.shared(TRABAJOS, {"ratings_changed": self.refresh_user_after_ratings}) \
+            if self.connection_error is None else None
+
         mongo_uri = "mongodb://localhost:27017/"
         client = MongoClient(mongo_uri)
         db = client['MRP']
@@ -31,15 +60,12 @@ class DatabaseManager:
     def user_exists(self, username: str) -> bool:
         """Devuelve True si existe un usuario con ese username en Neo4j."""
         check_query = "MATCH (u:Usuario {username: $username}) RETURN u LIMIT 1"
-        result = self.connector.execute_query(check_query, {"username": username})
+        result = self.connector.execute_read(check_query, {"username": username})
         return bool(result)
 
     def get_peliculas_options(self):
-        """Obtiene la lista de todas las películas disponibles en Neo4j."""
-        query = "MATCH (p:Pelicula) RETURN DISTINCT p.titulo AS titulo ORDER BY titulo"
-        results = self.connector.execute_query(query)
-        peliculas = [record['titulo'] for record in results]
-        return peliculas
+        """Obtiene la lista ordenada de todas las películas disponibles (del catálogo en memoria)."""
+        return self.system.catalog.titles()
 
     def enrich_movie_results(self, results):
         """Enriquece los resultados de Neo4j con datos de MongoDB."""
@@ -90,7 +116,7 @@ class DatabaseManager:
                 "email": email,
                 "fecha_registro": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
-            self.connector.execute_query(create_query, params)
+            self.connector.execute_write(create_query, params)
             return True, user_uuid, "Usuario registrado exitosamente."
         except Exception as e:
             return False, None, f"Error al registrar: {str(e)}"
@@ -103,7 +129,7 @@ class DatabaseManager:
             MATCH (u:Usuario {username: $username, password: $password})
             RETURN u.id AS id, u.username AS username
             """
-            res = self.connector.execute_query(
+            res = self.connector.execute_read(
                 auth_query, {"username": username, "password": hashed}
             )
             if not res:
@@ -114,7 +140,7 @@ class DatabaseManager:
             MATCH (u:Usuario {id: $id})-[r:VALORA]->(p:Pelicula)
             RETURN p.titulo AS pelicula, r.puntuacion AS valoracion
             """
-            ratings = self.connector.execute_query(
+            ratings = self.connector.execute_read(
                 ratings_query, {"id": user['id']}
             )
 
@@ -126,35 +152,51 @@ class DatabaseManager:
     def save_movie_ratings(self, user_id, movie_ratings):
         """Guarda las valoraciones de películas del usuario en Neo4j."""
         try:
-            for rating in movie_ratings:
-                pelicula_query = """
-                    MATCH (p:Pelicula {titulo: $titulo})
-                    RETURN p.id as id
-                    """
-                pelicula_params = {"titulo": rating['pelicula']}
-                pelicula_result = self.connector.execute_query(pelicula_query, pelicula_params)
-
-                if pelicula_result:
-                    pelicula_id = pelicula_result[0]['id']
-
-                    rating_query = """
-                        MATCH (u:Usuario {id: $user_id})
-                        MATCH (p:Pelicula {id: $pelicula_id})
-                        MERGE (u)-[r:VALORA]->(p)
-                        ON CREATE SET r.puntuacion = $puntuacion
-                        RETURN r
-                        """
-                    rating_params = {
-                        "user_id": user_id,
-                        "pelicula_id": pelicula_id,
-                        "puntuacion": rating['valoracion']
-                    }
-                    self.connector.execute_query(rating_query, rating_params)
+            # Una sola consulta para todas las valoraciones; si hay títulos repetidos se usa la primera película
+            rating_query = """
+                UNWIND $valoraciones AS valoracion
+                MATCH (u:Usuario {id: $user_id})
+                CALL {
+                    WITH valoracion
+                    MATCH (p:Pelicula {titulo: valoracion.pelicula})
+                    RETURN p LIMIT 1
+                }
+                MERGE (u)-[r:VALORA]->(p)
+                SET r.puntuacion = valoracion.valoracion
+                """
+            rating_params = {
+                "user_id": user_id,
+                "valoraciones": [{"pelicula": rating['pelicula'], "valoracion": rating['valoracion']}
+                                 for rating in movie_ratings]
+            }
+            self.connector.execute_write(rating_query, rating_params)
+            # Las recomendaciones precalculadas ya no tienen en cuenta estas valoraciones
+            if self.recommendation_store is not None:
+                self.recommendation_store.invalidate(user_id)
 
             return True, "Valoraciones guardadas exitosamente."
         except Exception as e:
             return False, f"Error al guardar las valoraciones: {str(e)}"
 
+    def refresh_user_after_ratings(self, user_id, movie_ratings):
+        """
+        Trabajo "ratings_changed": recalcula los usuarios similares tras guardar valoraciones y
+        descarta las preferencias y recomendaciones cacheadas del usuario.
+
+        Returns:
+            int: Número de relaciones de similitud creadas
+        """
+        similitudes_count = 0
+        if len(movie_ratings) >= 3:
+            similitudes_count = calculate_similarities_for_new_user(
+                self.connector,
+                user_id,
+                movie_ratings,
+                estadisticas=self.estadisticas_pares
+            )
+        self.system.invalidate_user(user_id)
+        return similitudes_count
+
     def get_movie_recommendations(self, user_query, user_id):
         """Obtiene recomendaciones de películas basadas en la consulta del usuario."""
         results = self.recommender.process_natural_query(user_query, user_id)
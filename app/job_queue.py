@@ -0,0 +1,145 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    usuario,
+    datos TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    resultado TEXT,
+    error TEXT,
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, creado);
+"""
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+_FIN = object()
+_instancias = {}
+_instancias_lock = threading.Lock()
+
+
+class JobQueue:
+    """
+    Cola de trabajos en segundo plano con el estado de cada trabajo en un diario SQLite.
+
+    Los trabajos se ejecutan en un pool de hilos con el manejador registrado para su tipo,
+    ``handler(user_id, **datos)``. Al arrancar se vuelven a encolar los trabajos que quedaron
+    pendientes o a medias en una ejecución anterior; un trabajo que falla se reintenta hasta
+    ``max_intentos`` veces y después queda en estado ``error``.
+    """
+
+    def __init__(self, ruta, handlers, num_workers=2, max_intentos=3):
+        self.ruta = ruta
+        self.handlers = dict(handlers)
+        self.max_intentos = max_intentos
+        self._lock = threading.Lock()
+        self.conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript(ESQUEMA)
+        self._cola = queue.Queue()
+
+        with self._lock, self.conexion:
+            self.conexion.execute("UPDATE trabajos SET estado = ? WHERE estado = ?", (PENDIENTE, EN_CURSO))
+            pendientes = self.conexion.execute(
+                "SELECT id FROM trabajos WHERE estado = ? ORDER BY creado", (PENDIENTE,)
+            ).fetchall()
+        for (job_id,) in pendientes:
+            self._cola.put(job_id)
+
+        self._workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @classmethod
+    def shared(cls, ruta, handlers, **kwargs):
+        """Devuelve la cola del proceso para ``ruta`` (una por diario, compartida entre sesiones)."""
+        with _instancias_lock:
+            if ruta not in _instancias:
+                _instancias[ruta] = cls(ruta, handlers, **kwargs)
+            return _instancias[ruta]
+
+    def submit(self, tipo, user_id, **datos):
+        """Registra un trabajo en el diario y lo encola. Devuelve su id."""
+        if tipo not in self.handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+        job_id = uuid.uuid4().hex
+        ahora = time.time()
+        with self._lock, self.conexion:
+            self.conexion.execute(
+                "INSERT INTO trabajos (id, tipo, usuario, datos, estado, creado, actualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, tipo, user_id, json.dumps(datos, ensure_ascii=False), PENDIENTE, ahora, ahora)
+            )
+        self._cola.put(job_id)
+        return job_id
+
+    def status(self, job_id):
+        """Estado de un trabajo como diccionario (estado, intentos, resultado, error...) o None."""
+        with self._lock:
+            fila = self.conexion.execute(
+                "SELECT tipo, usuario, estado, intentos, resultado, error, creado, actualizado "
+                "FROM trabajos WHERE id = ?", (job_id,)
+            ).fetchone()
+        if fila is None:
+            return None
+        tipo, usuario, estado, intentos, resultado, error, creado, actualizado = fila
+        return {'id': job_id, 'tipo': tipo, 'usuario': usuario, 'estado': estado, 'intentos': intentos,
+                'resultado': json.loads(resultado) if resultado is not None else None, 'error': error,
+                'creado': creado, 'actualizado': actualizado}
+
+    def _actualizar(self, job_id, **campos):
+        campos['actualizado'] = time.time()
+        asignaciones = ", ".join(f"{campo} = ?" for campo in campos)
+        with self._lock, self.conexion:
+            self.conexion.execute(f"UPDATE trabajos SET {asignaciones} WHERE id = ?", (*campos.values(), job_id))
+
+    def _ejecutar(self, job_id):
+        with self._lock, self.conexion:
+            fila = self.conexion.execute(
+                "SELECT tipo, usuario, datos, intentos FROM trabajos WHERE id = ? AND estado = ?", (job_id, PENDIENTE)
+            ).fetchone()
+            if fila is None:
+                return
+            tipo, usuario, datos, intentos = fila
+            self.conexion.execute("UPDATE trabajos SET estado = ?, intentos = ?, actualizado = ? WHERE id = ?",
+                                  (EN_CURSO, intentos + 1, time.time(), job_id))
+        try:
+            resultado = self.handlers[tipo](usuario, **json.loads(datos))
+            self._actualizar(job_id, estado=COMPLETADO, resultado=json.dumps(resultado, default=str), error=None)
+        except Exception as e:
+            traceback.print_exc()
+            if intentos + 1 < self.max_intentos:
+                self._actualizar(job_id, estado=PENDIENTE, error=str(e))
+                self._cola.put(job_id)
+            else:
+                self._actualizar(job_id, estado=ERROR, error=str(e))
+
+    def _worker(self):
+        while True:
+            job_id = self._cola.get()
+            if job_id is _FIN:
+                break
+            self._ejecutar(job_id)
+
+    def close(self):
+        """Detiene los hilos tras los trabajos ya encolados y cierra el diario."""
+        for _ in self._workers:
+            self._cola.put(_FIN)
+        for worker in self._workers:
+            worker.join()
+        self.conexion.close()
@@ -1,5 +1,8 @@
+import heapq
 import numpy as np
 
+from preprocesamiento.pair_statistics import pearson_desde_estadisticas, publicar_vecinos, usuarios_afectados
+
 
 def calculate_pearson_similarity(user1_ratings, user2_ratings, min_peliculas=3):
     """
@@ -28,7 +31,39 @@ def calculate_pearson_similarity(user1_ratings, user2_ratings, min_peliculas=3):
     return None
 
 
-def calculate_similarities_for_new_user(connector, user_id, movie_ratings, min_peliculas=3):
+def calculate_pearson_similarities(new_user_ratings, candidates, min_peliculas=3):
+    """
+    Calcula en una sola pasada vectorizada la correlación de Pearson entre el usuario nuevo y
+    todos los candidatos, sobre las películas que tienen en común.
+
+    Args:
+        new_user_ratings: Diccionario {movie_id: valoración} del usuario nuevo
+        candidates: Lista de registros con ``movie_ids`` y ``ratings`` de cada candidato,
+                    restringidos a las películas del usuario nuevo
+
+    Returns:
+        np.ndarray: similitud de cada candidato, NaN si no hay suficientes películas en común
+                    o alguno no tiene varianza
+    """
+    indice = {movie_id: i for i, movie_id in enumerate(new_user_ratings)}
+    ratings_nuevo = np.array(list(new_user_ratings.values()), dtype=np.float64)
+    longitudes = np.array([len(candidate['movie_ids']) for candidate in candidates], dtype=np.int64)
+    total = int(longitudes.sum())
+
+    filas = np.repeat(np.arange(len(candidates)), longitudes)
+    x = ratings_nuevo[np.fromiter((indice[m] for c in candidates for m in c['movie_ids']), dtype=np.int64,
+                                  count=total)]
+    y = np.fromiter((r for c in candidates for r in c['ratings']), dtype=np.float64, count=total)
+
+    def suma(valores):
+        return np.bincount(filas, weights=valores, minlength=len(candidates))
+
+    return pearson_desde_estadisticas(longitudes, suma(x), suma(y), suma(x * x), suma(y * y), suma(x * y),
+                                      min_peliculas)
+
+
+def calculate_similarities_for_new_user(connector, user_id, movie_ratings, min_peliculas=3, top_k=50,
+                                        score_minimo=0.3, estadisticas=None, max_candidatos=None):
     """
     Calcula similaridades solo con usuarios que hayan valorado las mismas películas
     que el nuevo usuario
@@ -38,6 +73,13 @@ def calculate_similarities_for_new_user(connector, user_id, movie_ratings, min_p
         user_id: ID del usuario nuevo
         movie_ratings: Lista de diccionarios con las valoraciones {pelicula: título, valoracion: puntuación}
         min_peliculas: Número mínimo de películas en común para calcular similitud
+        top_k: Número máximo de vecinos que se guardan como aristas (u)-[:SIMILAR]->(vecino)
+        score_minimo: Solo se guardan similitudes estrictamente mayores
+        estadisticas: EstadisticasPares opcional; si se indica, las valoraciones actualizan los
+                      estadísticos de los pares afectados y se refrescan los vecinos de los
+                      usuarios cuya lista puede haber cambiado, sin consultar a Neo4j
+        max_candidatos: Sin el almacén, limita los candidatos a los que más películas comparten
+                        con el usuario nuevo (None para evaluarlos todos)
 
     Returns:
         int: Número de relaciones de similitud creadas
@@ -48,7 +90,7 @@ def calculate_similarities_for_new_user(connector, user_id, movie_ratings, min_p
     RETURN p.id as id, p.titulo as titulo
     """
     movie_titles = [rating['pelicula'] for rating in movie_ratings]
-    movies_result = connector.execute_query(movie_ids_query, {"titulos": movie_titles})
+    movies_result = connector.execute_read(movie_ids_query, {"titulos": movie_titles})
 
     title_to_id = {record['titulo']: record['id'] for record in movies_result}
 
@@ -58,44 +100,52 @@ def calculate_similarities_for_new_user(connector, user_id, movie_ratings, min_p
         if movie_title in title_to_id:
             new_user_ratings[title_to_id[movie_title]] = rating['valoracion']
 
-    related_users_query = """
+    if estadisticas is not None:
+        cambios = estadisticas.actualizar_valoraciones(
+            [(user_id, movie_id, valoracion) for movie_id, valoracion in new_user_ratings.items()],
+            min_peliculas
+        )
+        afectados = usuarios_afectados(cambios, [user_id], score_minimo)
+        publicados = publicar_vecinos(connector.execute_write, estadisticas, afectados, top_k, score_minimo,
+                                      min_peliculas)
+        return publicados.get(user_id, 0)
+
+    # Una sola consulta con las valoraciones de los demás usuarios sobre las películas del usuario
+    # nuevo, agrupadas por usuario; solo ellas intervienen en Pearson
+    candidates_query = """
     MATCH (u:Usuario)-[r:VALORA]->(p:Pelicula)
     WHERE p.id IN $movie_ids AND u.id <> $user_id
-    RETURN DISTINCT u.id as user_id
+    WITH u, COLLECT(p.id) AS movie_ids, COLLECT(r.puntuacion) AS ratings
+    WHERE SIZE(movie_ids) >= $min_peliculas
+    RETURN u.id AS user_id, movie_ids, ratings
     """
-    related_users = connector.execute_query(
-        related_users_query,
-        {"movie_ids": list(new_user_ratings.keys()), "user_id": user_id}
+    if max_candidatos:
+        candidates_query += """
+    ORDER BY SIZE(movie_ids) DESC
+    LIMIT $max_candidatos
+    """
+    candidates = connector.execute_read(
+        candidates_query,
+        {"movie_ids": list(new_user_ratings.keys()), "user_id": user_id, "min_peliculas": min_peliculas,
+         "max_candidatos": max_candidatos}
     )
 
     similarity_pairs = []
+    if candidates:
+        similarities = calculate_pearson_similarities(new_user_ratings, candidates, min_peliculas)
+        for candidate, similarity in zip(candidates, similarities.tolist()):
+            if similarity > score_minimo:
+                similarity_pairs.append([user_id, candidate['user_id'], similarity])
 
-    for user_record in related_users:
-        other_user_id = user_record['user_id']
-
-        other_ratings_query = """
-        MATCH (u:Usuario {id: $user_id})-[r:VALORA]->(p:Pelicula)
-        RETURN p.id as movie_id, r.puntuacion as rating
-        """
-        other_ratings_result = connector.execute_query(
-            other_ratings_query,
-            {"user_id": other_user_id}
-        )
-
-        other_user_ratings = {record['movie_id']: record['rating'] for record in other_ratings_result}
-
-        similarity = calculate_pearson_similarity(new_user_ratings, other_user_ratings, min_peliculas)
-
-        if similarity is not None:
-            similarity_pairs.append([user_id, other_user_id, float(similarity)])
+    similarity_pairs = heapq.nlargest(top_k, similarity_pairs, key=lambda pair: pair[2])
 
     if similarity_pairs:
         create_similarities_query = """
         UNWIND $batch AS pair
         MATCH (u1:Usuario {id: pair[0]}), (u2:Usuario {id: pair[1]})
-        MERGE (u1)-[s:SIMILAR]-(u2)
+        MERGE (u1)-[s:SIMILAR]->(u2)
         SET s.score = pair[2]
         """
-        connector.execute_query(create_similarities_query, {"batch": similarity_pairs})
+        connector.execute_write(create_similarities_query, {"batch": similarity_pairs})
 
     return len(similarity_pairs)
\ No newline at end of file
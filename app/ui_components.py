@@ -125,10 +125,34 @@ def display_movie_results(movies):
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+def show_ratings_job_status():
+    """Muestra, sin bloquear, el estado del cálculo en segundo plano tras guardar valoraciones."""
+    job_id = st.session_state.get('ratings_job_id')
+    job_queue = getattr(st.session_state.get('db_manager'), 'job_queue', None)
+    if not job_id or job_queue is None:
+        return
+
+    job = job_queue.status(job_id)
+    if job is None:
+        return
+    if job['estado'] in ("pendiente", "en_curso"):
+        st.info("⏳ Calculando tus recomendaciones personalizadas en segundo plano...")
+        if st.button("Actualizar estado", key="refresh_job_status"):
+            st.rerun()
+    elif job['estado'] == "completado":
+        if job['resultado']:
+            st.success(f"¡Se encontraron {job['resultado']} usuarios con gustos similares!")
+        st.session_state.ratings_job_id = None
+    else:
+        st.warning(f"No se pudieron actualizar tus recomendaciones: {job['error']}")
+        st.session_state.ratings_job_id = None
+
+
 def show_sidebar(process_input_callback):
     """Muestra la barra lateral con opciones y ejemplos."""
     with st.sidebar:
         st.markdown(f"### 🎬 CineBot - {st.session_state.current_username}")
+        show_ratings_job_status()
         st.markdown("### ⚙️ Opciones")
 
         if st.button("🔄 Reiniciar Chat", key="reset_button"):
@@ -0,0 +1,213 @@
+"""
+Factorización de la matriz de valoraciones con mínimos cuadrados alternos (ALS) en NumPy.
+
+Aprende factores de usuario y de película tales que ``media + U[u] · V[p]`` aproxima la
+valoración del usuario ``u`` a la película ``p``. Cada media iteración resuelve, por bloques
+de filas, un sistema ``f×f`` por usuario (o por película) con la regularización ponderada
+por su número de valoraciones. El modelo se guarda como ``.npy`` en un directorio que lee
+``recomendador/FactorModel.py`` para servir el criterio ``modelo``:
+
+    python als_model.py --valoraciones "valoraciones_chunks/*.csv" --salida modelo_als --factores 32
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+
+from columnar_ratings import ValoracionesColumnares, leer_shards_valoraciones
+
+META = "modelo.json"
+# Valoraciones por bloque al acumular las matrices f×f de cada fila (memoria ~ bloque·f²·8 bytes)
+VALORACIONES_POR_BLOQUE = 8192
+
+
+def _resolver_factores(matriz, fijos, regularizacion, valoraciones_por_bloque=VALORACIONES_POR_BLOQUE):
+    """
+    Resuelve los factores de cada fila de ``matriz`` (CSR de valoraciones centradas) con ``fijos`` constantes.
+
+    Para la fila ``i`` con valoraciones ``r`` sobre las columnas ``J``:
+    ``x_i = (Y_J^T Y_J + λ·|J|·I)^-1 Y_J^T r``. Las filas sin valoraciones quedan a cero.
+    """
+    num_filas, f = matriz.shape[0], fijos.shape[1]
+    resultado = np.zeros((num_filas, f))
+    identidad = np.eye(f)
+    indptr = matriz.indptr
+    inicio = 0
+    while inicio < num_filas:
+        fin = int(np.searchsorted(indptr, indptr[inicio] + valoraciones_por_bloque, side="right")) - 1
+        fin = min(max(fin, inicio + 1), num_filas)
+        a, b = indptr[inicio], indptr[fin]
+        conteos = np.diff(indptr[inicio:fin + 1])
+        con_datos = conteos > 0
+        if a == b:
+            inicio = fin
+            continue
+
+        y = fijos[matriz.indices[a:b]]
+        r = matriz.data[a:b]
+        desplazamientos = (indptr[inicio:fin] - a)[con_datos]
+        gram = np.add.reduceat(y[:, :, None] * y[:, None, :], desplazamientos, axis=0)
+        gram += regularizacion * conteos[con_datos][:, None, None] * identidad
+        termino = np.add.reduceat(y * r[:, None], desplazamientos, axis=0)
+        resultado[inicio:fin][con_datos] = np.linalg.solve(gram, termino[..., None])[..., 0]
+        inicio = fin
+    return resultado
+
+
+def _rmse(usuarios, peliculas, ratings, factores_usuarios, factores_peliculas, media, minimo, maximo):
+    if len(ratings) == 0:
+        return float("nan")
+    prediccion = media + np.einsum("ij,ij->i", factores_usuarios[usuarios], factores_peliculas[peliculas])
+    np.clip(prediccion, minimo, maximo, out=prediccion)
+    return float(np.sqrt(np.mean((prediccion - ratings) ** 2)))
+
+
+def entrenar_als(valoraciones, factores=32, regularizacion=0.05, iteraciones=10, fraccion_test=0.1, semilla=0):
+    """
+    Entrena el modelo ALS y evalúa el RMSE sobre una fracción de valoraciones apartadas.
+
+    Args:
+        valoraciones: ValoracionesColumnares (o lista de tuplas (user_id, movie_id, rating))
+        factores: Dimensión de los factores latentes
+        regularizacion: λ de la regularización ponderada por número de valoraciones
+        fraccion_test: Valoraciones apartadas para el RMSE de validación (0 para entrenar con todas)
+
+    Returns:
+        dict: factores_usuarios, factores_peliculas, user_ids, movie_ids, la matriz de
+              entrenamiento y las métricas (media, rmse_entrenamiento, rmse_test, segundos)
+    """
+    if not isinstance(valoraciones, ValoracionesColumnares):
+        valoraciones = ValoracionesColumnares.desde_tuplas(valoraciones)
+    inicio = time.time()
+    completa = valoraciones.a_matriz_csr()
+    matriz = completa.tocoo()
+    rng = np.random.default_rng(semilla)
+    test = rng.random(matriz.nnz) < fraccion_test
+    forma = matriz.shape
+
+    entrenamiento = sparse.csr_matrix((matriz.data[~test], (matriz.row[~test], matriz.col[~test])), shape=forma)
+    media = float(entrenamiento.data.mean()) if entrenamiento.nnz else 0.0
+    minimo, maximo = float(matriz.data.min(initial=0.0)), float(matriz.data.max(initial=0.0))
+
+    centrada = entrenamiento.copy()
+    centrada.data = centrada.data - media
+    centrada_t = centrada.T.tocsr()
+
+    factores_peliculas = rng.normal(scale=0.1, size=(forma[1], factores))
+    factores_usuarios = np.zeros((forma[0], factores))
+    for iteracion in range(iteraciones):
+        factores_usuarios = _resolver_factores(centrada, factores_peliculas, regularizacion)
+        factores_peliculas = _resolver_factores(centrada_t, factores_usuarios, regularizacion)
+        coo = entrenamiento.tocoo()
+        rmse = _rmse(coo.row, coo.col, coo.data, factores_usuarios, factores_peliculas, media, minimo, maximo)
+        print(f"Iteración ALS {iteracion + 1}/{iteraciones}: RMSE de entrenamiento {rmse:.4f}")
+
+    segundos = time.time() - inicio
+    coo = entrenamiento.tocoo()
+    metricas = {
+        'media': media,
+        'minimo': minimo,
+        'maximo': maximo,
+        'factores': factores,
+        'regularizacion': regularizacion,
+        'iteraciones': iteraciones,
+        'valoraciones_entrenamiento': int(entrenamiento.nnz),
+        'valoraciones_test': int(test.sum()),
+        'rmse_entrenamiento': _rmse(coo.row, coo.col, coo.data, factores_usuarios, factores_peliculas, media,
+                                    minimo, maximo),
+        'rmse_test': _rmse(matriz.row[test], matriz.col[test], matriz.data[test], factores_usuarios,
+                           factores_peliculas, media, minimo, maximo),
+        'segundos_entrenamiento': segundos,
+    }
+    print(f"ALS entrenado en {segundos:.2f} segundos: RMSE entrenamiento {metricas['rmse_entrenamiento']:.4f}, "
+          f"RMSE test {metricas['rmse_test']:.4f} ({metricas['valoraciones_test']} valoraciones apartadas)")
+    return {
+        'factores_usuarios': factores_usuarios.astype(np.float32),
+        'factores_peliculas': factores_peliculas.astype(np.float32),
+        'user_ids': valoraciones.user_ids,
+        'movie_ids': valoraciones.movie_ids,
+        'matriz': completa,
+        'metricas': metricas,
+    }
+
+
+def recomendar(factores_usuario, factores_peliculas, valoradas, limite=10):
+    """
+    Top-``limite`` películas para un vector de usuario: un producto matriz-vector y argpartition.
+
+    Returns:
+        tuple: (índices de película, puntuación sin la media) ordenados de mayor a menor
+    """
+    puntuaciones = factores_peliculas @ factores_usuario
+    puntuaciones[valoradas] = -np.inf
+    limite = min(limite, len(puntuaciones) - len(valoradas))
+    if limite <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    candidatos = np.argpartition(-puntuaciones, limite - 1)[:limite]
+    orden = candidatos[np.argsort(-puntuaciones[candidatos])]
+    return orden, puntuaciones[orden]
+
+
+def medir_latencia(modelo, limite=20, muestra=1000, semilla=0):
+    """Latencia de ``recomendar`` sobre una muestra de usuarios (percentiles en milisegundos)."""
+    matriz = modelo['matriz']
+    rng = np.random.default_rng(semilla)
+    usuarios = rng.choice(matriz.shape[0], size=min(muestra, matriz.shape[0]), replace=False)
+    tiempos = []
+    for usuario in usuarios:
+        inicio = time.perf_counter()
+        recomendar(modelo['factores_usuarios'][usuario], modelo['factores_peliculas'],
+                   matriz.indices[matriz.indptr[usuario]:matriz.indptr[usuario + 1]], limite)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    latencia = {'p50_ms': float(np.percentile(tiempos, 50)), 'p99_ms': float(np.percentile(tiempos, 99)),
+                'usuarios_muestra': len(usuarios)} if tiempos else {}
+    if latencia:
+        print(f"Latencia de servicio (top-{limite}): p50 {latencia['p50_ms']:.3f} ms, p99 {latencia['p99_ms']:.3f} ms")
+    return latencia
+
+
+def guardar_modelo(modelo, directorio):
+    """
+    Guarda factores, ids, valoraciones de entrenamiento (para excluir lo ya visto) y la
+    media y número de valoraciones de cada película en ``directorio``.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    matriz = modelo['matriz']
+    conteos = np.diff(matriz.tocsc().indptr)
+    sumas = np.asarray(matriz.sum(axis=0)).ravel()
+    promedios = np.divide(sumas, conteos, out=np.zeros(len(sumas)), where=conteos > 0)
+
+    np.save(os.path.join(directorio, "factores_usuarios.npy"), modelo['factores_usuarios'])
+    np.save(os.path.join(directorio, "factores_peliculas.npy"), modelo['factores_peliculas'])
+    np.save(os.path.join(directorio, "usuarios.npy"), modelo['user_ids'])
+    np.save(os.path.join(directorio, "peliculas.npy"), modelo['movie_ids'])
+    np.save(os.path.join(directorio, "valoradas_indptr.npy"), matriz.indptr.astype(np.int64))
+    np.save(os.path.join(directorio, "valoradas_indices.npy"), matriz.indices.astype(np.int32))
+    np.save(os.path.join(directorio, "promedios.npy"), promedios.astype(np.float32))
+    np.save(os.path.join(directorio, "num_valoraciones.npy"), conteos.astype(np.int32))
+    with open(os.path.join(directorio, META), "w") as f:
+        json.dump(dict(modelo['metricas'], fecha=time.strftime('%Y-%m-%dT%H:%M:%S')), f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena el modelo ALS de valoraciones")
+    parser.add_argument("--valoraciones", required=True, help="Patrón glob de los CSV de valoraciones")
+    parser.add_argument("--salida", default="modelo_als")
+    parser.add_argument("--factores", type=int, default=32)
+    parser.add_argument("--regularizacion", type=float, default=0.05)
+    parser.add_argument("--iteraciones", type=int, default=10)
+    parser.add_argument("--fraccion-test", type=float, default=0.1)
+    args = parser.parse_args()
+
+    valoraciones = leer_shards_valoraciones(sorted(glob.glob(args.valoraciones)))
+    modelo = entrenar_als(valoraciones, args.factores, args.regularizacion, args.iteraciones, args.fraccion_test)
+    modelo['metricas']['latencia'] = medir_latencia(modelo)
+    guardar_modelo(modelo, args.salida)
+
+
+if __name__ == "__main__":
+    main()
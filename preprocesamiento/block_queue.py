@@ -0,0 +1,440 @@
+"""
+Cola de trabajo por bloques para repartir el cálculo de similitudes entre varias máquinas.
+
+El coordinador vuelca las valoraciones a una matriz CSR en un directorio compartido, publica
+los tiles usuario×usuario como unidades de trabajo en una cola SQLite y, cuando todos están
+hechos, fusiona los resultados. Los workers (en cualquier máquina que vea el directorio)
+reclaman tiles, envían latidos mientras calculan y escriben un shard por tile; un tile cuyo
+worker deja de enviar latidos vuelve a la cola.
+
+Prueba local con varios procesos:
+
+    python block_queue.py coordinador --trabajo /tmp/similitudes_cola --csv "valoraciones_part_*.csv" --workers 4
+
+En otra máquina con el mismo directorio montado:
+
+    python block_queue.py worker --trabajo /mnt/compartido/similitudes_cola
+
+SQLite depende de los bloqueos de fichero del sistema compartido; en NFS hay que usar una
+versión con bloqueos fiables (NFSv4) o un montaje local para la base de la cola.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from out_of_core import CSREnDisco, calcular_tile, planificar_tiles, volcar_csr_en_disco
+from run_manifest import hash_entradas
+from similarity_shards import EscritorShards, dtype_shard
+from top_k_neighbors import TopKNeighbors
+
+ARCHIVO_COLA = "cola.sqlite"
+DIRECTORIO_CSR = "csr"
+DIRECTORIO_RESULTADOS = "resultados"
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS bloques (
+    id TEXT PRIMARY KEY,
+    inicio_a INTEGER NOT NULL,
+    fin_a INTEGER NOT NULL,
+    inicio_b INTEGER NOT NULL,
+    fin_b INTEGER NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    worker TEXT,
+    latido REAL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    archivo TEXT,
+    filas INTEGER
+);
+CREATE INDEX IF NOT EXISTS bloques_estado ON bloques (estado);
+CREATE TABLE IF NOT EXISTS configuracion (
+    clave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+"""
+
+
+class ColaBloques:
+    """
+    Cola de tiles respaldada por SQLite.
+
+    Cada operación abre su propia conexión, de modo que la cola se puede usar desde varios
+    hilos y procesos. Reclamar un bloque se hace en una transacción ``IMMEDIATE`` que antes
+    devuelve a la cola los bloques cuyo último latido es más antiguo que ``timeout_latido``.
+    """
+
+    def __init__(self, ruta, timeout_latido=120):
+        self.ruta = ruta
+        self.timeout_latido = timeout_latido
+        conexion = sqlite3.connect(ruta, timeout=60)
+        try:
+            conexion.executescript(ESQUEMA)
+        finally:
+            conexion.close()
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta, timeout=60, isolation_level=None)
+        conexion.execute("PRAGMA busy_timeout = 60000")
+        return _Transaccion(conexion)
+
+    def guardar_configuracion(self, configuracion):
+        with self._conectar() as conexion:
+            conexion.executemany("INSERT OR REPLACE INTO configuracion (clave, valor) VALUES (?, ?)",
+                                 [(clave, json.dumps(valor)) for clave, valor in configuracion.items()])
+
+    def configuracion(self):
+        with self._conectar() as conexion:
+            return {clave: json.loads(valor) for clave, valor in conexion.execute(
+                "SELECT clave, valor FROM configuracion")}
+
+    def publicar(self, bloques):
+        """Publica bloques (id, inicio_a, fin_a, inicio_b, fin_b); los ya publicados se conservan."""
+        with self._conectar() as conexion:
+            conexion.executemany(
+                "INSERT OR IGNORE INTO bloques (id, inicio_a, fin_a, inicio_b, fin_b) VALUES (?, ?, ?, ?, ?)",
+                bloques
+            )
+
+    def reclamar(self, worker):
+        """
+        Asigna al worker el siguiente bloque pendiente.
+
+        Returns:
+            tuple: (id, inicio_a, fin_a, inicio_b, fin_b), o None si no queda ninguno pendiente
+        """
+        ahora = time.time()
+        with self._conectar() as conexion:
+            abandonados = conexion.execute(
+                "UPDATE bloques SET estado = 'pendiente', worker = NULL "
+                "WHERE estado = 'en_curso' AND latido < ?", (ahora - self.timeout_latido,)
+            ).rowcount
+            if abandonados:
+                print(f"{abandonados} bloques abandonados devueltos a la cola")
+            bloque = conexion.execute(
+                "SELECT id, inicio_a, fin_a, inicio_b, fin_b FROM bloques WHERE estado = 'pendiente' "
+                "ORDER BY inicio_a, inicio_b LIMIT 1"
+            ).fetchone()
+            if bloque is None:
+                return None
+            conexion.execute(
+                "UPDATE bloques SET estado = 'en_curso', worker = ?, latido = ?, intentos = intentos + 1 "
+                "WHERE id = ?", (worker, ahora, bloque[0])
+            )
+            return bloque
+
+    def latido(self, bloque_id, worker):
+        """Renueva el latido de un bloque; devuelve False si el worker ya no lo tiene asignado."""
+        with self._conectar() as conexion:
+            return conexion.execute(
+                "UPDATE bloques SET latido = ? WHERE id = ? AND worker = ? AND estado = 'en_curso'",
+                (time.time(), bloque_id, worker)
+            ).rowcount == 1
+
+    def completar(self, bloque_id, worker, archivo, filas):
+        with self._conectar() as conexion:
+            return conexion.execute(
+                "UPDATE bloques SET estado = 'hecho', archivo = ?, filas = ?, latido = ? "
+                "WHERE id = ? AND worker = ? AND estado = 'en_curso'",
+                (archivo, filas, time.time(), bloque_id, worker)
+            ).rowcount == 1
+
+    def resumen(self):
+        """Número de bloques por estado."""
+        with self._conectar() as conexion:
+            conteos = dict(conexion.execute("SELECT estado, COUNT(*) FROM bloques GROUP BY estado"))
+        return {estado: conteos.get(estado, 0) for estado in ('pendiente', 'en_curso', 'hecho')}
+
+    def resultados(self):
+        """Archivos de resultado de los bloques hechos, en el orden de los bloques."""
+        with self._conectar() as conexion:
+            return [fila[0] for fila in conexion.execute(
+                "SELECT archivo FROM bloques WHERE estado = 'hecho' ORDER BY inicio_a, inicio_b")]
+
+
+class _Transaccion:
+    """Conexión en modo autocommit con ``BEGIN IMMEDIATE``/``COMMIT`` alrededor del bloque ``with``."""
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def __enter__(self):
+        self.conexion.execute("BEGIN IMMEDIATE")
+        return self.conexion
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conexion.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conexion.close()
+
+
+class _Latido(threading.Thread):
+    """Hilo que renueva el latido del bloque en curso hasta que se detiene."""
+
+    def __init__(self, cola, bloque_id, worker, intervalo):
+        super().__init__(daemon=True)
+        self.cola = cola
+        self.bloque_id = bloque_id
+        self.worker = worker
+        self.intervalo = intervalo
+        self.perdido = False
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            if not self.cola.latido(self.bloque_id, self.worker):
+                self.perdido = True
+                return
+
+    def detener(self):
+        self._parar.set()
+        self.join()
+
+
+def _guardar_shard_atomico(ruta, registros):
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as f:
+        np.save(f, registros)
+    os.replace(temporal, ruta)
+
+
+def _registros_tile(filas, columnas, pearson, top_k=None, score_minimo=None):
+    """
+    Convierte el resultado de un tile en registros de shard.
+
+    Con top-K solo se conservan los pares que están entre los K mejores de alguno de sus dos
+    usuarios dentro del tile: cualquier vecino del top-K global de un usuario lo es también
+    en el tile en que se calculó, así que la fusión posterior es exacta.
+    """
+    if top_k:
+        vecinos = TopKNeighbors(top_k, score_minimo)
+        vecinos.agregar_similitudes(zip(filas.tolist(), columnas.tolist(), pearson.tolist()))
+        pares = {}
+        for usuario, vecino, score in vecinos.aristas():
+            pares[(min(usuario, vecino), max(usuario, vecino))] = score
+        filas = np.fromiter((par[0] for par in pares), dtype=np.int32, count=len(pares))
+        columnas = np.fromiter((par[1] for par in pares), dtype=np.int32, count=len(pares))
+        pearson = np.fromiter(pares.values(), dtype=np.float64, count=len(pares))
+
+    registros = np.empty(len(filas), dtype=dtype_shard("float32"))
+    registros['usuario1'] = filas
+    registros['usuario2'] = columnas
+    registros['similitud'] = pearson
+    return registros
+
+
+def ejecutar_worker(directorio_trabajo, worker=None, intervalo_latido=30, num_hilos=None):
+    """
+    Reclama y calcula bloques hasta que la cola no tenga pendientes.
+
+    Returns:
+        int: número de bloques completados por este worker
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    cola = ColaBloques(os.path.join(directorio_trabajo, ARCHIVO_COLA))
+    configuracion = cola.configuracion()
+    csr = CSREnDisco(os.path.join(directorio_trabajo, DIRECTORIO_CSR))
+    directorio_resultados = os.path.join(directorio_trabajo, DIRECTORIO_RESULTADOS)
+    os.makedirs(directorio_resultados, exist_ok=True)
+
+    completados = 0
+    while True:
+        bloque = cola.reclamar(worker)
+        if bloque is None:
+            break
+        bloque_id, inicio_a, fin_a, inicio_b, fin_b = bloque
+        latido = _Latido(cola, bloque_id, worker, intervalo_latido)
+        latido.start()
+        try:
+            inicio = time.time()
+            bloque_a = csr.bloque(inicio_a, fin_a)
+            bloque_b = None if inicio_a == inicio_b else csr.bloque(inicio_b, fin_b)
+            filas, columnas, pearson = calcular_tile(bloque_a, bloque_b, inicio_a, inicio_b,
+                                                     configuracion['min_peliculas'], num_hilos)
+            registros = _registros_tile(filas, columnas, pearson, configuracion['top_k'],
+                                        configuracion['score_minimo'])
+            archivo = os.path.join(directorio_resultados, f"bloque_{bloque_id}.npy")
+            _guardar_shard_atomico(archivo, registros)
+        finally:
+            latido.detener()
+
+        if latido.perdido or not cola.completar(bloque_id, worker, os.path.basename(archivo), len(registros)):
+            print(f"[{worker}] El bloque {bloque_id} fue reasignado; se descarta su resultado")
+            continue
+        completados += 1
+        print(f"[{worker}] Bloque {bloque_id}: {len(registros)} similitudes en {time.time() - inicio:.2f} segundos")
+
+    print(f"[{worker}] Sin bloques pendientes ({completados} completados)")
+    return completados
+
+
+def reiniciar_trabajo(directorio_trabajo):
+    """Borra la cola, la matriz CSR y los resultados de un directorio de trabajo."""
+    for nombre in (ARCHIVO_COLA, ARCHIVO_COLA + "-journal"):
+        if os.path.exists(os.path.join(directorio_trabajo, nombre)):
+            os.remove(os.path.join(directorio_trabajo, nombre))
+    for nombre in (DIRECTORIO_CSR, DIRECTORIO_RESULTADOS):
+        shutil.rmtree(os.path.join(directorio_trabajo, nombre), ignore_errors=True)
+
+
+def publicar_trabajo(directorio_trabajo, archivos, min_peliculas=3, presupuesto_mb=1024, top_k=None,
+                     score_minimo=None, presupuesto_bytes=None):
+    """
+    Vuelca la matriz CSR al directorio compartido y publica los tiles como bloques.
+
+    ``presupuesto_bytes``, si se indica, sustituye a ``presupuesto_mb`` como memoria de un tile
+    (permite tiles de menos de 1 MB, p. ej. para probar la fusión de varios tiles).
+
+    La cola guarda una huella de las valoraciones y de los parámetros. Con la misma huella,
+    volver a publicar sobre una cola existente no duplica trabajo; si no coincide, la cola,
+    la CSR y los resultados anteriores se descartan y se empieza de cero.
+
+    Returns:
+        ColaBloques: la cola publicada
+    """
+    os.makedirs(directorio_trabajo, exist_ok=True)
+    presupuesto_bytes = presupuesto_bytes or presupuesto_mb * 1024 ** 2
+    parametros = {'min_peliculas': min_peliculas, 'top_k': top_k, 'score_minimo': score_minimo,
+                  'presupuesto_bytes': presupuesto_bytes}
+    huella = hash_entradas(archivos, parametros)
+    ruta_cola = os.path.join(directorio_trabajo, ARCHIVO_COLA)
+    if os.path.exists(ruta_cola) and ColaBloques(ruta_cola).configuracion().get('huella') != huella:
+        print("Las valoraciones o los parámetros han cambiado: se descarta la cola anterior.")
+        reiniciar_trabajo(directorio_trabajo)
+
+    directorio_csr = os.path.join(directorio_trabajo, DIRECTORIO_CSR)
+    if not os.path.exists(os.path.join(directorio_csr, "csr.json")):
+        print("Volcando las valoraciones a una matriz CSR en el directorio compartido...")
+        volcar_csr_en_disco(archivos, directorio_csr)
+    csr = CSREnDisco(directorio_csr)
+
+    cola = ColaBloques(ruta_cola)
+    cola.guardar_configuracion(dict(parametros, huella=huella))
+    bloques, tiles = planificar_tiles(np.asarray(csr.indptr), presupuesto_bytes)
+    # El id lleva los límites de las filas para que dos planificaciones distintas nunca compartan bloque
+    cola.publicar([(f"{bloques[i][0]}-{bloques[i][1]}-{bloques[j][0]}-{bloques[j][1]}", *bloques[i], *bloques[j])
+                   for i, j in tiles])
+    print(f"Publicados {len(tiles)} bloques de {csr.shape[0]} usuarios en {cola.ruta}")
+    return cola
+
+
+def esperar_bloques(cola, intervalo=10, procesos=None):
+    """Espera a que todos los bloques estén hechos, mostrando el progreso."""
+    while True:
+        resumen = cola.resumen()
+        total = sum(resumen.values())
+        print(f"Bloques: {resumen['hecho']}/{total} hechos, {resumen['en_curso']} en curso, "
+              f"{resumen['pendiente']} pendientes")
+        if resumen['hecho'] == total:
+            return
+        if resumen['pendiente'] and procesos and not any(proceso.is_alive() for proceso in procesos):
+            # Sin workers locales vivos: el coordinador calcula los bloques que quedan pendientes
+            ejecutar_worker(os.path.dirname(cola.ruta))
+            continue
+        time.sleep(intervalo)
+
+
+def fusionar_resultados(directorio_trabajo, directorio_salida, dtype_score="float32", batch_size=100000):
+    """
+    Fusiona los shards de los bloques en el formato de ``similarity_shards``.
+
+    Sin top-K los shards de los bloques (float32) se copian tal cual, o se reescriben si
+    ``dtype_score`` es otro; con top-K se combinan los vecinos de todos los bloques y se
+    escriben las aristas dirigidas usuario -> vecino.
+
+    Returns:
+        list: rutas de los shards de salida
+    """
+    cola = ColaBloques(os.path.join(directorio_trabajo, ARCHIVO_COLA))
+    configuracion = cola.configuracion()
+    csr = CSREnDisco(os.path.join(directorio_trabajo, DIRECTORIO_CSR))
+    escritor = EscritorShards(directorio_salida, csr.user_ids, dtype_score)
+    directorio_resultados = os.path.join(directorio_trabajo, DIRECTORIO_RESULTADOS)
+
+    if not configuracion['top_k']:
+        archivos = []
+        for shard_id, archivo in enumerate(cola.resultados(), start=1):
+            origen = os.path.join(directorio_resultados, archivo)
+            if escritor.dtype == dtype_shard("float32"):
+                archivos.append(escritor.registrar_shard(origen, shard_id))
+            else:
+                registros = np.load(origen)
+                archivos.append(escritor.escribir_indices(registros['usuario1'], registros['usuario2'],
+                                                          registros['similitud'], shard_id))
+        return archivos
+
+    vecinos = TopKNeighbors(configuracion['top_k'], configuracion['score_minimo'])
+    for archivo in cola.resultados():
+        registros = np.load(os.path.join(directorio_resultados, archivo))
+        vecinos.agregar_similitudes(zip(registros['usuario1'].tolist(), registros['usuario2'].tolist(),
+                                        registros['similitud'].astype(np.float64).tolist()))
+
+    archivos = []
+    filas, columnas, scores = [], [], []
+    for usuario, vecino, score in vecinos.aristas():
+        filas.append(usuario)
+        columnas.append(vecino)
+        scores.append(score)
+        if len(filas) >= batch_size:
+            archivos.append(escritor.escribir_indices(filas, columnas, scores, len(archivos) + 1))
+            filas, columnas, scores = [], [], []
+    if filas:
+        archivos.append(escritor.escribir_indices(filas, columnas, scores, len(archivos) + 1))
+    print(f"Top-{vecinos.k} vecinos fusionados: {vecinos.num_aristas()} aristas para {len(vecinos)} usuarios")
+    return archivos
+
+
+def coordinar(directorio_trabajo, archivos, directorio_salida, min_peliculas=3, presupuesto_mb=1024, top_k=None,
+              score_minimo=None, workers_locales=0, dtype_score="float32", presupuesto_bytes=None):
+    """Publica el trabajo, lanza ``workers_locales`` procesos, espera y fusiona los resultados."""
+    cola = publicar_trabajo(directorio_trabajo, archivos, min_peliculas, presupuesto_mb, top_k, score_minimo,
+                            presupuesto_bytes)
+    procesos = [multiprocessing.Process(target=ejecutar_worker, args=(directorio_trabajo, f"local-{i}"))
+                for i in range(workers_locales)]
+    for proceso in procesos:
+        proceso.start()
+    try:
+        esperar_bloques(cola, procesos=procesos)
+    finally:
+        for proceso in procesos:
+            proceso.join()
+    return fusionar_resultados(directorio_trabajo, directorio_salida, dtype_score)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cola de bloques para el cálculo distribuido de similitudes")
+    subparsers = parser.add_subparsers(dest="rol", required=True)
+
+    coordinador = subparsers.add_parser("coordinador")
+    coordinador.add_argument("--trabajo", required=True)
+    coordinador.add_argument("--csv", required=True, help="Patrón de los CSV de valoraciones")
+    coordinador.add_argument("--salida", default="similitudes_npy")
+    coordinador.add_argument("--presupuesto-mb", type=int, default=1024)
+    coordinador.add_argument("--presupuesto-bytes", type=int, default=None, help="Sustituye a --presupuesto-mb")
+    coordinador.add_argument("--min-peliculas", type=int, default=3)
+    coordinador.add_argument("--top-k", type=int, default=None)
+    coordinador.add_argument("--score-minimo", type=float, default=None)
+    coordinador.add_argument("--workers", type=int, default=0, help="Procesos worker locales")
+
+    worker = subparsers.add_parser("worker")
+    worker.add_argument("--trabajo", required=True)
+    worker.add_argument("--latido", type=float, default=30)
+    args = parser.parse_args()
+
+    if args.rol == "worker":
+        ejecutar_worker(args.trabajo, intervalo_latido=args.latido)
+    else:
+        coordinar(args.trabajo, sorted(glob.glob(args.csv)), args.salida, args.min_peliculas, args.presupuesto_mb,
+                  args.top_k, args.score_minimo, args.workers, presupuesto_bytes=args.presupuesto_bytes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+from scipy import sparse
+
+COLUMNA_USUARIO = "userId"
+COLUMNA_PELICULA = "id"
+COLUMNA_VALORACION = "rating"
+
+
+class ValoracionesColumnares:
+    """
+    Valoraciones en columnas tipadas con ids de usuario y película mapeados a índices densos.
+
+    Los índices de usuario siguen el orden de los ids, de modo que comparar índices equivale
+    a comparar ids. Iterar el objeto produce tuplas (user_id, movie_id, rating) para los
+    consumidores que aún trabajan fila a fila.
+    """
+
+    def __init__(self, user_idx, movie_idx, ratings, user_ids, movie_ids):
+        self.user_idx = np.asarray(user_idx, dtype=np.int32)
+        self.movie_idx = np.asarray(movie_idx, dtype=np.int32)
+        self.ratings = np.asarray(ratings, dtype=np.float32)
+        self.user_ids = np.asarray(user_ids)
+        self.movie_ids = np.asarray(movie_ids)
+
+    @classmethod
+    def desde_columnas(cls, users, movies, ratings):
+        """Construye el objeto a partir de columnas con los ids originales."""
+        user_idx, user_ids = pd.factorize(np.asarray(users), sort=True)
+        movie_idx, movie_ids = pd.factorize(np.asarray(movies), sort=True)
+        return cls(user_idx, movie_idx, ratings, np.asarray(user_ids), np.asarray(movie_ids))
+
+    @classmethod
+    def desde_tuplas(cls, ratings_data):
+        """Construye el objeto a partir de una lista de tuplas (user_id, movie_id, rating)."""
+        if not ratings_data:
+            return cls([], [], [], [], [])
+        users, movies, ratings = zip(*ratings_data)
+        return cls.desde_columnas(users, movies, ratings)
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def __iter__(self):
+        return zip(self.user_ids[self.user_idx].tolist(),
+                   self.movie_ids[self.movie_idx].tolist(),
+                   self.ratings.tolist())
+
+    @property
+    def num_usuarios(self):
+        return len(self.user_ids)
+
+    @property
+    def num_peliculas(self):
+        return len(self.movie_ids)
+
+    @property
+    def nbytes(self):
+        return self.user_idx.nbytes + self.movie_idx.nbytes + self.ratings.nbytes
+
+    def a_matriz_csr(self):
+        """
+        Devuelve la matriz CSR float64 usuario×película.
+
+        Si un usuario valora varias veces la misma película se conserva la última valoración.
+        """
+        claves = self.user_idx.astype(np.int64) * self.num_peliculas + self.movie_idx
+        _, ultimas = np.unique(claves[::-1], return_index=True)
+        ultimas = len(claves) - 1 - ultimas
+
+        matriz = sparse.csr_matrix(
+            (self.ratings[ultimas].astype(np.float64), (self.user_idx[ultimas], self.movie_idx[ultimas])),
+            shape=(self.num_usuarios, self.num_peliculas)
+        )
+        matriz.sort_indices()
+        return matriz
+
+
+def _dataset_valoraciones(archivos):
+    formato = ds.CsvFileFormat(convert_options=pa_csv.ConvertOptions(
+        column_types={COLUMNA_VALORACION: pa.float32()}
+    ))
+    return ds.dataset(list(archivos), format=formato)
+
+
+def leer_shards_valoraciones(archivos):
+    """
+    Lee los CSV de valoraciones con el parser multihilo de pyarrow.
+
+    Returns:
+        ValoracionesColumnares: valoraciones de todos los archivos, en el orden dado
+    """
+    if not archivos:
+        return ValoracionesColumnares([], [], [], [], [])
+
+    tabla = _dataset_valoraciones(archivos).to_table(
+        columns=[COLUMNA_USUARIO, COLUMNA_PELICULA, COLUMNA_VALORACION]
+    )
+
+    return ValoracionesColumnares.desde_columnas(
+        tabla.column(COLUMNA_USUARIO).to_numpy(),
+        tabla.column(COLUMNA_PELICULA).to_numpy(),
+        tabla.column(COLUMNA_VALORACION).to_numpy()
+    )
+
+
+def iterar_lotes_valoraciones(archivos, batch_size=1000000):
+    """
+    Recorre los CSV de valoraciones por lotes sin cargarlos enteros en memoria.
+
+    Yields:
+        tuple: (ids de usuario, ids de película, valoraciones float32) como arrays NumPy
+    """
+    if not archivos:
+        return
+    for lote in _dataset_valoraciones(archivos).to_batches(
+            columns=[COLUMNA_USUARIO, COLUMNA_PELICULA, COLUMNA_VALORACION], batch_size=batch_size):
+        yield (lote.column(0).to_numpy(zero_copy_only=False),
+               lote.column(1).to_numpy(zero_copy_only=False),
+               lote.column(2).to_numpy(zero_copy_only=False))
@@ -0,0 +1,394 @@
+"""
+Construcción del grafo completo en Neo4j a partir del catálogo y de los CSV de valoraciones.
+
+Crea los nodos ``Pelicula``, ``Genero``, ``Director`` y ``Usuario`` y las relaciones
+``PERTENECE_A``, ``DIRIGE`` y ``VALORA`` desde ``MRP.peliculas.json`` (exportación de la
+colección de MongoDB) y los ``valoraciones_part_*.csv``. Hay dos caminos:
+
+- Carga directa: crea primero las restricciones de unicidad y después carga cada etapa con
+  consultas ``UNWIND`` por lotes repartidas entre varios escritores (``ImportadorParalelo``).
+- CSV para ``neo4j-admin database import full``, la opción más rápida para una base vacía;
+  las restricciones se crean después con ``--solo-restricciones``.
+
+En ambos casos las valoraciones se leen a través de la matriz CSR en disco de
+``out_of_core``, así que no se cargan enteras en memoria y las repetidas se quedan con la
+última.
+
+    python graph_loader.py --catalogo MRP.peliculas.json --valoraciones "valoraciones_chunks/*.csv" --modo create
+    python graph_loader.py --catalogo MRP.peliculas.json --valoraciones "valoraciones_chunks/*.csv" --admin import
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from neo4j import GraphDatabase
+
+from neo4j_importer import ImportadorParalelo, asegurar_restriccion_usuario
+from out_of_core import CSREnDisco, volcar_csr_en_disco
+
+# Nombre de cada campo del catálogo en los documentos de MongoDB, por orden de preferencia
+CAMPOS_CATALOGO = {
+    'id': ("id",),
+    'titulo': ("Title", "title"),
+    'año': ("Year", "year"),
+    'duracion': ("Duration", "duration"),
+    'generos': ("genres",),
+    'directores': ("directors",),
+}
+
+RESTRICCIONES = [
+    "CREATE CONSTRAINT pelicula_id IF NOT EXISTS FOR (p:Pelicula) REQUIRE p.id IS UNIQUE",
+    "CREATE CONSTRAINT genero_nombre IF NOT EXISTS FOR (g:Genero) REQUIRE g.nombre IS UNIQUE",
+    "CREATE CONSTRAINT director_nombre IF NOT EXISTS FOR (d:Director) REQUIRE d.nombre IS UNIQUE",
+    "CREATE INDEX pelicula_titulo IF NOT EXISTS FOR (p:Pelicula) ON (p.titulo)",
+]
+
+# La app guarda el catálogo en memoria (recomendador/MovieCatalog.py) y lo recarga cuando cambia
+# este sello o el número de nodos de cada etiqueta
+VERSION_CATALOGO = "MERGE (c:Catalogo {id: 1}) SET c.version = timestamp()"
+
+QUERIES = {
+    'merge': {
+        'Genero': "UNWIND $batch AS nombre MERGE (:Genero {nombre: nombre})",
+        'Director': "UNWIND $batch AS nombre MERGE (:Director {nombre: nombre})",
+        'Pelicula': """
+            UNWIND $batch AS fila
+            MERGE (p:Pelicula {id: fila.id})
+            SET p.titulo = fila.titulo, p.año = fila.año, p.duracion = fila.duracion
+            """,
+        'Usuario': "UNWIND $batch AS id MERGE (:Usuario {id: id})",
+        'PERTENECE_A': """
+            UNWIND $batch AS fila
+            MATCH (p:Pelicula {id: fila[0]})
+            MATCH (g:Genero {nombre: fila[1]})
+            MERGE (p)-[:PERTENECE_A]->(g)
+            """,
+        'DIRIGE': """
+            UNWIND $batch AS fila
+            MATCH (d:Director {nombre: fila[0]})
+            MATCH (p:Pelicula {id: fila[1]})
+            MERGE (d)-[:DIRIGE]->(p)
+            """,
+        'VALORA': """
+            UNWIND $batch AS fila
+            MATCH (u:Usuario {id: fila[0]})
+            MATCH (p:Pelicula {id: fila[1]})
+            MERGE (u)-[r:VALORA]->(p)
+            SET r.puntuacion = fila[2]
+            """,
+    },
+    'create': {
+        'Genero': "UNWIND $batch AS nombre CREATE (:Genero {nombre: nombre})",
+        'Director': "UNWIND $batch AS nombre CREATE (:Director {nombre: nombre})",
+        'Pelicula': """
+            UNWIND $batch AS fila
+            CREATE (:Pelicula {id: fila.id, titulo: fila.titulo, año: fila.año, duracion: fila.duracion})
+            """,
+        'Usuario': "UNWIND $batch AS id CREATE (:Usuario {id: id})",
+        'PERTENECE_A': """
+            UNWIND $batch AS fila
+            MATCH (p:Pelicula {id: fila[0]})
+            MATCH (g:Genero {nombre: fila[1]})
+            CREATE (p)-[:PERTENECE_A]->(g)
+            """,
+        'DIRIGE': """
+            UNWIND $batch AS fila
+            MATCH (d:Director {nombre: fila[0]})
+            MATCH (p:Pelicula {id: fila[1]})
+            CREATE (d)-[:DIRIGE]->(p)
+            """,
+        'VALORA': """
+            UNWIND $batch AS fila
+            MATCH (u:Usuario {id: fila[0]})
+            MATCH (p:Pelicula {id: fila[1]})
+            CREATE (u)-[:VALORA {puntuacion: fila[2]}]->(p)
+            """,
+    },
+}
+
+
+def _valor(documento, campo):
+    """Primer campo presente del documento, sin los envoltorios de tipo de MongoDB ({"$numberInt": ...})."""
+    for nombre in CAMPOS_CATALOGO[campo]:
+        valor = documento.get(nombre)
+        if isinstance(valor, dict) and len(valor) == 1:
+            tipo, valor = next(iter(valor.items()))
+            valor = float(valor) if tipo == "$numberDouble" else int(valor) if tipo.startswith("$number") else valor
+        if valor is not None:
+            return valor
+    return None
+
+
+def _lista(valor):
+    """Los géneros y directores pueden venir como lista o como texto con la lista (igual que en la app)."""
+    if valor is None:
+        return []
+    if isinstance(valor, str):
+        try:
+            valor = ast.literal_eval(valor)
+        except (ValueError, SyntaxError):
+            valor = valor.split(',')
+        if isinstance(valor, str):
+            valor = [valor]
+    return [str(v).strip() for v in valor if str(v).strip()]
+
+
+def leer_catalogo(ruta):
+    """
+    Lee la exportación de la colección ``peliculas`` (array JSON o un documento por línea).
+
+    Returns:
+        list: dicts con id, titulo, año, duracion, generos y directores
+    """
+    with open(ruta, encoding="utf-8") as f:
+        try:
+            documentos = json.load(f)
+        except json.JSONDecodeError:
+            f.seek(0)
+            documentos = [json.loads(linea) for linea in f if linea.strip()]
+
+    catalogo = {}
+    for documento in documentos:
+        id_pelicula = _valor(documento, 'id')
+        if id_pelicula is None:
+            continue
+        catalogo[id_pelicula] = {
+            'id': id_pelicula,
+            'titulo': _valor(documento, 'titulo'),
+            'año': _valor(documento, 'año'),
+            'duracion': _valor(documento, 'duracion'),
+            'generos': sorted(set(_lista(_valor(documento, 'generos')))),
+            'directores': sorted(set(_lista(_valor(documento, 'directores')))),
+        }
+    return list(catalogo.values())
+
+
+def _preparar_valoraciones(archivos, directorio_trabajo, catalogo):
+    """Vuelca las valoraciones a una CSR en disco y marca las películas que están en el catálogo."""
+    directorio_csr = os.path.join(directorio_trabajo, "csr")
+    print(f"Volcando {len(archivos)} archivos de valoraciones a {directorio_csr}...")
+    volcar_csr_en_disco(archivos, directorio_csr)
+    csr = CSREnDisco(directorio_csr)
+    peliculas = np.load(os.path.join(directorio_csr, "peliculas.npy"))
+    en_catalogo = np.isin(peliculas, np.array([p['id'] for p in catalogo]))
+    print(f"{csr.shape[0]} usuarios, {csr.meta['nnz']} valoraciones, "
+          f"{int((~en_catalogo).sum())} de {len(peliculas)} películas valoradas fuera del catálogo (se omiten)")
+    return csr, peliculas, en_catalogo
+
+
+def _ids_enteros(catalogo):
+    return all(isinstance(p['id'], (int, np.integer)) for p in catalogo)
+
+
+def iterar_valoraciones(csr, peliculas, en_catalogo, batch_size=100000):
+    """
+    Recorre las valoraciones de la CSR en disco por bloques de usuarios.
+
+    Yields:
+        list: filas [user_id, movie_id, puntuacion] de películas del catálogo
+    """
+    num_usuarios = csr.shape[0]
+    indptr = np.asarray(csr.indptr)
+    inicio = 0
+    while inicio < num_usuarios:
+        fin = int(np.searchsorted(indptr, indptr[inicio] + batch_size, side="right")) - 1
+        fin = min(max(fin, inicio + 1), num_usuarios)
+        bloque = csr.bloque(inicio, fin).tocoo()
+        seleccion = en_catalogo[bloque.col]
+        yield list(zip(csr.user_ids[bloque.row[seleccion] + inicio].tolist(),
+                       peliculas[bloque.col[seleccion]].tolist(),
+                       bloque.data[seleccion].tolist()))
+        inicio = fin
+
+
+def _relaciones_catalogo(catalogo):
+    generos = sorted({g for p in catalogo for g in p['generos']})
+    directores = sorted({d for p in catalogo for d in p['directores']})
+    pertenece_a = [[p['id'], g] for p in catalogo for g in p['generos']]
+    dirige = [[d, p['id']] for p in catalogo for d in p['directores']]
+    return generos, directores, pertenece_a, dirige
+
+
+class CargadorGrafo:
+    """Carga el grafo en Neo4j por etapas con consultas UNWIND por lotes y varios escritores."""
+
+    def __init__(self, driver, num_escritores=4, modo="merge", batch_size=100000):
+        """
+        Args:
+            driver: Driver de Neo4j
+            num_escritores: Hilos escritores de las etapas de nodos y de VALORA
+            modo: "merge" (idempotente) o "create" (base vacía, más rápido)
+            batch_size: Valoraciones leídas de disco por bloque
+        """
+        if modo not in QUERIES:
+            raise ValueError(f"Modo de carga desconocido: {modo}")
+        self.driver = driver
+        self.num_escritores = num_escritores
+        self.modo = modo
+        self.batch_size = batch_size
+
+    def crear_restricciones(self):
+        """Crea las restricciones de unicidad (y sus índices) antes de cargar nada."""
+        with self.driver.session() as session:
+            for restriccion in RESTRICCIONES:
+                session.run(restriccion).consume()
+            # La de Usuario.id la comparte neo4j_importer, que la usa como índice de búsqueda
+            asegurar_restriccion_usuario(session)
+            session.run("CALL db.awaitIndexes(300)").consume()
+
+    def _etapa(self, etapa, lotes, num_escritores=None):
+        importador = ImportadorParalelo(self.driver, QUERIES[self.modo][etapa], num_escritores or self.num_escritores)
+        importador.descripcion = etapa
+        return importador.importar(lotes)
+
+    def cargar(self, catalogo, archivos, directorio_trabajo):
+        """
+        Carga películas, géneros, directores, usuarios y valoraciones.
+
+        Las relaciones PERTENECE_A y DIRIGE se escriben con un solo escritor: apuntan a pocos
+        nodos muy conectados y en paralelo solo provocarían bloqueos y reintentos.
+
+        Returns:
+            dict: estadísticas del importador por etapa
+        """
+        self.crear_restricciones()
+        generos, directores, pertenece_a, dirige = _relaciones_catalogo(catalogo)
+        peliculas = [{k: p[k] for k in ('id', 'titulo', 'año', 'duracion')} for p in catalogo]
+        csr, ids_peliculas, en_catalogo = _preparar_valoraciones(archivos, directorio_trabajo, catalogo)
+
+        estadisticas = {}
+        estadisticas['Genero'] = self._etapa('Genero', [generos])
+        estadisticas['Director'] = self._etapa('Director', [directores])
+        estadisticas['Pelicula'] = self._etapa('Pelicula', [peliculas])
+        estadisticas['Usuario'] = self._etapa('Usuario', [csr.user_ids.tolist()])
+        estadisticas['PERTENECE_A'] = self._etapa('PERTENECE_A', [pertenece_a], num_escritores=1)
+        estadisticas['DIRIGE'] = self._etapa('DIRIGE', [dirige], num_escritores=1)
+        estadisticas['VALORA'] = self._etapa('VALORA', iterar_valoraciones(csr, ids_peliculas, en_catalogo,
+                                                                            self.batch_size))
+        self.marcar_version_catalogo()
+        return estadisticas
+
+    def marcar_version_catalogo(self):
+        """Actualiza el sello de versión del catálogo para que la app lo recargue."""
+        with self.driver.session() as session:
+            session.run(VERSION_CATALOGO).consume()
+
+
+def _columna_admin(nombre, valores):
+    """
+    Cabecera y columna de neo4j-admin con el tipo que tendría la propiedad cargada por Cypher:
+    ``long`` si todos los valores son enteros, ``double`` si son números y ``string`` si no.
+    """
+    presentes = [v for v in valores if v is not None]
+    if presentes and all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in presentes):
+        return f"{nombre}:long", pd.array(valores, dtype="Int64")
+    if presentes and all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in presentes):
+        return f"{nombre}:double", pd.array(valores, dtype="Float64")
+    return nombre, valores
+
+
+def escribir_csv_admin(catalogo, archivos, directorio, directorio_trabajo="carga_grafo", batch_size=100000):
+    """
+    Escribe los CSV de nodos y relaciones para ``neo4j-admin database import full``.
+
+    Los ids de los nodos usan los espacios de ids del importador (``:ID(Pelicula)``...) y se
+    guardan además como propiedad tipada ``id``; ``año`` y ``duracion`` llevan el mismo tipo
+    que les daría la carga por Cypher. La CSR temporal de valoraciones se escribe en
+    ``directorio_trabajo``.
+
+    Returns:
+        str: comando de neo4j-admin que importa los archivos generados
+    """
+    os.makedirs(directorio, exist_ok=True)
+
+    def ruta(nombre):
+        return os.path.join(directorio, nombre)
+
+    generos, directores, pertenece_a, dirige = _relaciones_catalogo(catalogo)
+    tipo_id = "long" if _ids_enteros(catalogo) else "string"
+    peliculas = pd.DataFrame({":ID(Pelicula)": [p['id'] for p in catalogo],
+                              f"id:{tipo_id}": [p['id'] for p in catalogo],
+                              "titulo": [p['titulo'] for p in catalogo]})
+    for campo in ('año', 'duracion'):
+        cabecera, columna = _columna_admin(campo, [p[campo] for p in catalogo])
+        peliculas[cabecera] = columna
+    peliculas.to_csv(ruta("peliculas.csv"), index=False)
+    pd.DataFrame({":ID(Genero)": generos, "nombre": generos}).to_csv(ruta("generos.csv"), index=False)
+    pd.DataFrame({":ID(Director)": directores, "nombre": directores}).to_csv(ruta("directores.csv"), index=False)
+    pd.DataFrame(pertenece_a, columns=[":START_ID(Pelicula)", ":END_ID(Genero)"]).to_csv(
+        ruta("pertenece_a.csv"), index=False)
+    pd.DataFrame(dirige, columns=[":START_ID(Director)", ":END_ID(Pelicula)"]).to_csv(ruta("dirige.csv"), index=False)
+
+    # La CSR temporal va al directorio de trabajo, no junto a los CSV que se van a importar
+    csr, ids_peliculas, en_catalogo = _preparar_valoraciones(archivos, directorio_trabajo, catalogo)
+    tipo_usuario = "long" if np.issubdtype(csr.user_ids.dtype, np.integer) else "string"
+    pd.DataFrame({":ID(Usuario)": csr.user_ids, f"id:{tipo_usuario}": csr.user_ids}).to_csv(
+        ruta("usuarios.csv"), index=False)
+
+    columnas = [":START_ID(Usuario)", ":END_ID(Pelicula)", "puntuacion:float"]
+    pd.DataFrame(columns=columnas).to_csv(ruta("valora.csv"), index=False)
+    total = 0
+    for filas in iterar_valoraciones(csr, ids_peliculas, en_catalogo, batch_size):
+        pd.DataFrame(filas, columns=columnas).to_csv(ruta("valora.csv"), mode="a", header=False, index=False)
+        total += len(filas)
+    print(f"CSV de neo4j-admin escritos en {directorio}: {len(catalogo)} películas, {len(generos)} géneros, "
+          f"{len(directores)} directores, {csr.shape[0]} usuarios, {total} valoraciones")
+
+    return (
+        "neo4j-admin database import full neo4j --overwrite-destination "
+        f"--nodes=Pelicula={ruta('peliculas.csv')} --nodes=Genero={ruta('generos.csv')} "
+        f"--nodes=Director={ruta('directores.csv')} --nodes=Usuario={ruta('usuarios.csv')} "
+        f"--relationships=PERTENECE_A={ruta('pertenece_a.csv')} --relationships=DIRIGE={ruta('dirige.csv')} "
+        f"--relationships=VALORA={ruta('valora.csv')}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye el grafo de películas y valoraciones en Neo4j")
+    parser.add_argument("--uri", default="neo4j://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="Virt1234*")
+    parser.add_argument("--catalogo", help="Exportación JSON de la colección MRP.peliculas")
+    parser.add_argument("--valoraciones", help="Patrón glob de los CSV de valoraciones")
+    parser.add_argument("--modo", choices=tuple(QUERIES), default="merge")
+    parser.add_argument("--escritores", type=int, default=4)
+    parser.add_argument("--directorio-trabajo", default="carga_grafo",
+                        help="Directorio para la CSR temporal de valoraciones")
+    parser.add_argument("--admin", metavar="DIRECTORIO",
+                        help="Escribe CSV para neo4j-admin en DIRECTORIO en lugar de cargar con UNWIND")
+    parser.add_argument("--solo-restricciones", action="store_true",
+                        help="Solo crea las restricciones e índices (tras un neo4j-admin import)")
+    args = parser.parse_args()
+
+    inicio = time.time()
+    if args.admin:
+        comando = escribir_csv_admin(leer_catalogo(args.catalogo), sorted(glob.glob(args.valoraciones)), args.admin,
+                                     args.directorio_trabajo)
+        print(f"Con la base de datos parada, importa con:\n{comando}\n"
+              f"y después crea las restricciones con: python graph_loader.py --solo-restricciones")
+        return
+
+    driver = GraphDatabase.driver(args.uri, auth=(args.user, args.password))
+    try:
+        cargador = CargadorGrafo(driver, args.escritores, args.modo)
+        if args.solo_restricciones:
+            cargador.crear_restricciones()
+            cargador.marcar_version_catalogo()
+            return
+        estadisticas = cargador.cargar(leer_catalogo(args.catalogo), sorted(glob.glob(args.valoraciones)),
+                                       args.directorio_trabajo)
+        print(f"Grafo cargado en {time.time() - inicio:.2f} segundos")
+        for etapa, valores in estadisticas.items():
+            print(f"- {etapa}: {valores['filas']} filas en {valores['segundos']:.2f} s "
+                  f"({valores['filas_por_segundo']:.0f} filas/s)")
+    finally:
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
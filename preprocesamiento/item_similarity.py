@@ -0,0 +1,108 @@
+"""
+Similitud película-película (coseno ajustado) precalculada a partir de la matriz de valoraciones.
+
+El coseno ajustado resta a cada valoración la media de su usuario y compara las columnas
+de dos películas sobre los usuarios que han valorado ambas. Solo se guardan los ``top_k``
+vecinos de cada película como aristas dirigidas ``(Pelicula)-[:SIMILAR_A {score}]->(Pelicula)``,
+de modo que el criterio ``pelicula_similar`` se resuelve con una búsqueda directa.
+"""
+import numpy as np
+
+from columnar_ratings import ValoracionesColumnares
+from neo4j_importer import ImportadorParalelo
+from sparse_similarity import TOLERANCIA_DENOMINADOR, _valores_en, preparar_matrices, trasponer_matrices
+from top_k_neighbors import TopKNeighbors
+
+QUERY_INDICE_PELICULA = "CREATE INDEX pelicula_id IF NOT EXISTS FOR (p:Pelicula) ON (p.id)"
+
+QUERY_BORRAR_SIMILAR_A = """
+MATCH (:Pelicula)-[s:SIMILAR_A]->(:Pelicula)
+CALL { WITH s DELETE s } IN TRANSACTIONS OF 10000 ROWS
+"""
+
+QUERY_SIMILAR_A = """
+UNWIND $batch AS par
+MATCH (p1:Pelicula {id: par[0]})
+MATCH (p2:Pelicula {id: par[1]})
+CREATE (p1)-[:SIMILAR_A {score: par[2]}]->(p2)
+"""
+
+
+def calcular_bloque_coseno_ajustado(centrada_t, binaria_t, cuadrados_t, inicio, fin, min_usuarios=5):
+    """
+    Coseno ajustado entre las películas ``[inicio, fin)`` y todas las posteriores.
+
+    Las matrices son película×usuario con las valoraciones centradas por usuario; las normas
+    se calculan solo sobre los usuarios comunes a cada par.
+
+    Returns:
+        tuple: (filas, columnas, similitud) con índices globales de película y ``fila < columna``
+    """
+    x = centrada_t[inicio:fin]
+    bx = binaria_t[inicio:fin]
+    co_conteo = (bx @ binaria_t.T).tocoo()
+    mascara = (co_conteo.data >= min_usuarios) & (co_conteo.col > co_conteo.row + inicio)
+    filas, columnas = co_conteo.row[mascara], co_conteo.col[mascara]
+
+    suma_xy = _valores_en((x @ centrada_t.T).tocsr(), filas, columnas)
+    suma_xx = _valores_en((cuadrados_t[inicio:fin] @ binaria_t.T).tocsr(), filas, columnas)
+    suma_yy = _valores_en((bx @ cuadrados_t.T).tocsr(), filas, columnas)
+
+    validos = (suma_xx > TOLERANCIA_DENOMINADOR) & (suma_yy > TOLERANCIA_DENOMINADOR)
+    similitud = suma_xy[validos] / (np.sqrt(suma_xx[validos]) * np.sqrt(suma_yy[validos]))
+    np.clip(similitud, -1.0, 1.0, out=similitud)
+    return filas[validos] + inicio, columnas[validos], similitud
+
+
+def iterar_similitudes_peliculas(ratings_data, min_usuarios=5, block_size=1000):
+    """
+    Genera por bloques de películas el coseno ajustado entre todos los pares con usuarios en común.
+
+    Yields:
+        tuple: (inicio, fin, lista de tuplas (pelicula1, pelicula2, similitud)) por bloque
+    """
+    if not isinstance(ratings_data, ValoracionesColumnares):
+        ratings_data = ValoracionesColumnares.desde_tuplas(ratings_data)
+    centrada, binaria, _ = preparar_matrices(ratings_data)
+    centrada_t, binaria_t, cuadrados_t = trasponer_matrices(centrada, binaria)
+    movie_ids = ratings_data.movie_ids
+    total_peliculas = centrada_t.shape[0]
+    for inicio in range(0, total_peliculas, block_size):
+        fin = min(inicio + block_size, total_peliculas)
+        filas, columnas, similitud = calcular_bloque_coseno_ajustado(centrada_t, binaria_t, cuadrados_t, inicio, fin,
+                                                                     min_usuarios)
+        yield inicio, fin, list(zip(movie_ids[filas].tolist(), movie_ids[columnas].tolist(), similitud.tolist()))
+
+
+def calcular_vecinos_peliculas(ratings_data, top_k=20, score_minimo=0.0, min_usuarios=5, block_size=1000):
+    """
+    Calcula los ``top_k`` vecinos de cada película por coseno ajustado.
+
+    Args:
+        ratings_data: ValoracionesColumnares con todas las valoraciones
+        score_minimo: Solo se conservan similitudes estrictamente mayores
+        min_usuarios: Usuarios que deben haber valorado ambas películas
+
+    Returns:
+        TopKNeighbors: vecinos dirigidos película -> película similar
+    """
+    vecinos = TopKNeighbors(top_k, score_minimo)
+    for inicio, fin, similitudes in iterar_similitudes_peliculas(ratings_data, min_usuarios, block_size):
+        vecinos.agregar_similitudes(similitudes)
+    return vecinos
+
+
+def guardar_vecinos_peliculas(driver, vecinos, num_escritores=4):
+    """
+    Sustituye las aristas SIMILAR_A de Neo4j por las de ``vecinos``.
+
+    Returns:
+        dict: estadísticas del importador
+    """
+    with driver.session() as session:
+        session.run(QUERY_INDICE_PELICULA).consume()
+        session.run(QUERY_BORRAR_SIMILAR_A).consume()
+
+    importador = ImportadorParalelo(driver, QUERY_SIMILAR_A, num_escritores)
+    importador.descripcion = "aristas SIMILAR_A"
+    return importador.importar([list(vecinos.aristas())])
@@ -0,0 +1,162 @@
+import numpy as np
+
+from sparse_similarity import pearson_para_pares
+
+PRIMO_MINHASH = (1 << 31) - 1
+
+
+def firmas_minhash(binaria, num_hashes, semilla=42, valores_por_lote=1 << 24):
+    """
+    Calcula la firma MinHash del conjunto de películas valoradas por cada usuario.
+
+    Cada película se hashea una sola vez (tabla ``num_hashes × películas`` en int32, porque
+    los hashes son menores que ``PRIMO_MINHASH``) y los mínimos por usuario se toman por
+    bloques de filas de modo que cada bloque indexe como mucho ``valores_por_lote`` hashes.
+
+    Returns:
+        np.ndarray: matriz (usuarios × num_hashes) de int64; los usuarios sin valoraciones
+                    quedan con el valor máximo y no colisionan por contenido
+    """
+    rng = np.random.default_rng(semilla)
+    a = rng.integers(1, PRIMO_MINHASH, size=num_hashes, dtype=np.int64)
+    b = rng.integers(0, PRIMO_MINHASH, size=num_hashes, dtype=np.int64)
+
+    num_users, num_peliculas = binaria.shape
+    tabla = np.empty((num_hashes, num_peliculas), dtype=np.int32)
+    peliculas = np.arange(num_peliculas, dtype=np.int64)
+    for h in range(num_hashes):
+        tabla[h] = (a[h] * peliculas + b[h]) % PRIMO_MINHASH
+
+    firmas = np.full((num_users, num_hashes), PRIMO_MINHASH, dtype=np.int64)
+    indptr = binaria.indptr
+    con_datos = np.diff(indptr) > 0
+    max_valoraciones = max(valores_por_lote // max(num_hashes, 1), 1)
+    inicio = 0
+    while inicio < num_users:
+        fin = int(np.searchsorted(indptr, indptr[inicio] + max_valoraciones, side="right")) - 1
+        fin = min(max(fin, inicio + 1), num_users)
+        desde, hasta = indptr[inicio], indptr[fin]
+        if desde < hasta:
+            filas = con_datos[inicio:fin]
+            valores = tabla[:, binaria.indices[desde:hasta]]
+            firmas[inicio:fin][filas] = np.minimum.reduceat(valores, indptr[inicio:fin][filas] - desde, axis=1).T
+        inicio = fin
+
+    return firmas
+
+
+def pares_candidatos(firmas, bandas, filas_por_banda, usuarios_validos=None, max_bucket=5000):
+    """
+    Agrupa las firmas en bandas LSH y devuelve los pares de usuarios que colisionan en alguna.
+
+    Args:
+        firmas: Matriz de firmas MinHash con al menos ``bandas * filas_por_banda`` columnas
+        usuarios_validos: Máscara booleana de usuarios que pueden participar
+        max_bucket: Los buckets más grandes se descartan para evitar explosiones cuadráticas
+
+    Returns:
+        tuple: (filas, columnas) sin duplicados y con ``fila < columna``
+    """
+    num_users = firmas.shape[0]
+    if bandas * filas_por_banda > firmas.shape[1]:
+        raise ValueError("La firma no tiene suficientes hashes para las bandas indicadas")
+
+    indices = np.arange(num_users) if usuarios_validos is None else np.flatnonzero(usuarios_validos)
+    claves = []
+
+    for banda in range(bandas):
+        columnas_banda = firmas[indices, banda * filas_por_banda:(banda + 1) * filas_por_banda]
+        _, bucket = np.unique(columnas_banda, axis=0, return_inverse=True)
+        bucket = bucket.ravel()
+        orden = np.argsort(bucket, kind="stable")
+        limites = np.flatnonzero(np.diff(bucket[orden])) + 1
+        for miembros in np.split(indices[orden], limites):
+            if len(miembros) < 2 or len(miembros) > max_bucket:
+                continue
+            i, j = np.triu_indices(len(miembros), k=1)
+            claves.append(miembros[i].astype(np.int64) * num_users + miembros[j])
+
+    if not claves:
+        vacio = np.zeros(0, dtype=np.int64)
+        return vacio, vacio
+
+    claves = np.unique(np.concatenate(claves))
+    return claves // num_users, claves % num_users
+
+
+def num_pares_totales(num_users):
+    return num_users * (num_users - 1) // 2
+
+
+def iterar_similitudes_lsh(centrada, binaria, user_ids, min_peliculas=3, bandas=20, filas_por_banda=5,
+                           pares_por_lote=200000, semilla=42, omitir=None):
+    """
+    Calcula Pearson solo para los pares que colisionan en alguna banda LSH.
+
+    Los usuarios con menos de ``min_peliculas`` valoraciones no pueden alcanzar el mínimo
+    de películas en común y no entran en las bandas. ``omitir`` contiene los números de
+    lote ya calculados en una ejecución anterior (los lotes son deterministas para una semilla).
+
+    Yields:
+        tuple: (lote, total_lotes, lista de tuplas (user1, user2, similitud))
+    """
+    usuarios_validos = np.diff(binaria.indptr) >= min_peliculas
+    firmas = firmas_minhash(binaria, bandas * filas_por_banda, semilla)
+    filas, columnas = pares_candidatos(firmas, bandas, filas_por_banda, usuarios_validos)
+
+    total_pares = num_pares_totales(int(usuarios_validos.sum()))
+    print(f"LSH ({bandas} bandas × {filas_por_banda} filas): {len(filas)} pares candidatos "
+          f"de {total_pares} posibles ({100.0 * len(filas) / max(total_pares, 1):.2f}%)")
+
+    total_lotes = (len(filas) + pares_por_lote - 1) // pares_por_lote
+    for lote, inicio in enumerate(range(0, len(filas), pares_por_lote), start=1):
+        if omitir and lote in omitir:
+            continue
+        f, c, pearson = pearson_para_pares(
+            centrada, binaria,
+            filas[inicio:inicio + pares_por_lote], columnas[inicio:inicio + pares_por_lote],
+            min_peliculas
+        )
+        yield lote, total_lotes, list(zip(user_ids[f].tolist(), user_ids[c].tolist(), pearson.tolist()))
+
+
+def informe_recall(centrada, binaria, min_peliculas=3, bandas=20, filas_por_banda=5, tam_muestra=200,
+                   score_minimo=0.3, semilla=42):
+    """
+    Mide el recall de LSH frente al motor exacto sobre una muestra de usuarios.
+
+    Para cada usuario de la muestra se calculan de forma exacta todos sus pares con al menos
+    ``min_peliculas`` películas en común y se comprueba cuántos aparecen entre los candidatos.
+
+    Returns:
+        dict: recall global, recall de los pares con similitud > ``score_minimo`` y reducción de pares
+    """
+    num_users = binaria.shape[0]
+    usuarios_validos = np.diff(binaria.indptr) >= min_peliculas
+    firmas = firmas_minhash(binaria, bandas * filas_por_banda, semilla)
+    filas, columnas = pares_candidatos(firmas, bandas, filas_por_banda, usuarios_validos)
+    candidatos = filas * num_users + columnas
+
+    rng = np.random.default_rng(semilla)
+    validos = np.flatnonzero(usuarios_validos)
+    muestra = rng.choice(validos, size=min(tam_muestra, len(validos)), replace=False)
+
+    co_conteo = (binaria[muestra] @ binaria.T).tocoo()
+    mascara = (co_conteo.data >= min_peliculas) & (muestra[co_conteo.row] != co_conteo.col)
+    u = muestra[co_conteo.row[mascara]]
+    v = co_conteo.col[mascara]
+    u_exacto, v_exacto, pearson = pearson_para_pares(centrada, binaria, u, v, min_peliculas)
+
+    claves = np.minimum(u_exacto, v_exacto) * num_users + np.maximum(u_exacto, v_exacto)
+    encontrados = np.isin(claves, candidatos)
+    relevantes = pearson > score_minimo
+
+    return {
+        'usuarios_muestra': len(muestra),
+        'pares_exactos': int(len(claves)),
+        'recall': float(encontrados.mean()) if len(claves) else 1.0,
+        'pares_relevantes': int(relevantes.sum()),
+        'recall_relevantes': float(encontrados[relevantes].mean()) if relevantes.any() else 1.0,
+        'pares_candidatos': len(candidatos),
+        'fraccion_pares': len(candidatos) / max(num_pares_totales(int(usuarios_validos.sum())), 1)
+    }
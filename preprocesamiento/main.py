@@ -1,60 +1,122 @@
 from neo4j import GraphDatabase
 import pandas as pd
-from collections import defaultdict
 import time
 import glob
 import os
 import multiprocessing
 from tqdm import tqdm
-import concurrent.futures
 
-from similarity_calculator import calculate_similarity_for_user_pair_cy
+from columnar_ratings import ValoracionesColumnares, leer_shards_valoraciones
+from similarity_shards import EscritorShards, LectorShards
+from neo4j_importer import ImportadorSimilitudes
+from sparse_similarity import comparar_similitudes, iterar_similitudes_sparse, preparar_matrices
+from lsh_candidates import iterar_similitudes_lsh, informe_recall
+from parallel_similarity import iterar_similitudes_multiproceso
+from top_k_neighbors import TopKNeighbors
+from pearson_kernel import KernelPearson
+from run_manifest import ManifiestoEjecucion
+from pair_statistics import EstadisticasPares
+from out_of_core import CSREnDisco, iterar_tiles, pico_memoria_mb, volcar_csr_en_disco
+from block_queue import coordinar, reiniciar_trabajo
+from streaming_pipeline import PipelineStreaming
+from telemetry import Telemetria
+from item_similarity import calcular_vecinos_peliculas, guardar_vecinos_peliculas
+from als_model import entrenar_als, guardar_modelo, medir_latencia
 
 NEO4J_URI = "neo4j://localhost:7687"
 NEO4J_USER = "neo4j"
 NEO4J_PASSWORD = "Virt1234*"
 
-
-def process_csv_file(filename):
-    """Procesa un archivo CSV individual y devuelve las valoraciones"""
-    try:
-        df = pd.read_csv(filename, header=0)
-        return [(row['userId'], row['id'], row['rating']) for _, row in df.iterrows()]
-    except Exception as e:
-        print(f"Error procesando {filename}: {e}")
-        return []
+# "kernel": extensión similarity_kernel si está compilada y, si no, su versión NumPy (se indica al ejecutar);
+# "sparse": productos de matrices dispersas por bloques de usuarios
+SIMILARITY_ENGINE = "kernel"
+# Motor de referencia con el que comparar SIMILARITY_ENGINE sobre una muestra de usuarios antes de la fase 1
+# (None para no comparar)
+MOTOR_COMPARACION = None
+USUARIOS_COMPARACION = 2000
+TOP_K_VECINOS = 50
+SCORE_MINIMO_VECINOS = 0.3
+LSH_BANDAS = None
+LSH_FILAS = 5
+NUM_PROCESOS_SIMILITUD = None
+FORMATO_SALIDA = "npy"
+NUM_ESCRITORES_NEO4J = 4
+MODO_IMPORTACION = "merge"
+INTERVALO_CHECKPOINT = 60
+# Calcula e importa a la vez, sin archivos intermedios (solo sin top-K, cuyas aristas no son definitivas hasta el
+# final). No registra checkpoints en el manifiesto: una ejecución interrumpida vuelve a empezar
+STREAMING_NEO4J = False
+MAX_LOTES_EN_COLA = 8
+# Fase 1 sobre una CSR en disco, por tiles que caben en PRESUPUESTO_MEMORIA_MB
+FUERA_DE_MEMORIA = False
+PRESUPUESTO_MEMORIA_MB = 1024
+# Directorio compartido de la cola de bloques para repartir la fase 1 entre varias máquinas (None para no usarla)
+DIRECTORIO_TRABAJO_DISTRIBUIDO = None
+WORKERS_LOCALES = multiprocessing.cpu_count()
+# Almacén SQLite de estadísticos por par para el mantenimiento incremental desde la app (None para no generarlo).
+# Guarda una fila (~80 bytes con el índice) por cada par de usuarios con al menos una película en común, hasta
+# N·(N-1)/2 filas para N usuarios: crece con el cuadrado de los usuarios y el top-K no lo reduce. Para activarlo:
+# os.path.join(os.path.dirname(os.path.abspath(__file__)), "estadisticas_pares.sqlite")
+ESTADISTICAS_PARES = None
+# Vecinos por película (coseno ajustado) para el criterio "pelicula_similar" (None para no calcularlos)
+TOP_K_PELICULAS_SIMILARES = 20
+MIN_USUARIOS_PELICULAS_SIMILARES = 5
+# Factores ALS del criterio "modelo" del recomendador (None para no entrenarlos)
+DIRECTORIO_MODELO_ALS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modelo_als")
+FACTORES_ALS = 32
+ITERACIONES_ALS = 10
+# Métricas por etapa de cada ejecución, una línea JSON por etapa (None para no guardarlas)
+TELEMETRIA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetria.jsonl")
+
+
+def _clave_bloque(inicio, fin):
+    return f"{inicio}-{fin}"
+
+
+def _bloques_de_claves(claves):
+    """Convierte las claves "inicio-fin" de los chunks completados en tuplas (inicio, fin)"""
+    return {tuple(int(valor) for valor in clave.split("-")) for clave in claves}
 
 
 class SimilarityCalculator:
-    def __init__(self, uri, user, password):
+    def __init__(self, uri, user, password, formato_salida="csv", dtype_score="float32", num_escritores=4,
+                 modo_importacion="merge", telemetria=None):
+        """
+        formato_salida: "csv" o "npy" (shards binarios con manifiesto, ver similarity_shards)
+        dtype_score: Precisión de la similitud en los shards "npy" ("float32" o "float16")
+        num_escritores: Hilos escritores de la importación a Neo4j
+        modo_importacion: "merge" (upsert) o "create" (carga en una base sin aristas SIMILAR)
+        telemetria: Telemetria donde se acumulan las métricas de cada etapa
+        """
+        if formato_salida not in ("csv", "npy"):
+            raise ValueError(f"Formato de salida desconocido: {formato_salida}")
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        self.output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "similitudes_csv")
+        self.formato_salida = formato_salida
+        self.dtype_score = dtype_score
+        self.num_escritores = num_escritores
+        self.modo_importacion = modo_importacion
+        self.escritor_shards = None
+        self.telemetria = telemetria or Telemetria()
+        self.output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"similitudes_{formato_salida}")
         os.makedirs(self.output_dir, exist_ok=True)
-        print(f"Los archivos CSV de similitudes se guardarán en: {self.output_dir}")
+        print(f"Los archivos {formato_salida.upper()} de similitudes se guardarán en: {self.output_dir}")
 
     def close(self):
         self.driver.close()
 
-    def cargar_valoraciones_desde_csv_parallel(self, csv_pattern, num_processes=None):
-        """Carga valoraciones desde archivos CSV usando multiprocessing"""
+    def cargar_valoraciones_columnares(self, csv_pattern):
+        """Carga valoraciones desde archivos CSV como columnas tipadas con índices densos"""
         print("Buscando archivos CSV...")
-        all_files = glob.glob(csv_pattern)
+        all_files = sorted(glob.glob(csv_pattern))
         print(f"Encontrados {len(all_files)} archivos CSV.")
 
-        if not num_processes:
-            num_processes = min(multiprocessing.cpu_count(), 8)
-
-        print(f"Utilizando {num_processes} procesos para cargar archivos...")
-
-        with multiprocessing.Pool(processes=num_processes) as pool:
-            results = []
-            for i, result in enumerate(tqdm(pool.imap_unordered(process_csv_file, all_files),
-                                            total=len(all_files),
-                                            desc="Procesando archivos")):
-                results.extend(result)
-
-        print(f"Total de valoraciones cargadas: {len(results)}")
-        return results
+        with self.telemetria.medir("carga"):
+            valoraciones = leer_shards_valoraciones(all_files)
+        self.telemetria.sumar("carga", filas=len(valoraciones))
+        print(f"Total de valoraciones cargadas: {len(valoraciones)} "
+              f"({valoraciones.num_usuarios} usuarios, {valoraciones.num_peliculas} películas, "
+              f"{valoraciones.nbytes / 1024 ** 2:.1f} MB)")
+        return valoraciones
 
     def guardar_similitudes_en_csv(self, similarities, batch_id):
         """Guarda las similitudes calculadas en un archivo CSV"""
@@ -69,92 +131,503 @@ class SimilarityCalculator:
 
         return csv_filename
 
+    def guardar_similitudes(self, similarities, batch_id):
+        """Guarda un lote de similitudes en el formato de salida configurado"""
+        with self.telemetria.medir("escritura"):
+            if self.formato_salida == "csv":
+                shard_file = self.guardar_similitudes_en_csv(similarities, batch_id)
+            else:
+                shard_file = self.escritor_shards.escribir(similarities, batch_id)
+                if shard_file:
+                    print(f"Guardadas {len(similarities)} similitudes en {shard_file}")
+        if shard_file:
+            self.telemetria.sumar("escritura", filas=len(similarities), bytes_escritos=os.path.getsize(shard_file))
+        return shard_file
+
+    def guardar_vecinos_en_csv(self, vecinos, csv_batch_size=100000):
+        """Guarda las aristas dirigidas usuario -> vecino del top-K en el formato de salida"""
+        csv_files = []
+        batch = []
+        for arista in vecinos.aristas():
+            batch.append(arista)
+            if len(batch) >= csv_batch_size:
+                csv_files.append(self.guardar_similitudes(batch, len(csv_files) + 1))
+                batch = []
+        if batch:
+            csv_files.append(self.guardar_similitudes(batch, len(csv_files) + 1))
+
+        print(f"Top-{vecinos.k} vecinos: {vecinos.num_aristas()} aristas para {len(vecinos)} usuarios")
+        return csv_files
+
     def calcular_similitudes_por_chunks(self, ratings_data, min_peliculas=3, chunk_size=1000, csv_batch_size=100000,
-                                        num_workers=None):
-        """Calcula similitudes de coseno entre usuarios procesando por chunks y guardando en CSV - Versión optimizada con Cython"""
+                                        num_workers=None, engine="kernel", block_size=2000, top_k=None,
+                                        score_minimo=None, lsh_bandas=None, lsh_filas=5, num_procesos=None,
+                                        manifiesto=None):
+        """
+        Calcula similitudes de Pearson entre usuarios procesando por chunks y guardando en CSV o shards.
+
+        engine: "kernel" calcula por chunks de usuarios los pares con películas en común con el
+                kernel ``similarity_kernel`` (o su versión NumPy si no está compilado); "sparse"
+                usa productos de matrices dispersas por bloques de ``block_size`` usuarios.
+        num_workers: Hilos OpenMP del kernel compilado.
+        top_k: Si se indica, solo se guardan los ``top_k`` vecinos de cada usuario con similitud
+               mayor que ``score_minimo``, como aristas dirigidas usuario -> vecino.
+        lsh_bandas, lsh_filas: Activan la generación de candidatos MinHash/LSH (motor "sparse").
+        num_procesos: Ejecuta los bloques del motor "sparse" en un pool de procesos con las
+                      valoraciones en memoria compartida.
+        manifiesto: ManifiestoEjecucion opcional; los chunks ya registrados se omiten y el
+                    progreso se guarda tras cada checkpoint para poder reanudar.
+        """
+        if manifiesto is not None and manifiesto.fase1_completa:
+            print("Fase 1 ya completada en una ejecución anterior.")
+            return manifiesto.archivos
+
+        vecinos = TopKNeighbors(top_k, score_minimo) if top_k else None
+        if vecinos is not None and manifiesto is not None:
+            vecinos = manifiesto.cargar_vecinos() or vecinos
+
+        if not isinstance(ratings_data, ValoracionesColumnares):
+            ratings_data = ValoracionesColumnares.desde_tuplas(ratings_data)
+        if self.formato_salida == "npy":
+            conservar = manifiesto.archivos if manifiesto is not None and vecinos is None else None
+            self.escritor_shards = EscritorShards(self.output_dir, ratings_data.user_ids, self.dtype_score, conservar)
+
+        completados = manifiesto.chunks_completados if manifiesto is not None else set()
+        lotes = self.generar_lotes(ratings_data, engine, min_peliculas, chunk_size, num_workers, block_size,
+                                   lsh_bandas, lsh_filas, num_procesos, completados)
+        return self._guardar_lotes(lotes, csv_batch_size, vecinos, manifiesto)
+
+    def generar_lotes(self, ratings_data, engine="kernel", min_peliculas=3, chunk_size=1000, num_workers=None,
+                      block_size=2000, lsh_bandas=None, lsh_filas=5, num_procesos=None, completados=()):
+        """
+        Devuelve el generador de lotes (clave, descripción, similitudes) del motor indicado.
+
+        Las claves de ``completados`` (chunks de una ejecución anterior) no se vuelven a calcular.
+        """
+        if engine == "sparse":
+            return self._lotes_sparse(ratings_data, min_peliculas, block_size, lsh_bandas, lsh_filas, num_procesos,
+                                      completados)
+        if engine != "kernel":
+            raise ValueError(f"Motor de similitud desconocido: {engine}")
+        if lsh_bandas:
+            raise ValueError("La generación de candidatos LSH requiere el motor 'sparse'")
+        return self._lotes_kernel(ratings_data, min_peliculas, chunk_size, num_workers, completados)
+
+    def _lotes_kernel(self, ratings_data, min_peliculas=3, chunk_size=1000, num_workers=None, completados=()):
+        """Lotes del motor "kernel": un lote por chunk de ``chunk_size`` usuarios"""
         print("Organizando valoraciones por usuario...")
-        user_ratings = defaultdict(dict)
-        for user_id, movie_id, rating in tqdm(ratings_data, desc="Organizando valoraciones"):
-            user_ratings[user_id][movie_id] = rating
-
-        users = list(user_ratings.keys())
-        total_users = len(users)
+        user_ids = ratings_data.user_ids
+        with self.telemetria.medir("organizacion"):
+            kernel = KernelPearson(ratings_data.a_matriz_csr(), num_workers)
+        total_users = len(user_ids)
         print(f"Total de usuarios: {total_users}")
+        print(f"Kernel de similitud: {kernel.descripcion}")
+
+        def lotes():
+            for i in range(0, total_users, chunk_size):
+                fin = min(i + chunk_size, total_users)
+                clave = _clave_bloque(i, fin)
+                if clave in completados:
+                    continue
+                with self.telemetria.medir("pares"):
+                    candidatos = kernel.pares_candidatos(i, fin, min_peliculas)
+                self.telemetria.sumar("pares", pares_guardados=len(candidatos[0]))
+                with self.telemetria.medir("calculo"):
+                    filas, columnas, pearson = kernel.calcular(*candidatos, min_peliculas)
+                    similitudes = list(zip(user_ids[filas].tolist(), user_ids[columnas].tolist(), pearson.tolist()))
+                self.telemetria.sumar("calculo", pares_evaluados=len(candidatos[0]), pares_guardados=len(filas))
+                yield clave, f"Chunk de usuarios {i + 1}-{fin} de {total_users}", similitudes
+
+        return lotes()
+
+    def _registrar_checkpoint(self, manifiesto, chunks, csv_files, batch_id, vecinos=None, forzar=False):
+        """
+        Registra en el manifiesto los chunks terminados si toca checkpoint.
+
+        Los archivos de ``csv_files`` deben estar completos en disco. Devuelve los chunks que
+        quedan pendientes de registrar.
+        """
+        if manifiesto is None or not chunks or not (forzar or manifiesto.checkpoint_pendiente()):
+            return chunks
+        manifiesto.registrar_progreso(chunks, csv_files, batch_id, vecinos)
+        return []
 
-        if not num_workers:
-            num_workers = min(os.cpu_count() + 4, 16)
-
-        print(f"Utilizando {num_workers} workers para cálculos de similitud")
-
-        csv_files = []
-        batch_id = 1
+    def _lotes_sparse(self, ratings_data, min_peliculas=3, block_size=2000, lsh_bandas=None, lsh_filas=5,
+                      num_procesos=None, completados=()):
+        """
+        Lotes del motor "sparse".
+
+        Si se indica ``lsh_bandas`` solo se calculan los pares que colisionan en alguna banda
+        MinHash/LSH de ``lsh_filas`` filas, en lugar de todos los pares. Con ``num_procesos``
+        los bloques se reparten, equilibrados por número de valoraciones, entre procesos que
+        leen las matrices desde memoria compartida.
+        """
+        print("Construyendo matriz dispersa usuario×película...")
+        with self.telemetria.medir("organizacion"):
+            centrada, binaria, user_ids = preparar_matrices(ratings_data)
+        print(f"Total de usuarios: {len(user_ids)}")
+
+        # Este motor genera los pares y calcula Pearson con los mismos productos: todo cuenta como "calculo"
+        if lsh_bandas:
+            lotes_lsh = {int(clave.split("-")[1]) for clave in completados}
+            lotes = (
+                (f"lsh-{lote}", f"Lote LSH {lote}/{total}", similitudes)
+                for lote, total, similitudes in iterar_similitudes_lsh(
+                    centrada, binaria, user_ids, min_peliculas, lsh_bandas, lsh_filas, omitir=lotes_lsh
+                )
+            )
+        elif num_procesos:
+            print(f"Utilizando {num_procesos} procesos para cálculos de similitud")
+            lotes = (
+                (_clave_bloque(inicio, fin), f"Bloque de usuarios {inicio + 1}-{fin}", similitudes)
+                for inicio, fin, similitudes in iterar_similitudes_multiproceso(
+                    centrada, binaria, user_ids, min_peliculas, num_procesos, omitir=_bloques_de_claves(completados)
+                )
+            )
+        else:
+            lotes = (
+                (_clave_bloque(inicio, fin), f"Bloque de usuarios {inicio + 1}-{fin}", similitudes)
+                for inicio, fin, similitudes in iterar_similitudes_sparse(
+                    centrada, binaria, user_ids, min_peliculas, block_size, omitir=_bloques_de_claves(completados)
+                )
+            )
+        return self.telemetria.medir_iterador("calculo", lotes, lambda lote: {'pares_guardados': len(lote[2])})
+
+    def _guardar_lotes(self, lotes, csv_batch_size=100000, vecinos=None, manifiesto=None):
+        """Guarda en disco (o en el top-K de vecinos) los lotes (clave, descripción, similitudes) de un motor"""
+        csv_files = manifiesto.archivos if manifiesto is not None else []
+        batch_id = manifiesto.siguiente_batch_id if manifiesto is not None else 1
         total_similarities = 0
+        similarities = []
+        chunks_pendientes = []
+
+        lote_start_time = time.time()
+        for clave, descripcion, lote_similarities in lotes:
+            if vecinos is not None:
+                with self.telemetria.medir("top_k"):
+                    vecinos.agregar_similitudes(lote_similarities)
+                self.telemetria.sumar("top_k", filas=len(lote_similarities))
+            else:
+                similarities.extend(lote_similarities)
+
+            while len(similarities) >= csv_batch_size:
+                csv_file = self.guardar_similitudes(similarities[:csv_batch_size], batch_id)
+                csv_files.append(csv_file)
+                total_similarities += csv_batch_size
+                similarities = similarities[csv_batch_size:]
+                batch_id += 1
 
-        for i in range(0, total_users, chunk_size):
-            chunk_users = users[i:i + chunk_size]
-            chunk_start_time = time.time()
-            print(f"Procesando chunk de usuarios {i + 1}-{min(i + chunk_size, total_users)} de {total_users}")
-
-            similarity_pairs = []
-
-            for idx, user1 in enumerate(chunk_users):
-                for user2 in users:
-                    if user1 >= user2:
-                        continue
-
-                    similarity_pairs.append((user1, user2, user_ratings[user1], user_ratings[user2], min_peliculas))
-
-            similarities = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-                for result in tqdm(
-                        executor.map(calculate_similarity_for_user_pair_cy, similarity_pairs),
-                        total=len(similarity_pairs),
-                        desc=f"Calculando similitudes en chunk {i // chunk_size + 1}",
-                        unit="par"
-                ):
-                    if result:
-                        similarities.append(result)
-
-                        if len(similarities) >= csv_batch_size:
-                            csv_file = self.guardar_similitudes_en_csv(similarities, batch_id)
-                            csv_files.append(csv_file)
-                            total_similarities += len(similarities)
-                            similarities = []
-                            batch_id += 1
-
+            print(f"{descripcion}: {len(lote_similarities)} similitudes "
+                  f"en {time.time() - lote_start_time:.2f} segundos")
+            lote_start_time = time.time()
+
+            chunks_pendientes.append(clave)
+            if manifiesto is not None and manifiesto.checkpoint_pendiente():
+                # Las similitudes aún en memoria pertenecen a chunks pendientes: se vuelcan antes de registrarlos
+                if similarities:
+                    csv_files.append(self.guardar_similitudes(similarities, batch_id))
+                    total_similarities += len(similarities)
+                    similarities = []
+                    batch_id += 1
+                chunks_pendientes = self._registrar_checkpoint(manifiesto, chunks_pendientes, csv_files, batch_id,
+                                                               vecinos, forzar=True)
+
+        if vecinos is not None:
+            csv_files = self.guardar_vecinos_en_csv(vecinos, csv_batch_size)
+        else:
             if similarities:
-                csv_file = self.guardar_similitudes_en_csv(similarities, batch_id)
+                csv_file = self.guardar_similitudes(similarities, batch_id)
                 csv_files.append(csv_file)
                 total_similarities += len(similarities)
-                similarities = []
-                batch_id += 1
-
-            chunk_time = time.time() - chunk_start_time
-            print(f"Chunk procesado en {chunk_time:.2f} segundos ({chunk_time / 60:.2f} min)")
+            print(f"Procesamiento completado. Total de similitudes calculadas: {total_similarities}")
 
-        print(f"Procesamiento completado. Total de similitudes calculadas: {total_similarities}")
+        if manifiesto is not None:
+            manifiesto.completar_fase1(csv_files)
         return csv_files
 
-    def importar_similitudes_desde_csv_a_neo4j(self, csv_files):
-        """Importa las similitudes desde los archivos CSV a Neo4j"""
-        print(f"Importando {len(csv_files)} archivos CSV a Neo4j...")
+    def calcular_similitudes_fuera_de_memoria(self, archivos, min_peliculas=3, presupuesto_mb=1024, top_k=None,
+                                              score_minimo=None, num_workers=None, manifiesto=None):
+        """
+        Calcula las similitudes sin cargar las valoraciones en memoria.
+
+        Las valoraciones se vuelcan a una matriz CSR en disco (``<output_dir>/csr``) y se
+        recorren tiles usuario×usuario dimensionados para ``presupuesto_mb``; cada tile se
+        escribe directamente como un archivo de salida. Con ``top_k`` solo los heaps de vecinos
+        (proporcionales al número de usuarios) permanecen en memoria.
+        """
+        if manifiesto is not None and manifiesto.fase1_completa:
+            print("Fase 1 ya completada en una ejecución anterior.")
+            return manifiesto.archivos
+
+        directorio_csr = os.path.join(self.output_dir, "csr")
+        completados = manifiesto.chunks_completados if manifiesto is not None else set()
+        if not (completados and os.path.exists(os.path.join(directorio_csr, "csr.json"))):
+            print("Volcando las valoraciones a una matriz CSR en disco...")
+            with self.telemetria.medir("carga"):
+                meta = volcar_csr_en_disco(archivos, directorio_csr)
+            self.telemetria.sumar("carga", filas=meta['nnz'])
+        csr = CSREnDisco(directorio_csr)
+        print(f"Matriz en disco: {csr.shape[0]} usuarios, {csr.shape[1]} películas, {csr.meta['nnz']} valoraciones")
+
+        vecinos = TopKNeighbors(top_k, score_minimo) if top_k else None
+        if vecinos is not None and manifiesto is not None:
+            vecinos = manifiesto.cargar_vecinos() or vecinos
+            completados = manifiesto.chunks_completados
+        if self.formato_salida == "npy":
+            conservar = manifiesto.archivos if manifiesto is not None and vecinos is None else None
+            self.escritor_shards = EscritorShards(self.output_dir, csr.user_ids, self.dtype_score, conservar)
+
+        csv_files = manifiesto.archivos if manifiesto is not None else []
+        batch_id = manifiesto.siguiente_batch_id if manifiesto is not None else 1
+        chunks_pendientes = []
+        num_tiles = 0
+        total_similarities = 0
 
-        for i, csv_file in enumerate(csv_files):
-            print(f"Procesando archivo {i + 1}/{len(csv_files)}: {os.path.basename(csv_file)}")
+        tiles = self.telemetria.medir_iterador(
+            "calculo", iterar_tiles(csr, presupuesto_mb * 1024 ** 2, min_peliculas, num_workers, omitir=completados),
+            lambda tile: {'pares_guardados': len(tile[2])}
+        )
+        for clave, total_tiles, filas, columnas, pearson in tiles:
+            tile_start_time = time.time()
+            num_tiles += 1
+            if vecinos is not None:
+                with self.telemetria.medir("top_k"):
+                    vecinos.agregar_similitudes(zip(csr.user_ids[filas].tolist(), csr.user_ids[columnas].tolist(),
+                                                    pearson.tolist()))
+                self.telemetria.sumar("top_k", filas=len(filas))
+            elif len(filas):
+                with self.telemetria.medir("escritura"):
+                    if self.formato_salida == "npy":
+                        csv_file = self.escritor_shards.escribir_indices(filas, columnas, pearson, batch_id)
+                    else:
+                        csv_file = self.guardar_similitudes_en_csv(
+                            list(zip(csr.user_ids[filas].tolist(), csr.user_ids[columnas].tolist(),
+                                     pearson.tolist())),
+                            batch_id
+                        )
+                self.telemetria.sumar("escritura", filas=len(filas), bytes_escritos=os.path.getsize(csv_file))
+                csv_files.append(csv_file)
+                batch_id += 1
+                total_similarities += len(filas)
+
+            print(f"Tile {clave} ({num_tiles + len(completados)}/{total_tiles}): {len(filas)} similitudes "
+                  f"en {time.time() - tile_start_time:.2f} segundos")
+            chunks_pendientes.append(clave)
+            chunks_pendientes = self._registrar_checkpoint(manifiesto, chunks_pendientes, csv_files, batch_id,
+                                                           vecinos, forzar=vecinos is None)
+
+        if vecinos is not None:
+            csv_files = self.guardar_vecinos_en_csv(vecinos)
+
+        self.telemetria.sumar("calculo", bytes_leidos=csr.bytes_leidos)
+        print(f"Fuera de memoria: {num_tiles} tiles calculados, {csr.bytes_leidos / 1024 ** 2:.1f} MB leídos "
+              f"del disco, {total_similarities} similitudes, pico de memoria {pico_memoria_mb():.0f} MB")
+        if manifiesto is not None:
+            manifiesto.completar_fase1(csv_files)
+        return csv_files
 
-            batch_size = 5000
-            total_rows = sum(1 for _ in open(csv_file)) - 1
+    def calcular_similitudes_distribuidas(self, archivos, directorio_trabajo, min_peliculas=3, presupuesto_mb=1024,
+                                          top_k=None, score_minimo=None, workers_locales=0, manifiesto=None):
+        """
+        Reparte el cálculo en una cola de bloques compartida (ver block_queue).
+
+        Este proceso actúa de coordinador: publica los tiles, lanza ``workers_locales`` workers
+        y espera a los de otras máquinas que se conecten con ``python block_queue.py worker``;
+        al terminar fusiona los resultados en el directorio de salida.
+        """
+        if manifiesto is not None and manifiesto.fase1_completa:
+            print("Fase 1 ya completada en una ejecución anterior.")
+            return manifiesto.archivos
+        if self.formato_salida != "npy":
+            raise ValueError("El cálculo distribuido solo escribe shards 'npy'")
+
+        # Los workers corren en otros procesos (o máquinas): aquí solo se mide el total de la coordinación
+        with self.telemetria.medir("calculo_distribuido"):
+            archivos_salida = coordinar(directorio_trabajo, archivos, self.output_dir, min_peliculas, presupuesto_mb,
+                                        top_k, score_minimo, workers_locales, self.dtype_score)
+        if manifiesto is not None:
+            manifiesto.completar_fase1(archivos_salida)
+        return archivos_salida
+
+    def informe_recall_lsh(self, ratings_data, min_peliculas=3, lsh_bandas=20, lsh_filas=5, tam_muestra=200,
+                           score_minimo=0.3):
+        """Compara los candidatos LSH con el motor exacto sobre una muestra de usuarios"""
+        centrada, binaria, _ = preparar_matrices(ratings_data)
+        informe = informe_recall(centrada, binaria, min_peliculas, lsh_bandas, lsh_filas, tam_muestra, score_minimo)
+        print(f"Recall LSH sobre {informe['usuarios_muestra']} usuarios: {informe['recall']:.3f} "
+              f"(similitud > {score_minimo}: {informe['recall_relevantes']:.3f}), "
+              f"{100.0 * informe['fraccion_pares']:.2f}% de los pares")
+        return informe
+
+    def comparar_motores(self, ratings_data, engine, engine_referencia, min_peliculas=3, max_usuarios=2000,
+                         tolerancia=1e-5):
+        """
+        Ejecuta dos motores sobre las mismas valoraciones y compara sus similitudes par a par.
+
+        Se usan las valoraciones de los ``max_usuarios`` primeros usuarios (todas con None),
+        porque la comparación guarda en memoria todas las similitudes de ambos motores.
+
+        Returns:
+            dict: resultado de ``comparar_similitudes`` con la referencia ``engine_referencia``
+        """
+        if not isinstance(ratings_data, ValoracionesColumnares):
+            ratings_data = ValoracionesColumnares.desde_tuplas(ratings_data)
+        if max_usuarios and ratings_data.num_usuarios > max_usuarios:
+            muestra = ratings_data.user_idx < max_usuarios
+            ratings_data = ValoracionesColumnares.desde_columnas(
+                ratings_data.user_ids[ratings_data.user_idx[muestra]],
+                ratings_data.movie_ids[ratings_data.movie_idx[muestra]],
+                ratings_data.ratings[muestra]
+            )
+
+        similitudes = {}
+        for motor in (engine_referencia, engine):
+            lotes = self.generar_lotes(ratings_data, motor, min_peliculas)
+            similitudes[motor] = [s for _, _, lote in lotes for s in lote]
+        informe = comparar_similitudes(similitudes[engine_referencia], similitudes[engine], tolerancia)
+        print(f"Motor '{engine}' frente a '{engine_referencia}' ({ratings_data.num_usuarios} usuarios, "
+              f"{len(similitudes[engine_referencia])} pares): faltan {informe['faltan']}, sobran {informe['sobran']}, "
+              f"diferencia máxima {informe['diferencia_maxima']:.2e} -> "
+              f"{'coinciden' if informe['coinciden'] else 'NO coinciden'}")
+        return informe
+
+    def construir_estadisticas_pares(self, ratings_data, ruta, block_size=2000):
+        """Genera el almacén de estadísticos suficientes por par que usa la actualización incremental"""
+        if not isinstance(ratings_data, ValoracionesColumnares):
+            ratings_data = ValoracionesColumnares.desde_tuplas(ratings_data)
+        estadisticas = EstadisticasPares(ruta)
+        try:
+            with self.telemetria.medir("estadisticas_pares"):
+                num_pares = estadisticas.construir(ratings_data, block_size)
+            self.telemetria.sumar("estadisticas_pares", pares_guardados=num_pares)
+            return num_pares
+        finally:
+            estadisticas.close()
+
+    def calcular_e_importar_en_streaming(self, ratings_data, min_peliculas=3, chunk_size=1000, num_workers=None,
+                                         engine="kernel", block_size=2000, lsh_bandas=None, lsh_filas=5,
+                                         num_procesos=None, max_lotes_en_cola=8):
+        """
+        Calcula las similitudes y las importa a Neo4j a medida que se calculan.
+
+        Los lotes del motor pasan por una cola de ``max_lotes_en_cola`` lotes a los escritores
+        del importador; si Neo4j no da abasto el cálculo se detiene hasta que haya hueco. No se
+        escriben archivos intermedios, así que este modo no se puede reanudar.
+
+        Returns:
+            dict: métricas por etapa (ver PipelineStreaming)
+        """
+        if not isinstance(ratings_data, ValoracionesColumnares):
+            ratings_data = ValoracionesColumnares.desde_tuplas(ratings_data)
+        lotes = self.generar_lotes(ratings_data, engine, min_peliculas, chunk_size, num_workers, block_size,
+                                   lsh_bandas, lsh_filas, num_procesos)
+
+        importador = self.crear_importador(dirigido=False)
+        importador.asegurar_indice()
+        with tqdm(desc="Calculando e importando", unit="sim") as pbar, self.telemetria.medir("importacion_neo4j"):
+            metricas = PipelineStreaming(importador, max_lotes_en_cola).ejecutar(lotes, progreso=pbar.update)
+        self.telemetria.sumar("importacion_neo4j", filas=metricas['importacion']['filas'])
+        return metricas
+
+    def calcular_peliculas_similares(self, ratings_data, top_k=20, min_usuarios=5, score_minimo=0.0,
+                                     block_size=1000):
+        """
+        Calcula los ``top_k`` vecinos de cada película por coseno ajustado y los guarda en Neo4j
+        como aristas ``SIMILAR_A``, sustituyendo las de una ejecución anterior.
+        """
+        if not isinstance(ratings_data, ValoracionesColumnares):
+            ratings_data = ValoracionesColumnares.desde_tuplas(ratings_data)
+        with self.telemetria.medir("peliculas_similares"):
+            vecinos = calcular_vecinos_peliculas(ratings_data, top_k, score_minimo, min_usuarios, block_size)
+        self.telemetria.sumar("peliculas_similares", pares_guardados=vecinos.num_aristas())
+        print(f"Top-{top_k} películas similares: {vecinos.num_aristas()} aristas para {len(vecinos)} películas")
+
+        with self.telemetria.medir("importacion_neo4j"):
+            estadisticas = guardar_vecinos_peliculas(self.driver, vecinos, self.num_escritores)
+        self.telemetria.sumar("importacion_neo4j", filas=estadisticas['filas'])
+        return estadisticas
+
+    def entrenar_modelo_als(self, ratings_data, directorio, factores=32, iteraciones=10, regularizacion=0.05,
+                            fraccion_test=0.1):
+        """
+        Entrena los factores ALS de usuarios y películas y los guarda como ``.npy`` en ``directorio``.
+
+        Se informa del tiempo de entrenamiento, el RMSE sobre las valoraciones apartadas y la
+        latencia de servir un top-N con los factores (se guardan también en ``modelo.json``).
+        """
+        with self.telemetria.medir("modelo_als"):
+            modelo = entrenar_als(ratings_data, factores, regularizacion, iteraciones, fraccion_test)
+            modelo['metricas']['latencia'] = medir_latencia(modelo)
+            guardar_modelo(modelo, directorio)
+        self.telemetria.sumar("modelo_als", filas=modelo['metricas']['valoraciones_entrenamiento'])
+        return modelo['metricas']
+
+    def crear_importador(self, dirigido=False):
+        """Crea el importador paralelo de similitudes con la configuración de esta instancia"""
+        return ImportadorSimilitudes(self.driver, self.num_escritores, self.modo_importacion, dirigido)
+
+    def _preparar_importador(self, dirigido, archivos, manifiesto=None):
+        """
+        Crea el importador y asegura el índice. Las listas top-K (``dirigido``) en modo merge
+        sustituyen a todas las aristas SIMILAR anteriores, que se borran al empezar la
+        importación (no al reanudarla con archivos ya importados).
+        """
+        importador = self.crear_importador(dirigido)
+        importador.asegurar_indice()
+        reanudada = manifiesto is not None and any(manifiesto.archivo_importado(f) for f in archivos)
+        if dirigido and self.modo_importacion == "merge" and not reanudada:
+            importador.borrar_similitudes()
+        return importador
+
+    def importar_similitudes_desde_csv_a_neo4j(self, csv_files, dirigido=False, manifiesto=None):
+        """
+        Importa las similitudes desde los archivos CSV a Neo4j.
+
+        dirigido: True para los CSV de top-K, cuyas filas son aristas usuario -> vecino.
+        manifiesto: Si se indica, se omiten los archivos ya importados y cada archivo se marca
+                    como importado al terminar.
+        """
+        pendientes = [f for f in csv_files if manifiesto is None or not manifiesto.archivo_importado(f)]
+        print(f"Importando {len(pendientes)} de {len(csv_files)} archivos CSV a Neo4j...")
+
+        def lotes(csv_file):
+            for chunk in pd.read_csv(csv_file, chunksize=50000):
+                yield list(zip(chunk['usuario1'].tolist(), chunk['usuario2'].tolist(),
+                               chunk['similitud'].tolist()))
+
+        importador = self._preparar_importador(dirigido, csv_files, manifiesto)
+        with tqdm(desc="Importando CSV", unit="sim") as pbar:
+            for csv_file in pendientes:
+                with self.telemetria.medir("importacion_neo4j"):
+                    estadisticas = importador.importar(lotes(csv_file), progreso=pbar.update)
+                self.telemetria.sumar("importacion_neo4j", filas=estadisticas['filas'])
+                if manifiesto is not None:
+                    manifiesto.marcar_importado(csv_file, estadisticas)
 
-            with tqdm(total=total_rows, desc=f"Importando {os.path.basename(csv_file)}") as pbar:
-                for chunk in pd.read_csv(csv_file, chunksize=batch_size):
-                    similarities = [(row['usuario1'], row['usuario2'], row['similitud']) for _, row in chunk.iterrows()]
+        return "Todas las similitudes han sido importadas a Neo4j."
 
-                    self.guardar_similitudes_en_neo4j(similarities, show_progress=False)
-                    pbar.update(len(chunk))
+    def importar_similitudes_desde_shards_a_neo4j(self, directorio=None, dirigido=False, batch_size=50000,
+                                                  manifiesto=None):
+        """Importa a Neo4j las similitudes de los shards binarios leyéndolos con memory-map"""
+        lector = LectorShards(directorio or self.output_dir)
+        pendientes = [s for s in lector.shards if manifiesto is None or not manifiesto.archivo_importado(s)]
+        total_filas = sum(lector.filas_de(shard) for shard in pendientes)
+        print(f"Importando {len(pendientes)} de {len(lector.shards)} shards ({total_filas} similitudes) a Neo4j...")
+
+        importador = self._preparar_importador(dirigido, lector.shards, manifiesto)
+        with tqdm(total=total_filas, desc="Importando shards", unit="sim") as pbar:
+            for shard in pendientes:
+                with self.telemetria.medir("importacion_neo4j"):
+                    estadisticas = importador.importar(
+                        (lote for _, lote in lector.iterar_lotes(batch_size, archivos=[shard])), progreso=pbar.update
+                    )
+                self.telemetria.sumar("importacion_neo4j", filas=estadisticas['filas'])
+                if manifiesto is not None:
+                    manifiesto.marcar_importado(shard, estadisticas)
 
         return "Todas las similitudes han sido importadas a Neo4j."
 
-    def guardar_similitudes_en_neo4j(self, similarities, show_progress=True):
+    def guardar_similitudes_en_neo4j(self, similarities, show_progress=True, dirigido=False):
         """Guarda las similitudes calculadas en Neo4j"""
         if not similarities:
             return
@@ -162,84 +635,159 @@ class SimilarityCalculator:
         if show_progress:
             print(f"Almacenando {len(similarities)} similitudes en Neo4j...")
 
-        batch_size = 1000
-        progress_iter = range(0, len(similarities), batch_size)
-
-        if show_progress:
-            progress_iter = tqdm(progress_iter, desc="Guardando en Neo4j", unit="batch")
-
-        for i in progress_iter:
-            batch = similarities[i:i + batch_size]
-
-            query = """
-            UNWIND $batch AS pair
-            MATCH (u1:Usuario {id: pair[0]}), (u2:Usuario {id: pair[1]})
-            MERGE (u1)-[s:SIMILAR]-(u2)
-            SET s.score = pair[2]
-            """
-
-            tries = 0
-            max_tries = 3
-            while tries < max_tries:
-                try:
-                    with self.driver.session() as session:
-                        session.run(query, batch=batch)
-                    break
-                except Exception as e:
-                    tries += 1
-                    if tries == max_tries:
-                        print(f"Error guardando lote después de {max_tries} intentos: {e}")
-                        if batch_size > 100:
-                            smaller_batch_size = batch_size // 2
-                            print(f"Reintentando con lotes de {smaller_batch_size}...")
-                            for j in range(i, min(i + batch_size, len(similarities)), smaller_batch_size):
-                                smaller_batch = similarities[j:j + smaller_batch_size]
-                                try:
-                                    with self.driver.session() as session:
-                                        session.run(query, batch=smaller_batch)
-                                except Exception as e2:
-                                    print(f"Error persistente: {e2}")
-                    else:
-                        print(f"Intento {tries}/{max_tries} fallido. Reintentando...")
-                        time.sleep(1)
+        return self.crear_importador(dirigido).importar([similarities])
 
 
 def main():
     csv_dir = "/Users/tiopipi/Desktop/formateo_datos/valoraciones_chunks"
     csv_pattern = os.path.join(csv_dir, "valoraciones_part_*.csv")
 
-    calculator = SimilarityCalculator(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+    calculator = SimilarityCalculator(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, formato_salida=FORMATO_SALIDA,
+                                      num_escritores=NUM_ESCRITORES_NEO4J, modo_importacion=MODO_IMPORTACION)
+
+    archivos_entrada = sorted(glob.glob(csv_pattern))
+    configuracion = {
+        'engine': SIMILARITY_ENGINE, 'min_peliculas': 3, 'chunk_size': 10, 'csv_batch_size': 10000,
+        'top_k': TOP_K_VECINOS, 'score_minimo': SCORE_MINIMO_VECINOS, 'lsh_bandas': LSH_BANDAS,
+        'lsh_filas': LSH_FILAS, 'num_procesos': NUM_PROCESOS_SIMILITUD, 'formato': FORMATO_SALIDA,
+        'dtype_score': calculator.dtype_score, 'fuera_de_memoria': FUERA_DE_MEMORIA,
+        'presupuesto_mb': PRESUPUESTO_MEMORIA_MB if FUERA_DE_MEMORIA or DIRECTORIO_TRABAJO_DISTRIBUIDO else None,
+        'distribuido': DIRECTORIO_TRABAJO_DISTRIBUIDO
+    }
+    calculator.telemetria = Telemetria(TELEMETRIA, dict(configuracion, streaming=STREAMING_NEO4J))
 
     try:
         start_time = time.time()
 
-        ratings_data = calculator.cargar_valoraciones_desde_csv_parallel(csv_pattern)
+        manifiesto = ManifiestoEjecucion(calculator.output_dir, archivos_entrada, configuracion,
+                                         intervalo_checkpoint=INTERVALO_CHECKPOINT)
+        if manifiesto.reiniciado and DIRECTORIO_TRABAJO_DISTRIBUIDO:
+            reiniciar_trabajo(DIRECTORIO_TRABAJO_DISTRIBUIDO)
+        en_memoria = not (FUERA_DE_MEMORIA or DIRECTORIO_TRABAJO_DISTRIBUIDO)
+        if manifiesto.fase1_completa or not en_memoria:
+            ratings_data = None
+        else:
+            ratings_data = calculator.cargar_valoraciones_columnares(csv_pattern)
+
+        if LSH_BANDAS and ratings_data is not None:
+            calculator.informe_recall_lsh(ratings_data, 3, LSH_BANDAS, LSH_FILAS, score_minimo=SCORE_MINIMO_VECINOS)
+
+        if MOTOR_COMPARACION and ratings_data is not None:
+            calculator.comparar_motores(ratings_data, SIMILARITY_ENGINE, MOTOR_COMPARACION, 3, USUARIOS_COMPARACION)
+
+        if STREAMING_NEO4J and en_memoria and not TOP_K_VECINOS:
+            print(f"\n--- Calculando similitudes e importándolas a Neo4j en streaming (motor: {SIMILARITY_ENGINE}) ---")
+            if ratings_data is None:
+                ratings_data = calculator.cargar_valoraciones_columnares(csv_pattern)
+            calculator.calcular_e_importar_en_streaming(
+                ratings_data,
+                min_peliculas=3,
+                chunk_size=10,
+                engine=SIMILARITY_ENGINE,
+                lsh_bandas=LSH_BANDAS,
+                lsh_filas=LSH_FILAS,
+                num_procesos=NUM_PROCESOS_SIMILITUD,
+                max_lotes_en_cola=MAX_LOTES_EN_COLA
+            )
+            if ESTADISTICAS_PARES:
+                calculator.construir_estadisticas_pares(ratings_data, ESTADISTICAS_PARES)
+            if TOP_K_PELICULAS_SIMILARES:
+                calculator.calcular_peliculas_similares(ratings_data, TOP_K_PELICULAS_SIMILARES,
+                                                        MIN_USUARIOS_PELICULAS_SIMILARES)
+            if DIRECTORIO_MODELO_ALS:
+                calculator.entrenar_modelo_als(ratings_data, DIRECTORIO_MODELO_ALS, FACTORES_ALS, ITERACIONES_ALS)
+            elapsed = time.time() - start_time
+            print(f"Proceso completado en {elapsed:.2f} segundos ({elapsed / 60:.2f} minutos).")
+            return
 
-        print("\n--- Fase 1: Calculando similitudes y guardando en CSV (optimizado con Cython) ---")
-        csv_files = calculator.calcular_similitudes_por_chunks(
-            ratings_data,
-            min_peliculas=3,
-            chunk_size=10,
-            csv_batch_size=10000,
-            num_workers=None
-        )
+        if DIRECTORIO_TRABAJO_DISTRIBUIDO:
+            print(f"\n--- Fase 1: Calculando similitudes con la cola de bloques de {DIRECTORIO_TRABAJO_DISTRIBUIDO} ---")
+            csv_files = calculator.calcular_similitudes_distribuidas(
+                archivos_entrada,
+                DIRECTORIO_TRABAJO_DISTRIBUIDO,
+                min_peliculas=3,
+                presupuesto_mb=PRESUPUESTO_MEMORIA_MB,
+                top_k=TOP_K_VECINOS,
+                score_minimo=SCORE_MINIMO_VECINOS,
+                workers_locales=WORKERS_LOCALES,
+                manifiesto=manifiesto
+            )
+        elif FUERA_DE_MEMORIA:
+            print(f"\n--- Fase 1: Calculando similitudes fuera de memoria ({PRESUPUESTO_MEMORIA_MB} MB por tile) "
+                  f"y guardando en {FORMATO_SALIDA.upper()} ---")
+            csv_files = calculator.calcular_similitudes_fuera_de_memoria(
+                archivos_entrada,
+                min_peliculas=3,
+                presupuesto_mb=PRESUPUESTO_MEMORIA_MB,
+                top_k=TOP_K_VECINOS,
+                score_minimo=SCORE_MINIMO_VECINOS,
+                manifiesto=manifiesto
+            )
+        else:
+            print(f"\n--- Fase 1: Calculando similitudes y guardando en {FORMATO_SALIDA.upper()} "
+                  f"(motor: {SIMILARITY_ENGINE}) ---")
+            csv_files = calculator.calcular_similitudes_por_chunks(
+                ratings_data,
+                min_peliculas=3,
+                chunk_size=10,
+                csv_batch_size=10000,
+                num_workers=None,
+                engine=SIMILARITY_ENGINE,
+                top_k=TOP_K_VECINOS,
+                score_minimo=SCORE_MINIMO_VECINOS,
+                lsh_bandas=LSH_BANDAS,
+                lsh_filas=LSH_FILAS,
+                num_procesos=NUM_PROCESOS_SIMILITUD,
+                manifiesto=manifiesto
+            )
+
+        # El almacén de estadísticos por par necesita todas las valoraciones en memoria
+        if ESTADISTICAS_PARES and en_memoria and (
+                ratings_data is not None or not os.path.exists(ESTADISTICAS_PARES)):
+            if ratings_data is None:
+                ratings_data = calculator.cargar_valoraciones_columnares(csv_pattern)
+            calculator.construir_estadisticas_pares(ratings_data, ESTADISTICAS_PARES)
 
         fase1_time = time.time()
         print(
             f"Fase 1 completada en {fase1_time - start_time:.2f} segundos ({(fase1_time - start_time) / 60:.2f} minutos).")
-        print(f"Se han generado {len(csv_files)} archivos CSV con similitudes.")
-
-        print("\n--- Fase 2: Importando similitudes desde CSV a Neo4j ---")
-        calculator.importar_similitudes_desde_csv_a_neo4j(csv_files)
+        print(f"Se han generado {len(csv_files)} archivos {FORMATO_SALIDA.upper()} con similitudes.")
+
+        print(f"\n--- Fase 2: Importando similitudes desde {FORMATO_SALIDA.upper()} a Neo4j ---")
+        if FORMATO_SALIDA == "npy":
+            calculator.importar_similitudes_desde_shards_a_neo4j(dirigido=TOP_K_VECINOS is not None,
+                                                                 manifiesto=manifiesto)
+        else:
+            calculator.importar_similitudes_desde_csv_a_neo4j(csv_files, dirigido=TOP_K_VECINOS is not None,
+                                                              manifiesto=manifiesto)
+        fase2_time = time.time()
+
+        # Como el almacén de estadísticos, el coseno ajustado trabaja con todas las valoraciones en memoria
+        if TOP_K_PELICULAS_SIMILARES and en_memoria:
+            print(f"\n--- Fase 3: Calculando las {TOP_K_PELICULAS_SIMILARES} películas más similares a cada película ---")
+            if ratings_data is None:
+                ratings_data = calculator.cargar_valoraciones_columnares(csv_pattern)
+            calculator.calcular_peliculas_similares(ratings_data, TOP_K_PELICULAS_SIMILARES,
+                                                    MIN_USUARIOS_PELICULAS_SIMILARES)
+        fase3_time = time.time()
+
+        if DIRECTORIO_MODELO_ALS and en_memoria:
+            print(f"\n--- Fase 4: Entrenando el modelo ALS ({FACTORES_ALS} factores) en {DIRECTORIO_MODELO_ALS} ---")
+            if ratings_data is None:
+                ratings_data = calculator.cargar_valoraciones_columnares(csv_pattern)
+            calculator.entrenar_modelo_als(ratings_data, DIRECTORIO_MODELO_ALS, FACTORES_ALS, ITERACIONES_ALS)
 
         elapsed = time.time() - start_time
         print(f"Proceso completado en {elapsed:.2f} segundos ({elapsed / 60:.2f} minutos).")
-        print(f"- Fase 1 (CSV): {(fase1_time - start_time) / 60:.2f} minutos")
-        print(f"- Fase 2 (Neo4j): {(time.time() - fase1_time) / 60:.2f} minutos")
+        print(f"- Fase 1 ({FORMATO_SALIDA.upper()}): {(fase1_time - start_time) / 60:.2f} minutos")
+        print(f"- Fase 2 (Neo4j): {(fase2_time - fase1_time) / 60:.2f} minutos")
+        print(f"- Fase 3 (películas similares): {(fase3_time - fase2_time) / 60:.2f} minutos")
+        print(f"- Fase 4 (modelo ALS): {(time.time() - fase3_time) / 60:.2f} minutos")
 
     except Exception as e:
         print(f"Error general: {e}")
     finally:
+        calculator.telemetria.escribir()
         calculator.close()
 
 
@@ -0,0 +1,279 @@
+"""
+Importación por lotes a Neo4j (similitudes y carga del grafo) con varios escritores en paralelo.
+
+Para probarlo contra un Neo4j local en un contenedor:
+
+    docker run -d -p 7687:7687 -e NEO4J_AUTH=neo4j/Virt1234* neo4j:5
+    python neo4j_importer.py --directorio similitudes_npy --modo create --escritores 4
+"""
+import argparse
+import queue
+import random
+import threading
+import time
+
+from neo4j import GraphDatabase
+
+QUERY_MERGE = """
+UNWIND $batch AS pair
+MATCH (u1:Usuario {id: pair[0]})
+MATCH (u2:Usuario {id: pair[1]})
+MERGE %s
+SET s.score = pair[2]
+"""
+
+QUERY_CREATE = """
+UNWIND $batch AS pair
+MATCH (u1:Usuario {id: pair[0]})
+MATCH (u2:Usuario {id: pair[1]})
+CREATE (u1)-[:SIMILAR {score: pair[2]}]->(u2)
+"""
+
+# Borrado por lotes en transacciones propias: los grafos con todos los pares similares tienen cientos de millones
+QUERY_BORRAR_SIMILITUDES = """
+MATCH ()-[s:SIMILAR]->()
+CALL { WITH s DELETE s } IN TRANSACTIONS OF $tam_lote ROWS
+"""
+
+_FIN = object()
+
+
+RESTRICCION_USUARIO = "CREATE CONSTRAINT usuario_id_unico IF NOT EXISTS FOR (u:Usuario) REQUIRE u.id IS UNIQUE"
+
+
+def asegurar_restriccion_usuario(session):
+    """
+    Crea la restricción de unicidad de Usuario.id, cuyo índice sirve también a las búsquedas.
+
+    Antes elimina un índice simple sobre Usuario.id (el ``usuario_id`` que creaban versiones
+    anteriores del importador): mientras exista, Neo4j no permite crear la restricción.
+    """
+    indices = session.run(
+        "SHOW RANGE INDEXES YIELD name, labelsOrTypes, properties, owningConstraint "
+        "WHERE labelsOrTypes = ['Usuario'] AND properties = ['id'] AND owningConstraint IS NULL "
+        "RETURN name"
+    ).value()
+    for nombre in indices:
+        session.run(f"DROP INDEX `{nombre}`").consume()
+    session.run(RESTRICCION_USUARIO).consume()
+
+
+class ControladorLotes:
+    """
+    Ajusta el tamaño de lote a partir de la latencia medida de cada escritura.
+
+    Crece mientras los lotes tardan bastante menos que ``latencia_objetivo`` y se reduce
+    a la mitad cuando la superan o cuando una escritura falla.
+    """
+
+    def __init__(self, inicial=1000, minimo=100, maximo=20000, latencia_objetivo=1.0):
+        self.tam = inicial
+        self.minimo = minimo
+        self.maximo = maximo
+        self.latencia_objetivo = latencia_objetivo
+        self._lock = threading.Lock()
+
+    def registrar(self, filas, segundos):
+        with self._lock:
+            if filas < self.tam:
+                return
+            if segundos > self.latencia_objetivo:
+                self.tam = max(self.minimo, self.tam // 2)
+            elif segundos < self.latencia_objetivo / 2:
+                self.tam = min(self.maximo, int(self.tam * 1.5))
+
+    def reducir(self):
+        with self._lock:
+            self.tam = max(self.minimo, self.tam // 2)
+
+
+class ImportadorParalelo:
+    """
+    Escribe en Neo4j lotes de filas con una consulta ``UNWIND $batch`` y un pool de hilos escritores.
+
+    Cada hilo reutiliza su sesión, escribe cada lote en una transacción explícita y
+    reintenta con backoff exponencial; si un lote agota los reintentos se divide en dos.
+    """
+
+    descripcion = "filas"
+
+    def __init__(self, driver, query=None, num_escritores=4, max_reintentos=5, backoff_inicial=0.5,
+                 controlador=None):
+        self.driver = driver
+        self._query = query
+        self.num_escritores = num_escritores
+        self.max_reintentos = max_reintentos
+        self.backoff_inicial = backoff_inicial
+        self.controlador = controlador or ControladorLotes()
+        self._lock = threading.Lock()
+        self._estadisticas = {}
+
+    @property
+    def query(self):
+        return self._query
+
+    def _sumar(self, **valores):
+        with self._lock:
+            for clave, valor in valores.items():
+                self._estadisticas[clave] = self._estadisticas.get(clave, 0) + valor
+
+    def _escribir_lote(self, session, batch):
+        with session.begin_transaction() as tx:
+            tx.run(self.query, batch=batch).consume()
+            tx.commit()
+
+    def _escribir_con_reintentos(self, session, batch):
+        """Escribe un lote; si agota los reintentos lo divide en dos. Devuelve la sesión vigente."""
+        for intento in range(self.max_reintentos):
+            inicio = time.time()
+            try:
+                self._escribir_lote(session, batch)
+                segundos = time.time() - inicio
+                self.controlador.registrar(len(batch), segundos)
+                self._sumar(filas=len(batch), lotes=1)
+                return session
+            except Exception as e:
+                self._sumar(reintentos=1)
+                self.controlador.reducir()
+                espera = self.backoff_inicial * (2 ** intento) * (1 + random.random())
+                print(f"Intento {intento + 1}/{self.max_reintentos} fallido ({e}). Reintentando en {espera:.1f} s...")
+                time.sleep(espera)
+                session.close()
+                session = self.driver.session()
+
+        if len(batch) > 1:
+            mitad = len(batch) // 2
+            session = self._escribir_con_reintentos(session, batch[:mitad])
+            return self._escribir_con_reintentos(session, batch[mitad:])
+
+        print(f"Error persistente guardando la fila {batch[0]}")
+        self._sumar(fallidas=1)
+        return session
+
+    def _escritor(self, cola):
+        session = self.driver.session()
+        try:
+            while True:
+                batch = cola.get()
+                if batch is _FIN:
+                    break
+                session = self._escribir_con_reintentos(session, batch)
+        finally:
+            session.close()
+
+    def importar(self, lotes, progreso=None):
+        """
+        Importa las filas de un iterable de lotes (p. ej. tuplas (user1, user2, similitud)).
+
+        Los lotes de entrada se reagrupan al tamaño que marca el controlador en cada momento.
+
+        Returns:
+            dict: filas, lotes, reintentos, fallidas, segundos y filas_por_segundo
+        """
+        self._estadisticas = {'filas': 0, 'lotes': 0, 'reintentos': 0, 'fallidas': 0}
+        cola = queue.Queue(maxsize=self.num_escritores * 2)
+        escritores = [threading.Thread(target=self._escritor, args=(cola,), daemon=True)
+                      for _ in range(self.num_escritores)]
+        inicio = time.time()
+        for escritor in escritores:
+            escritor.start()
+
+        try:
+            pendientes = []
+            for lote in lotes:
+                pendientes.extend(lote)
+                while len(pendientes) >= self.controlador.tam:
+                    tam = self.controlador.tam
+                    cola.put(pendientes[:tam])
+                    pendientes = pendientes[tam:]
+                    if progreso:
+                        progreso(tam)
+            if pendientes:
+                cola.put(pendientes)
+                if progreso:
+                    progreso(len(pendientes))
+        finally:
+            for _ in escritores:
+                cola.put(_FIN)
+            for escritor in escritores:
+                escritor.join()
+
+        segundos = time.time() - inicio
+        estadisticas = dict(self._estadisticas, segundos=segundos,
+                            filas_por_segundo=self._estadisticas['filas'] / segundos if segundos else 0.0,
+                            tam_lote_final=self.controlador.tam)
+        print(f"Importadas {estadisticas['filas']} {self.descripcion} en {segundos:.2f} segundos "
+              f"({estadisticas['filas_por_segundo']:.0f} filas/s, {estadisticas['reintentos']} reintentos, "
+              f"{estadisticas['fallidas']} fallidas)")
+        return estadisticas
+
+
+class ImportadorSimilitudes(ImportadorParalelo):
+    """
+    Escribe similitudes en Neo4j con un pool de hilos escritores.
+
+    ``modo="create"`` usa CREATE (cargas en una base sin aristas SIMILAR) y ``modo="merge"``
+    mantiene el upsert con MERGE.
+    """
+
+    descripcion = "similitudes"
+
+    def __init__(self, driver, num_escritores=4, modo="merge", dirigido=False, max_reintentos=5,
+                 backoff_inicial=0.5, controlador=None):
+        if modo not in ("merge", "create"):
+            raise ValueError(f"Modo de importación desconocido: {modo}")
+        super().__init__(driver, None, num_escritores, max_reintentos, backoff_inicial, controlador)
+        self.modo = modo
+        self.dirigido = dirigido
+
+    @property
+    def query(self):
+        if self.modo == "create":
+            return QUERY_CREATE
+        return QUERY_MERGE % ("(u1)-[s:SIMILAR]->(u2)" if self.dirigido else "(u1)-[s:SIMILAR]-(u2)")
+
+    def borrar_similitudes(self, tam_lote=50000):
+        """
+        Borra todas las aristas SIMILAR antes de importar listas top-K dirigidas en modo merge.
+
+        Las aristas de una importación sin top-K (un par por arista, en cualquier sentido) no se
+        distinguen de las dirigidas, así que sin este borrado el grafo conservaría las dos
+        representaciones. Las listas top-K sustituyen por completo a las anteriores.
+        """
+        with self.driver.session() as session:
+            resumen = session.run(QUERY_BORRAR_SIMILITUDES, {"tam_lote": tam_lote}).consume()
+        print(f"Borradas {resumen.counters.relationships_deleted} aristas SIMILAR anteriores")
+
+    def asegurar_indice(self):
+        """Asegura el índice sobre Usuario.id que usan las búsquedas de cada par (el de la restricción de unicidad)."""
+        with self.driver.session() as session:
+            asegurar_restriccion_usuario(session)
+
+
+def main():
+    from similarity_shards import LectorShards
+
+    parser = argparse.ArgumentParser(description="Importa shards de similitudes a Neo4j")
+    parser.add_argument("--uri", default="neo4j://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="Virt1234*")
+    parser.add_argument("--directorio", required=True)
+    parser.add_argument("--modo", choices=("merge", "create"), default="merge")
+    parser.add_argument("--escritores", type=int, default=4)
+    parser.add_argument("--dirigido", action="store_true")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(args.uri, auth=(args.user, args.password))
+    try:
+        importador = ImportadorSimilitudes(driver, args.escritores, args.modo, args.dirigido)
+        importador.asegurar_indice()
+        if args.dirigido and args.modo == "merge":
+            importador.borrar_similitudes()
+        lector = LectorShards(args.directorio)
+        importador.importar(lote for _, lote in lector.iterar_lotes())
+    finally:
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
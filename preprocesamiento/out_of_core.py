@@ -0,0 +1,258 @@
+import json
+import math
+import os
+import platform
+import resource
+
+import numpy as np
+from scipy import sparse
+
+from columnar_ratings import iterar_lotes_valoraciones
+from pearson_kernel import KernelPearson
+
+META = "csr.json"
+# Memoria estimada por valoración de un bloque cargado (CSR, copias binaria/centrada y traspuesta del kernel)
+BYTES_POR_VALORACION_EN_MEMORIA = 48
+# Memoria estimada por par candidato de un tile (coordenadas, co-conteo y similitud)
+BYTES_POR_PAR_EN_MEMORIA = 48
+
+
+def _abrir_npy(directorio, nombre, dtype, longitud):
+    return np.lib.format.open_memmap(os.path.join(directorio, nombre), mode="w+", dtype=dtype, shape=(longitud,))
+
+
+def _ids(valores):
+    """Ids enteros como int64 y cualquier otro tipo (ids de IMDb como "tt0111161") como texto."""
+    valores = np.asarray(valores)
+    return valores.astype(np.int64) if np.issubdtype(valores.dtype, np.integer) else valores.astype(str)
+
+
+def volcar_csr_en_disco(archivos, directorio, batch_size=1000000):
+    """
+    Convierte los CSV de valoraciones en una matriz CSR usuario×película en archivos ``.npy``.
+
+    Se trabaja siempre por lotes de ``batch_size`` valoraciones: un primer recorrido guarda el
+    diccionario ordenado de ids de cada lote y copia a un volcado binario los códigos locales
+    a ese diccionario, el segundo los traduce a índices densos globales y cuenta las
+    valoraciones por usuario, el tercero las coloca en su fila y el último ordena cada fila
+    por película conservando la última valoración repetida. Solo los ids de usuarios y
+    películas y el ``indptr`` se mantienen enteros en memoria. Los ids pueden ser enteros o
+    texto, como en ``ValoracionesColumnares``.
+
+    Returns:
+        dict: metadatos de la matriz (num_usuarios, num_peliculas, nnz)
+    """
+    os.makedirs(directorio, exist_ok=True)
+
+    def ruta(nombre):
+        return os.path.join(directorio, nombre)
+
+    usuarios, peliculas = None, None
+    lotes = []
+    total = 0
+    with open(ruta("crudo_usuarios.bin"), "wb") as f_u, open(ruta("crudo_peliculas.bin"), "wb") as f_m, \
+            open(ruta("crudo_ratings.bin"), "wb") as f_r:
+        for lote, (users, movies, ratings) in enumerate(iterar_lotes_valoraciones(archivos, batch_size)):
+            ids_u, codigos_u = np.unique(_ids(users), return_inverse=True)
+            ids_m, codigos_m = np.unique(_ids(movies), return_inverse=True)
+            np.save(ruta(f"ids_usuarios_{lote}.npy"), ids_u)
+            np.save(ruta(f"ids_peliculas_{lote}.npy"), ids_m)
+            usuarios = ids_u if usuarios is None else np.union1d(usuarios, ids_u)
+            peliculas = ids_m if peliculas is None else np.union1d(peliculas, ids_m)
+            codigos_u.astype(np.int32).tofile(f_u)
+            codigos_m.astype(np.int32).tofile(f_m)
+            ratings.astype(np.float32).tofile(f_r)
+            lotes.append((total, total + len(codigos_u)))
+            total += len(codigos_u)
+    if usuarios is None:
+        usuarios, peliculas = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    def traducir(tipo, lote, codigos, globales):
+        return np.searchsorted(globales, np.load(ruta(f"ids_{tipo}_{lote}.npy")))[codigos].astype(np.int32)
+
+    crudo_u = np.memmap(ruta("crudo_usuarios.bin"), dtype=np.int32, mode="r", shape=(total,))
+    crudo_m = np.memmap(ruta("crudo_peliculas.bin"), dtype=np.int32, mode="r", shape=(total,))
+    crudo_r = np.memmap(ruta("crudo_ratings.bin"), dtype=np.float32, mode="r", shape=(total,))
+
+    # Índices densos y valoraciones por usuario
+    idx_u = np.memmap(ruta("idx_usuarios.bin"), dtype=np.int32, mode="w+", shape=(max(total, 1),))
+    conteos = np.zeros(len(usuarios), dtype=np.int64)
+    for lote, (inicio, fin) in enumerate(lotes):
+        u = traducir("usuarios", lote, np.asarray(crudo_u[inicio:fin]), usuarios)
+        idx_u[inicio:fin] = u
+        conteos += np.bincount(u, minlength=len(usuarios))
+
+    indptr = np.zeros(len(usuarios) + 1, dtype=np.int64)
+    np.cumsum(conteos, out=indptr[1:])
+
+    # Colocación de cada valoración en su fila, respetando el orden de lectura dentro de la fila
+    sin_ordenar_m = np.memmap(ruta("filas_peliculas.bin"), dtype=np.int32, mode="w+", shape=(max(total, 1),))
+    sin_ordenar_r = np.memmap(ruta("filas_ratings.bin"), dtype=np.float32, mode="w+", shape=(max(total, 1),))
+    cursor = indptr[:-1].copy()
+    for lote, (inicio, fin) in enumerate(lotes):
+        u = np.asarray(idx_u[inicio:fin])
+        orden = np.argsort(u, kind="stable")
+        u_ordenados = u[orden]
+        rango = np.arange(len(u)) - np.searchsorted(u_ordenados, u_ordenados, side="left")
+        posiciones = cursor[u_ordenados] + rango
+        sin_ordenar_m[posiciones] = traducir("peliculas", lote, np.asarray(crudo_m[inicio:fin]), peliculas)[orden]
+        sin_ordenar_r[posiciones] = crudo_r[inicio:fin][orden]
+        cursor += np.bincount(u, minlength=len(usuarios))
+
+    # Ordenación de las filas por película y eliminación de repeticiones
+    indices = _abrir_npy(directorio, "indices.npy", np.int32, max(total, 1))
+    data = _abrir_npy(directorio, "data.npy", np.float32, max(total, 1))
+    indptr_final = np.zeros_like(indptr)
+    escritas = 0
+    fila = 0
+    while fila < len(usuarios):
+        ultima = max(int(np.searchsorted(indptr, indptr[fila] + batch_size, side="right")) - 1, fila + 1)
+        a, b = indptr[fila], indptr[ultima]
+        filas = np.repeat(np.arange(ultima - fila, dtype=np.int64), conteos[fila:ultima])
+        claves = filas * len(peliculas) + np.asarray(sin_ordenar_m[a:b])
+        orden = np.argsort(claves, kind="stable")
+        claves = claves[orden]
+        conservar = np.ones(len(claves), dtype=bool)
+        conservar[:-1] = claves[:-1] != claves[1:]
+        seleccion = orden[conservar]
+
+        n = len(seleccion)
+        indices[escritas:escritas + n] = np.asarray(sin_ordenar_m[a:b])[seleccion]
+        data[escritas:escritas + n] = np.asarray(sin_ordenar_r[a:b])[seleccion]
+        indptr_final[fila + 1:ultima + 1] = escritas + np.cumsum(np.bincount(filas[seleccion],
+                                                                              minlength=ultima - fila))
+        escritas += n
+        fila = ultima
+
+    indices.flush()
+    data.flush()
+    np.save(ruta("indptr.npy"), indptr_final)
+    np.save(ruta("usuarios.npy"), usuarios)
+    np.save(ruta("peliculas.npy"), peliculas)
+
+    del crudo_u, crudo_m, crudo_r, idx_u, sin_ordenar_m, sin_ordenar_r
+    for temporal in ("crudo_usuarios.bin", "crudo_peliculas.bin", "crudo_ratings.bin", "idx_usuarios.bin",
+                     "filas_peliculas.bin", "filas_ratings.bin"):
+        os.remove(ruta(temporal))
+    for lote in range(len(lotes)):
+        os.remove(ruta(f"ids_usuarios_{lote}.npy"))
+        os.remove(ruta(f"ids_peliculas_{lote}.npy"))
+
+    meta = {'num_usuarios': int(len(usuarios)), 'num_peliculas': int(len(peliculas)), 'nnz': int(escritas)}
+    with open(ruta(META), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class CSREnDisco:
+    """Matriz CSR de valoraciones en archivos ``.npy`` leída con memory-map por bloques de filas."""
+
+    def __init__(self, directorio):
+        with open(os.path.join(directorio, META)) as f:
+            self.meta = json.load(f)
+        nnz = self.meta['nnz']
+        self.indptr = np.load(os.path.join(directorio, "indptr.npy"), mmap_mode="r")
+        self.indices = np.load(os.path.join(directorio, "indices.npy"), mmap_mode="r")[:nnz]
+        self.data = np.load(os.path.join(directorio, "data.npy"), mmap_mode="r")[:nnz]
+        self.user_ids = np.load(os.path.join(directorio, "usuarios.npy"))
+        self.bytes_leidos = 0
+
+    @property
+    def shape(self):
+        return self.meta['num_usuarios'], self.meta['num_peliculas']
+
+    def bloque(self, inicio, fin):
+        """Carga en memoria las filas ``[inicio, fin)`` como una matriz CSR."""
+        indptr = np.array(self.indptr[inicio:fin + 1])
+        a, b = indptr[0], indptr[-1]
+        indices = np.array(self.indices[a:b])
+        data = np.array(self.data[a:b])
+        self.bytes_leidos += indptr.nbytes + indices.nbytes + data.nbytes
+        return sparse.csr_matrix((data, indices, indptr - a), shape=(fin - inicio, self.shape[1]))
+
+
+def planificar_tiles(indptr, presupuesto_bytes):
+    """
+    Divide los usuarios en bloques de filas y enumera los tiles usuario×usuario a calcular.
+
+    Cada tile tiene en memoria dos bloques de filas y sus pares candidatos, así que la mitad
+    del presupuesto limita las valoraciones de un bloque y la otra mitad sus filas.
+
+    Returns:
+        tuple: (lista de bloques (inicio, fin), lista de tiles (i, j) con i <= j)
+    """
+    max_valoraciones = max(int(presupuesto_bytes / 4 / BYTES_POR_VALORACION_EN_MEMORIA), 1)
+    max_filas = max(int(math.sqrt(presupuesto_bytes / 2 / BYTES_POR_PAR_EN_MEMORIA)), 1)
+
+    num_usuarios = len(indptr) - 1
+    bloques = []
+    inicio = 0
+    while inicio < num_usuarios:
+        fin = int(np.searchsorted(indptr, indptr[inicio] + max_valoraciones, side="right")) - 1
+        fin = min(max(fin, inicio + 1), inicio + max_filas, num_usuarios)
+        bloques.append((inicio, fin))
+        inicio = fin
+
+    tiles = [(i, j) for i in range(len(bloques)) for j in range(i, len(bloques))]
+    return bloques, tiles
+
+
+def calcular_tile(bloque_a, bloque_b, inicio_a, inicio_b, min_peliculas=3, num_hilos=None):
+    """
+    Calcula Pearson entre las filas de dos bloques (``bloque_b=None`` para el tile diagonal).
+
+    Returns:
+        tuple: (filas, columnas, pearson) con índices globales y ``fila < columna``
+    """
+    binaria_a = sparse.csr_matrix((np.ones(bloque_a.nnz), bloque_a.indices, bloque_a.indptr), shape=bloque_a.shape)
+    if bloque_b is None:
+        co_conteo = (binaria_a @ binaria_a.T).tocoo()
+        seleccion = (co_conteo.col > co_conteo.row) & (co_conteo.data >= min_peliculas)
+        apilada = bloque_a
+        desplazamiento = 0
+    else:
+        binaria_b = sparse.csr_matrix((np.ones(bloque_b.nnz), bloque_b.indices, bloque_b.indptr),
+                                      shape=bloque_b.shape)
+        co_conteo = (binaria_a @ binaria_b.T).tocoo()
+        seleccion = co_conteo.data >= min_peliculas
+        apilada = sparse.vstack([bloque_a, bloque_b], format="csr")
+        desplazamiento = bloque_a.shape[0]
+
+    filas = co_conteo.row[seleccion]
+    columnas = co_conteo.col[seleccion] + desplazamiento
+    filas, columnas, pearson = KernelPearson(apilada, num_hilos).calcular(filas, columnas, min_peliculas)
+    columnas = columnas - desplazamiento
+    return filas + inicio_a, columnas + (inicio_a if bloque_b is None else inicio_b), pearson
+
+
+def iterar_tiles(csr, presupuesto_bytes, min_peliculas=3, num_hilos=None, omitir=None):
+    """
+    Calcula Pearson tile a tile leyendo del disco solo los bloques de filas de cada tile.
+
+    Args:
+        csr: CSREnDisco con las valoraciones
+        presupuesto_bytes: Memoria objetivo de un tile
+        omitir: Claves de tiles ya calculados en una ejecución anterior
+
+    Yields:
+        tuple: (clave, total de tiles, filas, columnas, pearson) con índices globales de usuario
+    """
+    bloques, tiles = planificar_tiles(np.asarray(csr.indptr), presupuesto_bytes)
+    bloque_a, actual = None, None
+    for i, j in tiles:
+        clave = f"tile-{i}-{j}"
+        if omitir and clave in omitir:
+            continue
+        if actual != i:
+            bloque_a, actual = csr.bloque(*bloques[i]), i
+        bloque_b = None if i == j else csr.bloque(*bloques[j])
+        filas, columnas, pearson = calcular_tile(bloque_a, bloque_b, bloques[i][0], bloques[j][0],
+                                                 min_peliculas, num_hilos)
+        yield clave, len(tiles), filas, columnas, pearson
+
+
+def pico_memoria_mb():
+    """Pico de memoria residente del proceso en MB."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return pico / 1024 ** 2 if platform.system() == "Darwin" else pico / 1024
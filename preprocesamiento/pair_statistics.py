@@ -0,0 +1,286 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+TOLERANCIA_DENOMINADOR = 1e-9
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS valoraciones (
+    usuario,
+    pelicula,
+    rating REAL NOT NULL,
+    PRIMARY KEY (usuario, pelicula)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS valoraciones_pelicula ON valoraciones (pelicula, usuario, rating);
+CREATE TABLE IF NOT EXISTS estadisticas_pares (
+    usuario1,
+    usuario2,
+    n INTEGER NOT NULL,
+    sx REAL NOT NULL,
+    sy REAL NOT NULL,
+    sxx REAL NOT NULL,
+    syy REAL NOT NULL,
+    sxy REAL NOT NULL,
+    PRIMARY KEY (usuario1, usuario2)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS estadisticas_usuario2 ON estadisticas_pares (usuario2);
+"""
+
+QUERY_PUBLICAR_VECINOS = """
+UNWIND $filas AS fila
+MATCH (u:Usuario {id: fila.id})
+OPTIONAL MATCH (u)-[viejo:SIMILAR]->()
+DELETE viejo
+WITH DISTINCT u, fila
+UNWIND fila.vecinos AS vecino
+MATCH (v:Usuario {id: vecino[0]})
+CREATE (u)-[:SIMILAR {score: vecino[1]}]->(v)
+"""
+
+
+def _orden(usuario):
+    # Mismo orden que SQLite: los ids numéricos van antes que los de texto (UUID de la app)
+    return isinstance(usuario, str), usuario
+
+
+def _python(valor):
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+
+def pearson_desde_estadisticas(n, sx, sy, sxx, syy, sxy, min_peliculas=3):
+    """
+    Calcula Pearson a partir de los estadísticos suficientes de cada par.
+
+    Returns:
+        np.ndarray: similitudes en [-1, 1], NaN donde no hay suficientes películas en común
+                    o alguno de los usuarios no tiene varianza
+    """
+    n = np.asarray(n, dtype=np.float64)
+    sx, sy, sxx, syy, sxy = (np.asarray(v, dtype=np.float64) for v in (sx, sy, sxx, syy, sxy))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        numerador = sxy - sx * sy / n
+        den_x = sxx - sx * sx / n
+        den_y = syy - sy * sy / n
+        pearson = numerador / np.sqrt(den_x * den_y)
+    validos = (n >= min_peliculas) & (den_x > TOLERANCIA_DENOMINADOR) & (den_y > TOLERANCIA_DENOMINADOR)
+    return np.where(validos, np.clip(pearson, -1.0, 1.0), np.nan)
+
+
+class EstadisticasPares:
+    """
+    Almacén SQLite con los estadísticos suficientes de Pearson de cada par de usuarios.
+
+    Para cada par con alguna película en común guarda n, Σx, Σy, Σx², Σy² y Σxy sobre las
+    películas en común (x son las valoraciones de ``usuario1``, con ``usuario1 < usuario2``),
+    y una copia de las valoraciones. Una valoración nueva o modificada solo actualiza los
+    pares del usuario con los demás usuarios que valoraron esa película.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self.conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript(ESQUEMA)
+
+    def close(self):
+        self.conexion.close()
+
+    def num_pares(self):
+        return self.conexion.execute("SELECT COUNT(*) FROM estadisticas_pares").fetchone()[0]
+
+    def construir(self, valoraciones, block_size=2000):
+        """
+        Rellena el almacén desde cero a partir de un ``ValoracionesColumnares``.
+
+        Los estadísticos se obtienen por bloques de usuarios con productos de matrices
+        dispersas. Se guardan todos los pares con al menos una película en común, porque
+        un par por debajo de ``min_peliculas`` puede superarlo con valoraciones futuras.
+        """
+        matriz = valoraciones.a_matriz_csr()
+        user_ids = valoraciones.user_ids
+        binaria = matriz.copy()
+        binaria.data[:] = 1.0
+        cuadrados = matriz.copy()
+        cuadrados.data **= 2
+        matriz_t, binaria_t, cuadrados_t = (m.T.tocsr() for m in (matriz, binaria, cuadrados))
+
+        with self._lock, self.conexion:
+            self.conexion.execute("DELETE FROM valoraciones")
+            self.conexion.execute("DELETE FROM estadisticas_pares")
+
+            coo = matriz.tocoo()
+            self.conexion.executemany(
+                "INSERT INTO valoraciones (usuario, pelicula, rating) VALUES (?, ?, ?)",
+                zip(user_ids[coo.row].tolist(), valoraciones.movie_ids[coo.col].tolist(), coo.data.tolist())
+            )
+
+            total_pares = 0
+            for inicio in range(0, matriz.shape[0], block_size):
+                fin = min(inicio + block_size, matriz.shape[0])
+                co_conteo = (binaria[inicio:fin] @ binaria_t).tocoo()
+                posteriores = co_conteo.col > co_conteo.row + inicio
+                filas = co_conteo.row[posteriores]
+                columnas = co_conteo.col[posteriores]
+                if len(filas) == 0:
+                    continue
+
+                x, bx, x2 = matriz[inicio:fin], binaria[inicio:fin], cuadrados[inicio:fin]
+                valores = [co_conteo.data[posteriores]]
+                for producto in (x @ binaria_t, bx @ matriz_t, x2 @ binaria_t, bx @ cuadrados_t, x @ matriz_t):
+                    valores.append(np.asarray(producto.tocsr()[filas, columnas]).ravel())
+
+                self.conexion.executemany(
+                    "INSERT INTO estadisticas_pares (usuario1, usuario2, n, sx, sy, sxx, syy, sxy) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    zip(user_ids[filas + inicio].tolist(), user_ids[columnas].tolist(),
+                        valores[0].astype(np.int64).tolist(), *(v.tolist() for v in valores[1:]))
+                )
+                total_pares += len(filas)
+
+        print(f"Estadísticos de {total_pares} pares de usuarios guardados en {self.ruta}")
+        return total_pares
+
+    def _leer_par(self, usuario1, usuario2):
+        fila = self.conexion.execute(
+            "SELECT n, sx, sy, sxx, syy, sxy FROM estadisticas_pares WHERE usuario1 = ? AND usuario2 = ?",
+            (usuario1, usuario2)
+        ).fetchone()
+        return np.array(fila if fila else (0, 0, 0, 0, 0, 0), dtype=np.float64)
+
+    def actualizar_valoraciones(self, valoraciones, min_peliculas=3):
+        """
+        Aplica valoraciones nuevas o modificadas y actualiza solo los pares afectados.
+
+        Args:
+            valoraciones: Iterable de tuplas (usuario, película, rating)
+
+        Returns:
+            dict: (usuario1, usuario2) -> (similitud anterior, similitud nueva), con NaN
+                  cuando el par no alcanza ``min_peliculas`` o no tiene varianza
+        """
+        anteriores = {}
+        actuales = {}
+        with self._lock, self.conexion:
+            for usuario, pelicula, rating in valoraciones:
+                usuario, pelicula, rating = _python(usuario), _python(pelicula), float(rating)
+                fila = self.conexion.execute(
+                    "SELECT rating FROM valoraciones WHERE usuario = ? AND pelicula = ?", (usuario, pelicula)
+                ).fetchone()
+                anterior = fila[0] if fila else None
+                if anterior == rating:
+                    continue
+
+                otros = self.conexion.execute(
+                    "SELECT usuario, rating FROM valoraciones WHERE pelicula = ? AND usuario <> ?",
+                    (pelicula, usuario)
+                ).fetchall()
+                for otro, y in otros:
+                    if anterior is None:
+                        propio = np.array([1.0, rating, y, rating * rating, y * y, rating * y])
+                    else:
+                        delta = rating - anterior
+                        propio = np.array([0.0, delta, 0.0, rating * rating - anterior * anterior, 0.0, delta * y])
+
+                    if _orden(usuario) < _orden(otro):
+                        par, delta_par = (usuario, otro), propio
+                    else:
+                        # El usuario que cambia es usuario2: sus sumas van en las columnas y
+                        par, delta_par = (otro, usuario), propio[[0, 2, 1, 4, 3, 5]]
+
+                    if par not in actuales:
+                        anteriores[par] = self._leer_par(*par)
+                        actuales[par] = anteriores[par].copy()
+                    actuales[par] += delta_par
+
+                self.conexion.execute(
+                    "INSERT OR REPLACE INTO valoraciones (usuario, pelicula, rating) VALUES (?, ?, ?)",
+                    (usuario, pelicula, rating)
+                )
+
+            if actuales:
+                self.conexion.executemany(
+                    "INSERT OR REPLACE INTO estadisticas_pares (usuario1, usuario2, n, sx, sy, sxx, syy, sxy) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    ((u1, u2, int(round(s[0])), *s[1:].tolist()) for (u1, u2), s in actuales.items())
+                )
+
+        if not actuales:
+            return {}
+        pares = list(actuales)
+        score_anterior = pearson_desde_estadisticas(*np.array([anteriores[p] for p in pares]).T,
+                                                    min_peliculas=min_peliculas)
+        score_nuevo = pearson_desde_estadisticas(*np.array([actuales[p] for p in pares]).T,
+                                                 min_peliculas=min_peliculas)
+        return {par: (float(a), float(b)) for par, a, b in zip(pares, score_anterior, score_nuevo)}
+
+    def vecinos_de(self, usuario, k=50, score_minimo=0.3, min_peliculas=3):
+        """
+        Calcula los ``k`` vecinos más similares de un usuario a partir de sus pares.
+
+        Returns:
+            list: tuplas (vecino, similitud) ordenadas de mayor a menor similitud
+        """
+        usuario = _python(usuario)
+        with self._lock:
+            filas = self.conexion.execute(
+                "SELECT usuario2, n, sx, sy, sxx, syy, sxy FROM estadisticas_pares WHERE usuario1 = ? "
+                "UNION ALL "
+                "SELECT usuario1, n, sy, sx, syy, sxx, sxy FROM estadisticas_pares WHERE usuario2 = ?",
+                (usuario, usuario)
+            ).fetchall()
+        if not filas:
+            return []
+
+        vecinos = [fila[0] for fila in filas]
+        scores = pearson_desde_estadisticas(*np.array([fila[1:] for fila in filas], dtype=np.float64).T,
+                                            min_peliculas=min_peliculas)
+        minimo = -np.inf if score_minimo is None else score_minimo
+        candidatos = np.flatnonzero(np.nan_to_num(scores, nan=-np.inf) > minimo)
+        if len(candidatos) > k:
+            candidatos = candidatos[np.argpartition(-scores[candidatos], k - 1)[:k]]
+        candidatos = candidatos[np.argsort(-scores[candidatos], kind='stable')]
+        return [(vecinos[i], float(scores[i])) for i in candidatos]
+
+
+def usuarios_afectados(cambios, usuarios_modificados=(), score_minimo=0.3):
+    """
+    Devuelve los usuarios cuya lista de vecinos puede haber cambiado.
+
+    Solo las similitudes mayores que ``score_minimo`` entran en una lista de vecinos, así que
+    un par que estaba y sigue por debajo del umbral no altera la lista de ninguno de los dos.
+    """
+    afectados = set(usuarios_modificados)
+    minimo = -np.inf if score_minimo is None else score_minimo
+    for (usuario1, usuario2), (anterior, nuevo) in cambios.items():
+        if np.nan_to_num(anterior, nan=-np.inf) > minimo or np.nan_to_num(nuevo, nan=-np.inf) > minimo:
+            afectados.update((usuario1, usuario2))
+    return afectados
+
+
+def publicar_vecinos(ejecutar_consulta, estadisticas, usuarios, k=50, score_minimo=0.3, min_peliculas=3,
+                     batch_size=500):
+    """
+    Reescribe en Neo4j las aristas (u)-[:SIMILAR]->(vecino) de los usuarios indicados.
+
+    Args:
+        ejecutar_consulta: Función de escritura (query, params), p. ej. ``Neo4jConector.execute_write``
+        estadisticas: EstadisticasPares de donde se leen los vecinos
+
+    Returns:
+        dict: usuario -> número de vecinos publicados
+    """
+    publicados = {}
+    filas = []
+    for usuario in usuarios:
+        vecinos = estadisticas.vecinos_de(usuario, k, score_minimo, min_peliculas)
+        filas.append({'id': usuario, 'vecinos': [[vecino, score] for vecino, score in vecinos]})
+        publicados[usuario] = len(vecinos)
+        if len(filas) >= batch_size:
+            ejecutar_consulta(QUERY_PUBLICAR_VECINOS, {"filas": filas})
+            filas = []
+    if filas:
+        ejecutar_consulta(QUERY_PUBLICAR_VECINOS, {"filas": filas})
+    return publicados
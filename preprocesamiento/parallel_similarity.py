@@ -0,0 +1,147 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy import sparse
+
+from sparse_similarity import calcular_bloque_pearson, trasponer_matrices
+
+# Estado de cada proceso worker: matrices adjuntadas a la memoria compartida
+_worker = {}
+
+
+class MatricesCompartidas:
+    """
+    Publica en memoria compartida los arrays CSR que necesitan los workers.
+
+    Se comparten la matriz centrada y la binaria (que reutilizan ``indices`` e ``indptr``)
+    y sus traspuestas película×usuario, de modo que cada worker las reconstruye sin copias.
+    """
+
+    def __init__(self, centrada, binaria):
+        centrada_t, binaria_t, cuadrados_t = trasponer_matrices(centrada, binaria)
+        arrays = {
+            'data': centrada.data,
+            'unos': binaria.data,
+            'indices': centrada.indices,
+            'indptr': centrada.indptr,
+            't_data': centrada_t.data,
+            't_unos': binaria_t.data,
+            't_cuadrados': cuadrados_t.data,
+            't_indices': centrada_t.indices,
+            't_indptr': centrada_t.indptr,
+        }
+        self.shape = centrada.shape
+        self._segmentos = {}
+        self.descriptor = {'shape': self.shape, 'arrays': {}}
+        try:
+            for nombre, array in arrays.items():
+                segmento = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=segmento.buf)[:] = array
+                self._segmentos[nombre] = segmento
+                self.descriptor['arrays'][nombre] = (segmento.name, array.shape, array.dtype.str)
+        except Exception:
+            self.cerrar()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar()
+
+    def cerrar(self):
+        for segmento in self._segmentos.values():
+            segmento.close()
+            segmento.unlink()
+        self._segmentos = {}
+
+    @staticmethod
+    def adjuntar(descriptor):
+        """Reconstruye (centrada, binaria, traspuestas, segmentos) dentro de un worker."""
+        segmentos = {}
+        arrays = {}
+        for nombre, (shm_name, shape, dtype) in descriptor['arrays'].items():
+            segmento = shared_memory.SharedMemory(name=shm_name)
+            segmentos[nombre] = segmento
+            arrays[nombre] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segmento.buf)
+
+        num_users, num_movies = descriptor['shape']
+        centrada = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                     shape=(num_users, num_movies), copy=False)
+        binaria = sparse.csr_matrix((arrays['unos'], arrays['indices'], arrays['indptr']),
+                                    shape=(num_users, num_movies), copy=False)
+        forma_t = (num_movies, num_users)
+        traspuestas = tuple(
+            sparse.csr_matrix((arrays[datos], arrays['t_indices'], arrays['t_indptr']), shape=forma_t, copy=False)
+            for datos in ('t_data', 't_unos', 't_cuadrados')
+        )
+        return centrada, binaria, traspuestas, segmentos
+
+
+def particionar_por_valoraciones(indptr, valoraciones_por_bloque):
+    """
+    Divide las filas en bloques contiguos con un número similar de valoraciones.
+
+    Returns:
+        list: tuplas (inicio, fin) que cubren todas las filas
+    """
+    num_users = len(indptr) - 1
+    total = int(indptr[-1])
+    valoraciones_por_bloque = max(int(valoraciones_por_bloque), 1)
+    objetivos = np.arange(valoraciones_por_bloque, total, valoraciones_por_bloque)
+    cortes = np.unique(np.concatenate(([0], np.searchsorted(indptr, objetivos), [num_users])))
+    return [(int(inicio), int(fin)) for inicio, fin in zip(cortes[:-1], cortes[1:])]
+
+
+def _inicializar_worker(descriptor, min_peliculas):
+    centrada, binaria, traspuestas, segmentos = MatricesCompartidas.adjuntar(descriptor)
+    _worker.update(centrada=centrada, binaria=binaria, traspuestas=traspuestas, segmentos=segmentos,
+                   min_peliculas=min_peliculas)
+
+
+def _calcular_bloque(tarea):
+    inicio, fin = tarea
+    filas, columnas, pearson = calcular_bloque_pearson(
+        _worker['centrada'], _worker['binaria'], inicio, fin, _worker['min_peliculas'], _worker['traspuestas']
+    )
+    return inicio, fin, filas.astype(np.int32), columnas.astype(np.int32), pearson
+
+
+def iterar_bloques_multiproceso(centrada, binaria, min_peliculas=3, num_procesos=None, bloques_por_proceso=8,
+                                omitir=None):
+    """
+    Calcula los bloques de similitud en un pool de procesos sobre memoria compartida.
+
+    Las tareas son rangos de usuarios con un número parecido de valoraciones; los workers
+    las toman de la cola del pool a medida que terminan, lo que compensa que los primeros
+    bloques del triángulo superior tengan más pares. ``omitir`` contiene los bloques
+    (inicio, fin) ya calculados en una ejecución anterior.
+
+    Yields:
+        tuple: (inicio, fin, filas, columnas, pearson) por bloque terminado, en orden de llegada
+    """
+    if not num_procesos:
+        num_procesos = multiprocessing.cpu_count()
+
+    tareas = particionar_por_valoraciones(centrada.indptr, centrada.nnz / (num_procesos * bloques_por_proceso))
+    if omitir:
+        tareas = [tarea for tarea in tareas if tarea not in omitir]
+
+    with MatricesCompartidas(centrada, binaria) as compartidas:
+        with multiprocessing.Pool(processes=num_procesos, initializer=_inicializar_worker,
+                                  initargs=(compartidas.descriptor, min_peliculas)) as pool:
+            for resultado in pool.imap_unordered(_calcular_bloque, tareas):
+                yield resultado
+
+
+def iterar_similitudes_multiproceso(centrada, binaria, user_ids, min_peliculas=3, num_procesos=None, omitir=None):
+    """
+    Versión multiproceso de ``iterar_similitudes_sparse``.
+
+    Yields:
+        tuple: (inicio, fin, lista de tuplas (user1, user2, similitud)) por bloque
+    """
+    for inicio, fin, filas, columnas, pearson in iterar_bloques_multiproceso(
+            centrada, binaria, min_peliculas, num_procesos, omitir=omitir):
+        yield inicio, fin, list(zip(user_ids[filas].tolist(), user_ids[columnas].tolist(), pearson.tolist()))
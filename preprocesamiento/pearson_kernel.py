@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+from scipy import sparse
+
+from sparse_similarity import centrar_por_usuario, pearson_para_pares
+
+try:
+    from similarity_kernel import pearson_pares_cy
+    KERNEL_COMPILADO = True
+except ImportError:
+    pearson_pares_cy = None
+    KERNEL_COMPILADO = False
+
+PARES_POR_TRAMO_NUMPY = 200000
+
+
+class KernelPearson:
+    """
+    Calcula Pearson entre pares de usuarios de una matriz CSR usuario×película.
+
+    Usa la extensión ``similarity_kernel`` (intersección por mezcla de filas ordenadas, sin
+    GIL y repartida entre hilos OpenMP) cuando está compilada; si no, recurre a una versión
+    vectorizada con NumPy/SciPy que da los mismos resultados.
+    """
+
+    def __init__(self, matriz, num_hilos=None, forzar_numpy=False):
+        """
+        Args:
+            matriz: Matriz dispersa usuario×película con las valoraciones
+            num_hilos: Hilos OpenMP del kernel compilado (por defecto, todos los núcleos)
+            forzar_numpy: Usa la implementación NumPy aunque la extensión esté disponible
+        """
+        matriz = sparse.csr_matrix(matriz, dtype=np.float32)
+        matriz.sort_indices()
+        self.indptr = matriz.indptr.astype(np.int64)
+        self.indices = matriz.indices.astype(np.int32)
+        self.ratings = matriz.data
+        self.num_hilos = num_hilos or os.cpu_count()
+        self.compilado = KERNEL_COMPILADO and not forzar_numpy
+
+        self.binaria = sparse.csr_matrix((np.ones(matriz.nnz), self.indices, self.indptr), shape=matriz.shape)
+        self.binaria_t = self.binaria.T.tocsr()
+        self.centrada = None if self.compilado else centrar_por_usuario(matriz.astype(np.float64))
+
+    @property
+    def descripcion(self):
+        if self.compilado:
+            return f"Cython sin GIL ({self.num_hilos} hilos)"
+        return "NumPy (extensión similarity_kernel no compilada)"
+
+    def pares_candidatos(self, inicio, fin, min_peliculas=3):
+        """
+        Pares (fila, columna) con ``inicio <= fila < fin``, ``fila < columna`` y al menos
+        ``min_peliculas`` películas en común.
+        """
+        co_conteo = (self.binaria[inicio:fin] @ self.binaria_t).tocoo()
+        filas = co_conteo.row + inicio
+        seleccion = (co_conteo.col > filas) & (co_conteo.data >= min_peliculas)
+        return filas[seleccion].astype(np.int32), co_conteo.col[seleccion].astype(np.int32)
+
+    def calcular(self, filas, columnas, min_peliculas=3):
+        """
+        Calcula Pearson para los pares (filas[i], columnas[i]).
+
+        Returns:
+            tuple: (filas, columnas, pearson) de los pares con similitud definida
+        """
+        filas = np.ascontiguousarray(filas, dtype=np.int32)
+        columnas = np.ascontiguousarray(columnas, dtype=np.int32)
+        if not self.compilado:
+            # Por tramos: la versión NumPy materializa las filas de cada par
+            partes = [pearson_para_pares(self.centrada, self.binaria, filas[i:i + PARES_POR_TRAMO_NUMPY],
+                                         columnas[i:i + PARES_POR_TRAMO_NUMPY], min_peliculas)
+                      for i in range(0, len(filas), PARES_POR_TRAMO_NUMPY)]
+            if not partes:
+                return filas, columnas, np.zeros(0)
+            return tuple(np.concatenate(valores) for valores in zip(*partes))
+
+        pearson = pearson_pares_cy(self.indptr, self.indices, self.ratings, filas, columnas,
+                                   min_peliculas, self.num_hilos)
+        # El kernel marca con -2.0 (fuera de [-1, 1]) los pares sin similitud
+        validos = pearson >= -1.0
+        return filas[validos], columnas[validos], pearson[validos]
+
+    def similitudes_bloque(self, inicio, fin, min_peliculas=3):
+        """Pearson entre los usuarios ``[inicio, fin)`` y todos los posteriores con películas en común."""
+        filas, columnas = self.pares_candidatos(inicio, fin, min_peliculas)
+        return self.calcular(filas, columnas, min_peliculas)
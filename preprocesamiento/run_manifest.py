@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+
+ARCHIVO_MANIFIESTO = "run_manifest.json"
+ARCHIVO_VECINOS = "run_vecinos.pkl"
+
+
+def hash_entradas(archivos, configuracion=None, tam_bloque=4 * 1024 * 1024):
+    """Calcula un SHA-256 del contenido de los shards de entrada y de la configuración."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(configuracion or {}, sort_keys=True, default=str).encode())
+    for archivo in sorted(archivos):
+        digest.update(os.path.basename(archivo).encode())
+        with open(archivo, "rb") as f:
+            for bloque in iter(lambda: f.read(tam_bloque), b""):
+                digest.update(bloque)
+    return digest.hexdigest()
+
+
+class ManifiestoEjecucion:
+    """
+    Registro persistente del progreso de las dos fases del pipeline de similitudes.
+
+    Guarda el hash de las entradas, los chunks de usuarios ya calculados, los archivos de
+    salida producidos y el estado de importación de cada uno. Si al reabrir el directorio
+    el hash no coincide (otras valoraciones u otra configuración), se empieza de cero.
+    """
+
+    def __init__(self, directorio, archivos_entrada, configuracion=None, intervalo_checkpoint=60):
+        """
+        Args:
+            directorio: Directorio de salida de la ejecución
+            archivos_entrada: Shards de valoraciones de los que depende el resultado
+            configuracion: Parámetros que cambian el resultado (motor, min_peliculas, top_k...)
+            intervalo_checkpoint: Segundos mínimos entre checkpoints de la fase 1
+        """
+        self.directorio = directorio
+        self.ruta = os.path.join(directorio, ARCHIVO_MANIFIESTO)
+        self.ruta_vecinos = os.path.join(directorio, ARCHIVO_VECINOS)
+        self.intervalo_checkpoint = intervalo_checkpoint
+        self._ultimo_checkpoint = time.time()
+        os.makedirs(directorio, exist_ok=True)
+
+        hash_actual = hash_entradas(archivos_entrada, configuracion)
+        self.datos = self._cargar()
+        # True si se ha descartado el progreso: los directorios de trabajo derivados también deben vaciarse
+        self.reiniciado = self.datos.get('hash_entradas') != hash_actual
+        if self.reiniciado:
+            if self.datos:
+                print("Las entradas o la configuración han cambiado: se descarta el progreso anterior.")
+            self.datos = {
+                'hash_entradas': hash_actual,
+                'configuracion': configuracion or {},
+                'fase1_completa': False,
+                'chunks_completados': [],
+                'archivos': [],
+                'siguiente_batch_id': 1,
+                'importados': {}
+            }
+            if os.path.exists(self.ruta_vecinos):
+                os.remove(self.ruta_vecinos)
+            self.guardar()
+        else:
+            print(f"Reanudando ejecución: {len(self.datos['chunks_completados'])} chunks calculados, "
+                  f"{len(self.datos['importados'])}/{len(self.datos['archivos'])} archivos importados.")
+
+    def _cargar(self):
+        if not os.path.exists(self.ruta):
+            return {}
+        with open(self.ruta) as f:
+            return json.load(f)
+
+    def guardar(self):
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w") as f:
+            json.dump(self.datos, f, indent=2)
+        os.replace(temporal, self.ruta)
+
+    @property
+    def fase1_completa(self):
+        return self.datos['fase1_completa']
+
+    @property
+    def chunks_completados(self):
+        return set(self.datos['chunks_completados'])
+
+    @property
+    def archivos(self):
+        return list(self.datos['archivos'])
+
+    @property
+    def siguiente_batch_id(self):
+        return self.datos['siguiente_batch_id']
+
+    def checkpoint_pendiente(self):
+        """Indica si ha pasado el intervalo mínimo desde el último checkpoint."""
+        return time.time() - self._ultimo_checkpoint >= self.intervalo_checkpoint
+
+    def registrar_progreso(self, chunks, archivos, siguiente_batch_id, vecinos=None):
+        """
+        Marca chunks como calculados junto con los archivos que ya están completos en disco.
+
+        Con top-K los vecinos acumulados se guardan junto con la lista de chunks que contienen,
+        y al reanudar manda esa lista, de modo que ningún chunk se suma dos veces a los heaps.
+        """
+        completados = self.chunks_completados | set(chunks)
+        if vecinos is not None:
+            temporal = self.ruta_vecinos + ".tmp"
+            with open(temporal, "wb") as f:
+                pickle.dump({'chunks': sorted(completados), 'vecinos': vecinos}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, self.ruta_vecinos)
+
+        self.datos['chunks_completados'] = sorted(completados)
+        self.datos['archivos'] = [a for a in self.datos['archivos'] if a not in archivos] + list(archivos)
+        self.datos['siguiente_batch_id'] = siguiente_batch_id
+        self.guardar()
+        self._ultimo_checkpoint = time.time()
+
+    def cargar_vecinos(self):
+        """
+        Devuelve los vecinos top-K del último checkpoint, o None si no hay.
+
+        Los chunks completados pasan a ser exactamente los incluidos en ese checkpoint.
+        """
+        if not os.path.exists(self.ruta_vecinos):
+            self.datos['chunks_completados'] = []
+            return None
+        with open(self.ruta_vecinos, "rb") as f:
+            checkpoint = pickle.load(f)
+        self.datos['chunks_completados'] = checkpoint['chunks']
+        return checkpoint['vecinos']
+
+    def completar_fase1(self, archivos):
+        self.datos['archivos'] = list(archivos)
+        self.datos['fase1_completa'] = True
+        self.guardar()
+        if os.path.exists(self.ruta_vecinos):
+            os.remove(self.ruta_vecinos)
+
+    def archivo_importado(self, archivo):
+        return self.datos['importados'].get(os.path.basename(archivo)) == "importado"
+
+    def marcar_importado(self, archivo, estadisticas=None):
+        self.datos['importados'][os.path.basename(archivo)] = "importado"
+        if estadisticas:
+            self.datos.setdefault('estadisticas_importacion', {})[os.path.basename(archivo)] = estadisticas
+        self.guardar()
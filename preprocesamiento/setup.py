@@ -4,23 +4,30 @@ import numpy
 import platform
 
 extra_compile_args = ["-O3"]
+extra_link_args = []
 
 if platform.system() == "Darwin" and platform.machine() == "arm64":
     extra_compile_args.extend(["-ffast-math"])
 else:
     extra_compile_args.extend(["-march=native", "-ffast-math"])
 
+# El compilador de Apple no trae OpenMP: en macOS el prange del kernel se ejecuta en un solo hilo
+if platform.system() == "Linux":
+    extra_compile_args.append("-fopenmp")
+    extra_link_args.append("-fopenmp")
+
 extensions = [
     Extension(
-        "similarity_calculator",
-        ["similarity_calculator.pyx"],
+        "similarity_kernel",
+        ["similarity_kernel.pyx"],
         include_dirs=[numpy.get_include()],
         extra_compile_args=extra_compile_args,
+        extra_link_args=extra_link_args,
     )
 ]
 
 setup(
-    name="similarity_calculator",
+    name="similarity_kernel",
     ext_modules=cythonize(extensions, language_level=3),
     zip_safe=False,
-)
\ No newline at end of file
+)
@@ -0,0 +1,151 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+ARCHIVO_USUARIOS = "usuarios.npy"
+
+
+def dtype_shard(dtype_score="float32"):
+    """Registro de cada fila de un shard: índices int32 de usuario y similitud float16/float32."""
+    return np.dtype([('usuario1', '<i4'), ('usuario2', '<i4'), ('similitud', np.dtype(dtype_score))])
+
+
+def _guardar_json_atomico(ruta, datos):
+    temporal = ruta + ".tmp"
+    with open(temporal, "w") as f:
+        json.dump(datos, f, indent=2)
+    os.replace(temporal, ruta)
+
+
+class EscritorShards:
+    """
+    Escribe las similitudes como shards ``.npy`` binarios más un manifiesto JSON.
+
+    Cada shard es un array estructurado (usuario1, usuario2, similitud) con índices de
+    usuario; ``usuarios.npy`` guarda el id de cada índice. El manifiesto se reescribe tras
+    cada shard, así que siempre describe archivos completos.
+    """
+
+    def __init__(self, directorio, user_ids, dtype_score="float32", conservar=None):
+        """
+        Args:
+            directorio: Carpeta de salida de los shards
+            user_ids: Ids de usuario ordenados; la posición de cada id es su índice
+            dtype_score: "float32" o "float16"
+            conservar: Al reanudar, shards del manifiesto existente que siguen siendo válidos
+        """
+        self.directorio = directorio
+        self.user_ids = np.asarray(user_ids)
+        self.dtype = dtype_shard(dtype_score)
+        os.makedirs(directorio, exist_ok=True)
+
+        if self.user_ids.dtype == object:
+            ids_guardados = self.user_ids.astype(str)
+        else:
+            ids_guardados = self.user_ids
+        np.save(os.path.join(directorio, ARCHIVO_USUARIOS), ids_guardados)
+
+        self.manifest = {
+            'formato': 'npy',
+            'dtype': [(nombre, self.dtype[nombre].str) for nombre in self.dtype.names],
+            'usuarios': ARCHIVO_USUARIOS,
+            'num_usuarios': len(self.user_ids),
+            'shards': [],
+            'total_filas': 0
+        }
+        ruta_manifest = os.path.join(directorio, MANIFEST)
+        if conservar and os.path.exists(ruta_manifest):
+            validos = {os.path.basename(archivo) for archivo in conservar}
+            with open(ruta_manifest) as f:
+                anteriores = json.load(f)['shards']
+            self.manifest['shards'] = [shard for shard in anteriores if shard['archivo'] in validos]
+            self.manifest['total_filas'] = sum(shard['filas'] for shard in self.manifest['shards'])
+        self._escribir_manifest()
+
+    def _escribir_manifest(self):
+        _guardar_json_atomico(os.path.join(self.directorio, MANIFEST), self.manifest)
+
+    def indices_de(self, ids):
+        """Convierte ids de usuario en índices (los ids deben existir en ``user_ids``)."""
+        return np.searchsorted(self.user_ids, np.asarray(ids, dtype=self.user_ids.dtype))
+
+    def escribir_indices(self, filas, columnas, scores, shard_id):
+        """Escribe un shard a partir de arrays de índices de usuario y similitudes."""
+        registros = np.empty(len(filas), dtype=self.dtype)
+        registros['usuario1'] = filas
+        registros['usuario2'] = columnas
+        registros['similitud'] = scores
+
+        nombre = f"similitudes_shard_{shard_id}.npy"
+        ruta = os.path.join(self.directorio, nombre)
+        np.save(ruta, registros)
+        return self._agregar_al_manifest(nombre, len(registros))
+
+    def registrar_shard(self, origen, shard_id):
+        """Copia al directorio y añade al manifiesto un shard ya escrito con los mismos índices de usuario."""
+        registros = np.load(origen, mmap_mode='r')
+        if registros.dtype != self.dtype:
+            raise ValueError(f"El shard {origen} tiene dtype {registros.dtype}, se esperaba {self.dtype}")
+        nombre = f"similitudes_shard_{shard_id}.npy"
+        shutil.copyfile(origen, os.path.join(self.directorio, nombre))
+        return self._agregar_al_manifest(nombre, len(registros))
+
+    def _agregar_al_manifest(self, nombre, filas):
+        ruta = os.path.join(self.directorio, nombre)
+        self.manifest['shards'] = [shard for shard in self.manifest['shards'] if shard['archivo'] != nombre]
+        self.manifest['shards'].append({'archivo': nombre, 'filas': int(filas), 'bytes': os.path.getsize(ruta)})
+        self.manifest['total_filas'] = sum(shard['filas'] for shard in self.manifest['shards'])
+        self._escribir_manifest()
+        return ruta
+
+    def escribir(self, similitudes, shard_id):
+        """Escribe un shard a partir de tuplas (user1, user2, similitud)."""
+        if not similitudes:
+            return None
+        users1, users2, scores = zip(*similitudes)
+        return self.escribir_indices(self.indices_de(users1), self.indices_de(users2), scores, shard_id)
+
+
+class LectorShards:
+    """Lee con memory-map los shards descritos en un manifiesto de ``EscritorShards``."""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        with open(os.path.join(directorio, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.user_ids = np.load(os.path.join(directorio, self.manifest['usuarios']), mmap_mode='r')
+
+    @property
+    def shards(self):
+        return [shard['archivo'] for shard in self.manifest['shards']]
+
+    @property
+    def total_filas(self):
+        return self.manifest['total_filas']
+
+    def filas_de(self, archivo):
+        return next(shard['filas'] for shard in self.manifest['shards'] if shard['archivo'] == archivo)
+
+    def abrir(self, archivo):
+        """Devuelve el array estructurado del shard mapeado en memoria."""
+        return np.load(os.path.join(self.directorio, archivo), mmap_mode='r')
+
+    def iterar_lotes(self, batch_size=5000, archivos=None):
+        """
+        Genera lotes listos para Neo4j a partir de los shards.
+
+        Yields:
+            tuple: (archivo, lista de tuplas (user1, user2, similitud) con los ids originales)
+        """
+        for archivo in archivos or self.shards:
+            registros = self.abrir(archivo)
+            for inicio in range(0, len(registros), batch_size):
+                lote = registros[inicio:inicio + batch_size]
+                yield archivo, list(zip(
+                    self.user_ids[lote['usuario1']].tolist(),
+                    self.user_ids[lote['usuario2']].tolist(),
+                    lote['similitud'].astype(np.float64).tolist()
+                ))
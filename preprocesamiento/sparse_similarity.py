@@ -0,0 +1,203 @@
+import numpy as np
+
+from columnar_ratings import ValoracionesColumnares
+
+TOLERANCIA_DENOMINADOR = 1e-9
+
+
+def construir_matriz_csr(ratings_data):
+    """
+    Construye la matriz dispersa usuario×película a partir de las valoraciones.
+
+    Acepta un ``ValoracionesColumnares`` o una lista de tuplas (user_id, movie_id, rating).
+    Los usuarios se ordenan por id, de modo que el orden de las filas coincide con
+    la regla ``user1 < user2`` del motor por pares. Si un usuario valora varias veces
+    la misma película se conserva la última valoración, igual que en el diccionario
+    de ``calcular_similitudes_por_chunks``.
+
+    Returns:
+        tuple: (matriz CSR float64, array con el id de usuario de cada fila)
+    """
+    if not isinstance(ratings_data, ValoracionesColumnares):
+        ratings_data = ValoracionesColumnares.desde_tuplas(ratings_data)
+    return ratings_data.a_matriz_csr(), ratings_data.user_ids
+
+
+def centrar_por_usuario(matriz):
+    """
+    Resta a cada fila la media de sus valoraciones.
+
+    Pearson sobre las películas en común no cambia al desplazar todas las valoraciones
+    de un usuario, así que el centrado solo sirve para reducir la cancelación numérica
+    en las sumas de cuadrados.
+    """
+    centrada = matriz.copy()
+    conteos = np.diff(centrada.indptr)
+    sumas = np.add.reduceat(centrada.data, centrada.indptr[:-1]) if centrada.nnz else np.zeros(0)
+    medias = np.zeros(centrada.shape[0])
+    con_datos = conteos > 0
+    medias[con_datos] = sumas[con_datos] / conteos[con_datos]
+    centrada.data -= np.repeat(medias, conteos)
+    return centrada
+
+
+def _valores_en(matriz, filas, columnas):
+    """Extrae los valores de ``matriz`` en las coordenadas dadas (0 si no hay entrada)."""
+    if len(filas) == 0:
+        return np.zeros(0)
+    return np.asarray(matriz[filas, columnas]).ravel()
+
+
+def calcular_bloque_pearson(centrada, binaria, inicio, fin, min_peliculas=3, traspuestas=None):
+    """
+    Calcula Pearson entre los usuarios ``[inicio, fin)`` y todos los usuarios posteriores.
+
+    Las medias se toman sobre las películas en común, como en el kernel Cython, a partir
+    de los estadísticos suficientes obtenidos con productos de matrices dispersas.
+
+    Args:
+        traspuestas: Opcional, (centrada, binaria, cuadrados) ya traspuestas a CSR película×usuario.
+                     Evita copiar la cola de la matriz en cada bloque a cambio de multiplicar
+                     contra todas las columnas.
+
+    Returns:
+        tuple: (filas, columnas, pearson) con índices globales y ``fila < columna``
+    """
+    x = centrada[inicio:fin]
+    bx = binaria[inicio:fin]
+    if traspuestas is None:
+        y_t = centrada[inicio:].T
+        by_t = binaria[inicio:].T
+        y2_t = y_t.multiply(y_t)
+        desplazamiento = inicio
+    else:
+        y_t, by_t, y2_t = traspuestas
+        desplazamiento = 0
+
+    co_conteo = (bx @ by_t).tocoo()
+    filas_locales = co_conteo.row
+    columnas_locales = co_conteo.col
+    n = co_conteo.data
+
+    mascara = (n >= min_peliculas) & (columnas_locales + desplazamiento > filas_locales + inicio)
+    filas_locales = filas_locales[mascara]
+    columnas_locales = columnas_locales[mascara]
+    n = n[mascara]
+
+    suma_x = _valores_en((x @ by_t).tocsr(), filas_locales, columnas_locales)
+    suma_y = _valores_en((bx @ y_t).tocsr(), filas_locales, columnas_locales)
+    suma_xx = _valores_en((x.multiply(x) @ by_t).tocsr(), filas_locales, columnas_locales)
+    suma_yy = _valores_en((bx @ y2_t).tocsr(), filas_locales, columnas_locales)
+    suma_xy = _valores_en((x @ y_t).tocsr(), filas_locales, columnas_locales)
+
+    numerador = suma_xy - suma_x * suma_y / n
+    denom1 = suma_xx - suma_x * suma_x / n
+    denom2 = suma_yy - suma_y * suma_y / n
+
+    validos = (denom1 > TOLERANCIA_DENOMINADOR) & (denom2 > TOLERANCIA_DENOMINADOR)
+    pearson = numerador[validos] / (np.sqrt(denom1[validos]) * np.sqrt(denom2[validos]))
+    np.clip(pearson, -1.0, 1.0, out=pearson)
+
+    return filas_locales[validos] + inicio, columnas_locales[validos] + desplazamiento, pearson
+
+
+def pearson_para_pares(centrada, binaria, filas, columnas, min_peliculas=3):
+    """
+    Calcula Pearson solo para la lista de pares (filas[i], columnas[i]).
+
+    Usa productos elemento a elemento entre filas dispersas, de modo que el coste es
+    proporcional a las valoraciones de los usuarios implicados y no al total de pares.
+
+    Returns:
+        tuple: (filas, columnas, pearson) de los pares con al menos ``min_peliculas`` en común
+    """
+    filas = np.asarray(filas, dtype=np.int64)
+    columnas = np.asarray(columnas, dtype=np.int64)
+    if len(filas) == 0:
+        return filas, columnas, np.zeros(0)
+
+    x, y = centrada[filas], centrada[columnas]
+    bx, by = binaria[filas], binaria[columnas]
+
+    def suma_por_fila(a, b):
+        return np.asarray(a.multiply(b).sum(axis=1)).ravel()
+
+    n = suma_por_fila(bx, by)
+    suma_x = suma_por_fila(x, by)
+    suma_y = suma_por_fila(bx, y)
+    suma_xx = suma_por_fila(x.multiply(x), by)
+    suma_yy = suma_por_fila(bx, y.multiply(y))
+    suma_xy = suma_por_fila(x, y)
+
+    alcanza = n >= min_peliculas
+    n = np.where(alcanza, n, 1)
+    denom1 = suma_xx - suma_x * suma_x / n
+    denom2 = suma_yy - suma_y * suma_y / n
+    validos = alcanza & (denom1 > TOLERANCIA_DENOMINADOR) & (denom2 > TOLERANCIA_DENOMINADOR)
+
+    numerador = suma_xy[validos] - suma_x[validos] * suma_y[validos] / n[validos]
+    pearson = numerador / (np.sqrt(denom1[validos]) * np.sqrt(denom2[validos]))
+    np.clip(pearson, -1.0, 1.0, out=pearson)
+
+    return filas[validos], columnas[validos], pearson
+
+
+def preparar_matrices(ratings_data):
+    """Devuelve (centrada, binaria, user_ids) listas para los kernels dispersos."""
+    matriz, user_ids = construir_matriz_csr(ratings_data)
+    centrada = centrar_por_usuario(matriz)
+    binaria = matriz.copy()
+    binaria.data = np.ones_like(binaria.data)
+    return centrada, binaria, user_ids
+
+
+def trasponer_matrices(centrada, binaria):
+    """
+    Devuelve (centrada, binaria, cuadrados) traspuestas a CSR película×usuario.
+
+    Las tres comparten la estructura de la centrada (incluidos sus ceros explícitos).
+    """
+    centrada_t = centrada.T.tocsr()
+    binaria_t = centrada_t.copy()
+    binaria_t.data = np.ones_like(binaria_t.data)
+    cuadrados_t = centrada_t.copy()
+    cuadrados_t.data = cuadrados_t.data * cuadrados_t.data
+    return centrada_t, binaria_t, cuadrados_t
+
+
+def iterar_similitudes_sparse(centrada, binaria, user_ids, min_peliculas=3, block_size=1000, omitir=None):
+    """
+    Genera, bloque a bloque, las similitudes de Pearson entre todos los pares de usuarios.
+
+    omitir: Bloques (inicio, fin) ya calculados en una ejecución anterior.
+
+    Yields:
+        tuple: (inicio, fin, lista de tuplas (user1, user2, similitud)) por bloque
+    """
+    total_users = centrada.shape[0]
+    for inicio in range(0, total_users, block_size):
+        fin = min(inicio + block_size, total_users)
+        if omitir and (inicio, fin) in omitir:
+            continue
+        filas, columnas, pearson = calcular_bloque_pearson(centrada, binaria, inicio, fin, min_peliculas)
+        similitudes = list(zip(user_ids[filas].tolist(), user_ids[columnas].tolist(), pearson.tolist()))
+        yield inicio, fin, similitudes
+
+
+def comparar_similitudes(referencia, candidatas, tolerancia=1e-6):
+    """
+    Compara dos listas de similitudes (user1, user2, similitud) generadas por motores distintos.
+
+    Returns:
+        dict: pares que faltan, pares sobrantes y diferencia máxima en los pares comunes
+    """
+    ref = {(u1, u2): s for u1, u2, s in referencia}
+    cand = {(u1, u2): s for u1, u2, s in candidatas}
+    comunes = ref.keys() & cand.keys()
+    diferencia_maxima = max((abs(ref[p] - cand[p]) for p in comunes), default=0.0)
+    return {
+        'faltan': len(ref.keys() - cand.keys()),
+        'sobran': len(cand.keys() - ref.keys()),
+        'diferencia_maxima': diferencia_maxima,
+        'coinciden': diferencia_maxima <= tolerancia and len(ref) == len(cand) == len(comunes)
+    }
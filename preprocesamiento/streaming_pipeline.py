@@ -0,0 +1,147 @@
+"""
+Cálculo de similitudes e importación a Neo4j solapados en un pipeline productor/consumidor.
+
+Un hilo productor recorre el generador de lotes de un motor de similitud y los deja en una
+cola acotada; el importador (``ImportadorSimilitudes``) los va tomando y los reparte entre
+sus hilos escritores mientras el cálculo continúa. Cuando Neo4j va por detrás la cola se
+llena y el productor se bloquea (contrapresión), así que en memoria nunca hay más de
+``max_lotes_en_cola`` lotes pendientes de escribir.
+"""
+import queue
+import threading
+import time
+
+_FIN = object()
+
+
+class MetricasEtapa:
+    """Contadores de una etapa del pipeline: lotes, filas, tiempo trabajando y tiempo esperando."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.lotes = 0
+        self.filas = 0
+        self.segundos_trabajo = 0.0
+        self.segundos_espera = 0.0
+
+    def resumen(self):
+        return {
+            'lotes': self.lotes,
+            'filas': self.filas,
+            'segundos_trabajo': self.segundos_trabajo,
+            'segundos_espera': self.segundos_espera,
+            'filas_por_segundo': self.filas / self.segundos_trabajo if self.segundos_trabajo else 0.0,
+        }
+
+
+class PipelineStreaming:
+    """
+    Solapa el cálculo de similitudes con su importación a Neo4j.
+
+    Métricas por etapa:
+        cálculo: filas/s mientras calcula y segundos bloqueado por contrapresión
+        cola: retardo (lag) medio y máximo de un lote entre que se calcula y se entrega al importador
+        importación: filas/s de los escritores y segundos esperando datos del cálculo
+    """
+
+    def __init__(self, importador, max_lotes_en_cola=8, intervalo_informe=30):
+        """
+        Args:
+            importador: ImportadorSimilitudes que consume los lotes
+            max_lotes_en_cola: Lotes calculados que pueden esperar a Neo4j antes de frenar el cálculo
+            intervalo_informe: Segundos entre dos líneas de progreso
+        """
+        self.importador = importador
+        self.max_lotes_en_cola = max_lotes_en_cola
+        self.intervalo_informe = intervalo_informe
+        self.calculo = MetricasEtapa("cálculo")
+        self.importacion = MetricasEtapa("importación")
+        self._lags = []
+        self._ocupacion_maxima = 0
+        self._error = None
+
+    def _producir(self, lotes, cola):
+        try:
+            iterador = iter(lotes)
+            while True:
+                inicio = time.time()
+                try:
+                    _, _, similitudes = next(iterador)
+                except StopIteration:
+                    break
+                self.calculo.segundos_trabajo += time.time() - inicio
+                self.calculo.lotes += 1
+                self.calculo.filas += len(similitudes)
+
+                inicio = time.time()
+                cola.put((time.time(), similitudes))
+                self.calculo.segundos_espera += time.time() - inicio
+                self._ocupacion_maxima = max(self._ocupacion_maxima, cola.qsize())
+        except Exception as e:
+            self._error = e
+        finally:
+            cola.put(_FIN)
+
+    def _consumir(self, cola, inicio_pipeline):
+        ultimo_informe = time.time()
+        while True:
+            inicio = time.time()
+            elemento = cola.get()
+            self.importacion.segundos_espera += time.time() - inicio
+            if elemento is _FIN:
+                return
+
+            producido, similitudes = elemento
+            self._lags.append(time.time() - producido)
+            self.importacion.lotes += 1
+            self.importacion.filas += len(similitudes)
+            yield similitudes
+
+            if time.time() - ultimo_informe >= self.intervalo_informe:
+                ultimo_informe = time.time()
+                print(f"[streaming {ultimo_informe - inicio_pipeline:.0f} s] calculadas {self.calculo.filas}, "
+                      f"entregadas a Neo4j {self.importacion.filas}, en cola {cola.qsize()}/{self.max_lotes_en_cola} "
+                      f"lotes, cálculo bloqueado {self.calculo.segundos_espera:.1f} s")
+
+    def ejecutar(self, lotes, progreso=None):
+        """
+        Calcula e importa los lotes (clave, descripción, similitudes) de ``lotes``.
+
+        Returns:
+            dict: métricas de cada etapa, estadísticas del importador y tiempo total
+        """
+        cola = queue.Queue(maxsize=self.max_lotes_en_cola)
+        inicio = time.time()
+        productor = threading.Thread(target=self._producir, args=(lotes, cola), daemon=True)
+        productor.start()
+
+        estadisticas = self.importador.importar(self._consumir(cola, inicio), progreso=progreso)
+        productor.join()
+        if self._error is not None:
+            raise self._error
+
+        segundos = time.time() - inicio
+        metricas = {
+            'segundos': segundos,
+            'calculo': self.calculo.resumen(),
+            'cola': {
+                'lag_medio': sum(self._lags) / len(self._lags) if self._lags else 0.0,
+                'lag_maximo': max(self._lags, default=0.0),
+                'ocupacion_maxima': self._ocupacion_maxima,
+                'capacidad': self.max_lotes_en_cola,
+            },
+            'importacion': dict(estadisticas, segundos_espera=self.importacion.segundos_espera),
+        }
+        self.informe(metricas)
+        return metricas
+
+    @staticmethod
+    def informe(metricas):
+        calculo, cola, importacion = metricas['calculo'], metricas['cola'], metricas['importacion']
+        print(f"Pipeline en streaming completado en {metricas['segundos']:.2f} segundos")
+        print(f"- Cálculo: {calculo['filas']} similitudes en {calculo['lotes']} lotes, "
+              f"{calculo['filas_por_segundo']:.0f} filas/s, {calculo['segundos_espera']:.1f} s bloqueado por Neo4j")
+        print(f"- Cola: lag medio {cola['lag_medio']:.2f} s, máximo {cola['lag_maximo']:.2f} s, "
+              f"ocupación máxima {cola['ocupacion_maxima']}/{cola['capacidad']} lotes")
+        print(f"- Importación: {importacion['filas']} similitudes, {importacion['filas_por_segundo']:.0f} filas/s, "
+              f"{importacion['segundos_espera']:.1f} s esperando al cálculo")
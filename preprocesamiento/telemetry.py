@@ -0,0 +1,136 @@
+"""
+Telemetría por etapa del pipeline de similitudes en un archivo JSONL.
+
+Cada etapa (carga, organización, generación de pares, cálculo, escritura de shards,
+importación a Neo4j...) acumula tiempo de reloj, tiempo de CPU, pico de memoria residente y
+contadores de pares, filas y bytes; al final de la ejecución se escribe una línea JSON por
+etapa, de modo que se pueden comparar motores y configuraciones entre ejecuciones:
+
+    import pandas as pd
+    pd.read_json("telemetria.jsonl", lines=True).pivot_table(index="ejecucion", columns="etapa", values="segundos")
+"""
+import json
+import os
+import platform
+import resource
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from out_of_core import pico_memoria_mb
+
+CONTADORES = ("filas", "pares_evaluados", "pares_guardados", "bytes_escritos")
+
+
+def _reiniciar_pico_rss():
+    """Reinicia el pico de memoria del proceso (VmHWM) para medirlo por etapa; solo en Linux."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _pico_rss_mb():
+    if platform.system() == "Linux":
+        try:
+            with open("/proc/self/status") as f:
+                for linea in f:
+                    if linea.startswith("VmHWM:"):
+                        return int(linea.split()[1]) / 1024
+        except OSError:
+            pass
+    return pico_memoria_mb()
+
+
+def _cpu_segundos():
+    """CPU de todos los hilos del proceso más la de los procesos hijos ya terminados."""
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + hijos.ru_utime + hijos.ru_stime
+
+
+class Telemetria:
+    """
+    Acumula métricas por etapa y las escribe en ``ruta`` (JSONL, en modo append).
+
+    Sin ``ruta`` se miden las etapas igualmente pero no se escribe nada. Si el pico de
+    memoria no se puede reiniciar (fuera de Linux), ``pico_rss_mb`` es el pico del proceso
+    hasta el final de la etapa.
+    """
+
+    def __init__(self, ruta=None, configuracion=None):
+        self.ruta = ruta
+        self.configuracion = configuracion or {}
+        self.ejecucion = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.etapas = {}
+        self._activas = 0
+        self._lock = threading.Lock()
+
+    def _etapa(self, nombre):
+        if nombre not in self.etapas:
+            self.etapas[nombre] = dict({c: 0 for c in CONTADORES}, segundos=0.0, cpu_segundos=0.0, pico_rss_mb=0.0)
+        return self.etapas[nombre]
+
+    @contextmanager
+    def medir(self, nombre):
+        """Acumula en la etapa ``nombre`` el tiempo y la memoria del bloque ``with``."""
+        with self._lock:
+            # Con otra medición abierta no se reinicia el pico: se perdería el suyo
+            if self._activas == 0:
+                _reiniciar_pico_rss()
+            self._activas += 1
+        inicio, inicio_cpu = time.time(), _cpu_segundos()
+        try:
+            yield
+        finally:
+            segundos, cpu = time.time() - inicio, _cpu_segundos() - inicio_cpu
+            with self._lock:
+                self._activas -= 1
+                etapa = self._etapa(nombre)
+                etapa['segundos'] += segundos
+                etapa['cpu_segundos'] += cpu
+                etapa['pico_rss_mb'] = max(etapa['pico_rss_mb'], _pico_rss_mb())
+
+    def medir_iterador(self, nombre, iterable, contar=None):
+        """Mide en ``nombre`` la producción de cada elemento; ``contar(elemento)`` devuelve sus contadores."""
+        iterador = iter(iterable)
+        while True:
+            with self.medir(nombre):
+                try:
+                    elemento = next(iterador)
+                except StopIteration:
+                    return
+            if contar is not None:
+                self.sumar(nombre, **contar(elemento))
+            yield elemento
+
+    def sumar(self, nombre, **contadores):
+        """Suma contadores (filas, pares_evaluados, pares_guardados, bytes_escritos) a una etapa."""
+        with self._lock:
+            etapa = self._etapa(nombre)
+            for clave, valor in contadores.items():
+                etapa[clave] = etapa.get(clave, 0) + int(valor)
+
+    def escribir(self):
+        """Escribe una línea por etapa medida y vacía las etapas."""
+        with self._lock:
+            etapas, self.etapas = self.etapas, {}
+        lineas = []
+        for nombre, etapa in etapas.items():
+            filas = etapa['filas'] or etapa['pares_guardados']
+            lineas.append(dict(
+                {'ejecucion': self.ejecucion, 'etapa': nombre, 'fecha': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                **etapa, filas_por_segundo=filas / etapa['segundos'] if etapa['segundos'] else 0.0,
+                configuracion=self.configuracion
+            ))
+        if self.ruta and lineas:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                for linea in lineas:
+                    f.write(json.dumps(linea, ensure_ascii=False, default=str) + "\n")
+        for linea in lineas:
+            print(f"[telemetría] {linea['etapa']}: {linea['segundos']:.2f} s, CPU {linea['cpu_segundos']:.2f} s, "
+                  f"pico {linea['pico_rss_mb']:.0f} MB, {linea['filas_por_segundo']:.0f} filas/s")
+        return lineas
@@ -0,0 +1,67 @@
+import heapq
+
+
+class TopKNeighbors:
+    """
+    Mantiene, para cada usuario, un heap acotado con sus K vecinos más similares.
+
+    Cada par (user1, user2, similitud) se ofrece a los heaps de ambos usuarios, de modo
+    que el resultado son listas de vecinos dirigidas (usuario -> vecino) sin depender del
+    orden en que se calcularon los pares.
+    """
+
+    def __init__(self, k=50, score_minimo=0.3):
+        """
+        Args:
+            k: Número máximo de vecinos que se conservan por usuario
+            score_minimo: Solo se conservan similitudes estrictamente mayores (None para no filtrar)
+        """
+        if k <= 0:
+            raise ValueError("k debe ser mayor que 0")
+        self.k = k
+        self.score_minimo = score_minimo
+        self._heaps = {}
+
+    def __len__(self):
+        return len(self._heaps)
+
+    def _empujar(self, usuario, vecino, score):
+        heap = self._heaps.get(usuario)
+        if heap is None:
+            heap = self._heaps[usuario] = []
+        if len(heap) < self.k:
+            heapq.heappush(heap, (score, vecino))
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, (score, vecino))
+
+    def agregar(self, user1, user2, score):
+        """Ofrece un par de usuarios similares a los heaps de ambos."""
+        if self.score_minimo is not None and score <= self.score_minimo:
+            return
+        self._empujar(user1, user2, score)
+        self._empujar(user2, user1, score)
+
+    def agregar_similitudes(self, similitudes):
+        """Ofrece una lista de tuplas (user1, user2, similitud)."""
+        for user1, user2, score in similitudes:
+            self.agregar(user1, user2, score)
+
+    def combinar(self, otro):
+        """Incorpora los vecinos de otro TopKNeighbors (p. ej. calculado en otro proceso)."""
+        for usuario, heap in otro._heaps.items():
+            for score, vecino in heap:
+                if self.score_minimo is None or score > self.score_minimo:
+                    self._empujar(usuario, vecino, score)
+
+    def vecinos(self, usuario):
+        """Devuelve los vecinos de un usuario ordenados por similitud descendente."""
+        return [(vecino, score) for score, vecino in sorted(self._heaps.get(usuario, []), reverse=True)]
+
+    def aristas(self):
+        """Genera las aristas dirigidas (usuario, vecino, similitud), K como máximo por usuario."""
+        for usuario in self._heaps:
+            for vecino, score in self.vecinos(usuario):
+                yield usuario, vecino, score
+
+    def num_aristas(self):
+        return sum(len(heap) for heap in self._heaps.values())
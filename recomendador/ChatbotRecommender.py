@@ -29,13 +29,11 @@ class ChatbotRecommender:
         if found_spanish_genres:
             criteria_dict['genero'] = found_spanish_genres
         else:
-            allowed_genres = self.system.get_all_genres()
-            found_genres = [genre for genre in allowed_genres if genre.lower() in query]
+            found_genres = self.system.catalog.find_genres(query)
             if found_genres:
                 criteria_dict['genero'] = found_genres
 
-        allowed_directors = self.system.get_all_directors()
-        found_directors = [director for director in allowed_directors if director.lower() in query]
+        found_directors = self.system.catalog.find_directors(query)
         if found_directors:
             criteria_dict['director'] = found_directors
 
@@ -64,35 +62,12 @@ class ChatbotRecommender:
 
     def _get_movie_ids(self, movie_titles):
         """
-        Obtiene los IDs de películas a partir de sus títulos consultando la base de datos.
+        Obtiene los IDs de películas a partir de sus títulos en el catálogo en memoria: primero
+        coincidencias exactas y, si no hay, hasta 3 títulos que los contengan.
         """
         if not movie_titles:
             return []
-
-        query = """
-        MATCH (p:Pelicula)
-        WHERE p.titulo IN $titulos
-        RETURN p.id AS id, p.titulo AS titulo
-        """
-
-        result = self.system.execute_query(query, {"titulos": movie_titles})
-
-        movie_ids = []
-        for record in result:
-            if record.get("id"):
-                movie_ids.append(record["id"])
-
-        if not movie_ids:
-            partial_query = """
-            MATCH (p:Pelicula)
-            WHERE any(titulo IN $titulos WHERE p.titulo CONTAINS titulo OR toLower(p.titulo) CONTAINS toLower(titulo))
-            RETURN p.id AS id, p.titulo AS titulo
-            LIMIT 3
-            """
-            partial_result = self.system.execute_query(partial_query, {"titulos": movie_titles})
-            movie_ids = [record["id"] for record in partial_result if record.get("id")]
-
-        return movie_ids
+        return self.system.catalog.movie_ids_for_titles(movie_titles)
 
     def process_natural_query(self, query, user_id=None, limit=10):
         """Procesa la consulta en lenguaje natural y retorna las recomendaciones."""
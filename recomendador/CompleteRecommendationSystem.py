@@ -19,9 +19,11 @@ class CompleteRecommendationSystem(
     pass
 
 class Neo4jRecommendationSystem(CompleteRecommendationSystem):
-    def __init__(self, connector, cache_expiration_time=3600):
+    def __init__(self, connector, cache_expiration_time=3600, factor_model=None, recommendation_store=None):
         super().__init__(connector, cache_expiration_time)
         self.connector = connector
+        self.factor_model = factor_model
+        self.recommendation_store = recommendation_store
 
     def execute_query(self, query, params=None):
-        return self.connector.ejecutar_consulta(query, params)
\ No newline at end of file
+        return self.connector.execute_read(query, params)
\ No newline at end of file
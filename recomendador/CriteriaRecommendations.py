@@ -1,21 +1,220 @@
+import asyncio
+import json
+import re
+import threading
+
+from recomendador.QueryBatcher import QueryBatcher
+
+QUERY_PERSONALIZADA = """
+CALL {
+    MATCH (p:Pelicula)-[:PERTENECE_A]->(g:Genero)
+    WHERE g.nombre IN $generos
+      AND NOT EXISTS { MATCH (:Usuario {id: $usuario_id})-[:VALORA]->(p) }
+    WITH p, COUNT(DISTINCT g) AS coincidencias
+    MATCH (p)<-[v:VALORA]-(:Usuario)
+    WITH p, coincidencias, AVG(v.puntuacion) AS promedio_valoracion, COUNT(v) AS num_valoraciones
+    WHERE num_valoraciones > 5
+    RETURN 'genero' AS criterio, p, coincidencias AS score_coincidencia, promedio_valoracion
+    ORDER BY score_coincidencia DESC, promedio_valoracion DESC
+    LIMIT $limite
+
+    UNION ALL
+
+    MATCH (p:Pelicula)<-[:DIRIGE]-(d:Director)
+    WHERE d.nombre IN $directores
+      AND NOT EXISTS { MATCH (:Usuario {id: $usuario_id})-[:VALORA]->(p) }
+    WITH p, COUNT(DISTINCT d) AS coincidencias
+    MATCH (p)<-[v:VALORA]-(:Usuario)
+    WITH p, coincidencias, AVG(v.puntuacion) AS promedio_valoracion, COUNT(v) AS num_valoraciones
+    WHERE num_valoraciones > 5
+    RETURN 'director' AS criterio, p, coincidencias AS score_coincidencia, promedio_valoracion
+    ORDER BY score_coincidencia DESC, promedio_valoracion DESC
+    LIMIT $limite
+
+    UNION ALL
+
+    MATCH (origen:Pelicula)-[s:SIMILAR_A]->(p:Pelicula)
+    WHERE origen.id IN $peliculas
+      AND NOT p.id IN $peliculas
+      AND NOT EXISTS { MATCH (:Usuario {id: $usuario_id})-[:VALORA]->(p) }
+    WITH p, SUM(s.score) AS coincidencias
+    MATCH (p)<-[v:VALORA]-(:Usuario)
+    WITH p, coincidencias, AVG(v.puntuacion) AS promedio_valoracion, COUNT(v) AS num_valoraciones
+    WHERE num_valoraciones > 5
+    RETURN 'pelicula_similar' AS criterio, p, coincidencias AS score_coincidencia, promedio_valoracion
+    ORDER BY score_coincidencia DESC, promedio_valoracion DESC
+    LIMIT $limite
+
+    UNION ALL
+
+    // Si ninguna película favorita tiene vecinos SIMILAR_A, géneros compartidos
+    MATCH (origen:Pelicula)
+    WHERE origen.id IN $peliculas
+      AND NOT EXISTS { MATCH (o:Pelicula)-[:SIMILAR_A]->() WHERE o.id IN $peliculas }
+    MATCH (origen)-[:PERTENECE_A]->(g:Genero)<-[:PERTENECE_A]-(p:Pelicula)
+    WHERE p <> origen
+      AND NOT EXISTS { MATCH (:Usuario {id: $usuario_id})-[:VALORA]->(p) }
+    WITH p, COUNT(DISTINCT g) AS coincidencias
+    MATCH (p)<-[v:VALORA]-(:Usuario)
+    WITH p, coincidencias, AVG(v.puntuacion) AS promedio_valoracion, COUNT(v) AS num_valoraciones
+    WHERE num_valoraciones > 5
+    RETURN 'pelicula_similar' AS criterio, p, coincidencias AS score_coincidencia, promedio_valoracion
+    ORDER BY score_coincidencia DESC, promedio_valoracion DESC
+    LIMIT $limite
+
+    UNION ALL
+
+    MATCH (u:Usuario {id: $usuario_id})-[sim:SIMILAR]->(u2:Usuario)
+    WHERE sim.score > $score_minimo
+    WITH u, u2
+    ORDER BY sim.score DESC
+    LIMIT $max_vecinos
+    MATCH (u2)-[v:VALORA]->(p:Pelicula)
+    WHERE v.puntuacion > 3.5
+      AND NOT (u)-[:VALORA]->(p)
+    WITH p, COUNT(DISTINCT u2) AS usuarios_comunes, AVG(v.puntuacion) AS promedio_valoracion
+    MATCH (p)<-[v2:VALORA]-(:Usuario)
+    WITH p, usuarios_comunes, promedio_valoracion, COUNT(v2) AS num_valoraciones
+    WHERE num_valoraciones > 5
+    RETURN 'usuario_similar' AS criterio, p, usuarios_comunes AS score_coincidencia, promedio_valoracion
+    ORDER BY score_coincidencia DESC, promedio_valoracion DESC
+    LIMIT $limite
+
+    UNION ALL
+
+    UNWIND $modelo AS candidato
+    MATCH (p:Pelicula {id: candidato[0]})
+    WHERE NOT EXISTS { MATCH (:Usuario {id: $usuario_id})-[:VALORA]->(p) }
+    RETURN 'modelo' AS criterio, p, candidato[1] AS score_coincidencia, candidato[2] AS promedio_valoracion
+    ORDER BY score_coincidencia DESC
+    LIMIT $limite
+}
+WITH p, COLLECT({criterio: criterio, score_coincidencia: score_coincidencia,
+                 promedio_valoracion: promedio_valoracion}) AS origenes
+CALL {
+    WITH p
+    OPTIONAL MATCH (p)<-[v:VALORA]-(:Usuario)
+    RETURN AVG(v.puntuacion) AS promedio_valoracion, COUNT(v) AS num_valoraciones
+}
+RETURN p.id AS id,
+       p.titulo AS titulo,
+       p.año AS año,
+       p.duracion AS duracion,
+       [(p)-[:PERTENECE_A]->(genero:Genero) | genero.nombre] AS generos,
+       [(director:Director)-[:DIRIGE]->(p) | director.nombre] AS directores,
+       promedio_valoracion,
+       num_valoraciones,
+       origenes
+"""
+
+
+# Parámetros que cambian de una petición a otra; el resto (límite, umbrales) forma parte de la
+# clave del micro-lote junto con el texto de la consulta.
+PARAMETROS_POR_PETICION = ("valores", "usuario_id", "candidatos")
+
+# Un micro-lote ejecuta la consulta de cada petición como subconsulta correlacionada, así que
+# ORDER BY/LIMIT siguen aplicándose por petición. Los parámetros por petición pasan a leerse de
+# ``peticion_lote``, por lo que las consultas agrupables los usan antes de su primer WITH.
+CONSULTA_LOTE = """
+UNWIND $peticiones AS peticion_lote
+CALL {{
+    WITH peticion_lote
+{consulta}
+}}
+RETURN *
+"""
+
+
 class CriteriaRecommendationsMixin:
+    # Los vecinos se guardan como aristas dirigidas (u)-[:SIMILAR]->(vecino), K como máximo por usuario.
+    score_minimo_similar = 0.3
+    max_vecinos_similares = 50
+
+    # Las consultas de cada criterio se escriben como generadores: cada ``yield (query, params)``
+    # recibe los resultados de esa consulta y el ``return`` es el resultado final. Así la misma
+    # lógica se ejecuta de forma síncrona (``_run_queries``) o en el AsyncDriver (``_run_queries_async``).
+
+    # Micro-batching de las consultas por criterio: las peticiones concurrentes con la misma
+    # consulta se retienen hasta ``batch_window`` segundos (o ``max_batch_size`` peticiones) y se
+    # ejecutan juntas en una sola consulta ``UNWIND $peticiones``. El agrupador es uno por proceso.
+    micro_batching = False
+    batch_window = 0.005
+    max_batch_size = 64
+    _query_batcher = None
+    _batcher_lock = threading.Lock()
+
+    def _run_queries(self, steps, batched=False):
+        try:
+            query, params = next(steps)
+            while True:
+                if batched and self.micro_batching:
+                    results = self._submit_batched(query, params).result()
+                else:
+                    results = self.execute_query(query, params)
+                query, params = steps.send(results)
+        except StopIteration as fin:
+            return fin.value
+
+    async def _run_queries_async(self, steps, batched=False):
+        try:
+            query, params = next(steps)
+            while True:
+                if batched and self.micro_batching:
+                    results = await asyncio.wrap_future(self._submit_batched(query, params))
+                else:
+                    results = await self.execute_query_async(query, params)
+                query, params = steps.send(results)
+        except StopIteration as fin:
+            return fin.value
+
+    def _submit_batched(self, query, params):
+        """Encola la consulta en el micro-lote de su clave y devuelve un Future con sus filas."""
+        with CriteriaRecommendationsMixin._batcher_lock:
+            if CriteriaRecommendationsMixin._query_batcher is None:
+                CriteriaRecommendationsMixin._query_batcher = QueryBatcher(
+                    self._run_query_batch, self.batch_window, self.max_batch_size
+                )
+            batcher = CriteriaRecommendationsMixin._query_batcher
+        shared = {k: v for k, v in params.items() if k not in PARAMETROS_POR_PETICION}
+        return batcher.submit((query, json.dumps(shared, sort_keys=True, default=str)), params)
+
+    def _run_query_batch(self, key, requests):
+        """Ejecuta un micro-lote y reparte las filas devueltas entre sus peticiones."""
+        query = key[0]
+        per_request = [k for k in PARAMETROS_POR_PETICION if k in requests[0]]
+        if len(requests) == 1 or not per_request:
+            results = self.execute_query(query, requests[0])
+            return [results] + [list(results) for _ in requests[1:]]
+
+        body = re.sub(r"\$(%s)\b" % "|".join(per_request), r"peticion_lote.\1", query)
+        params = {k: v for k, v in requests[0].items() if k not in PARAMETROS_POR_PETICION}
+        params["peticiones"] = [dict({k: r[k] for k in per_request}, indice=i) for i, r in enumerate(requests)]
+        results = [[] for _ in requests]
+        for row in self.execute_query(CONSULTA_LOTE.format(consulta=body), params):
+            results[row.pop("peticion_lote")["indice"]].append(row)
+        return results
 
     def _get_recommendations_by_criteria(self, criteria, values, user_id=None, limit=5):
         """Obtiene recomendaciones basadas en un criterio específico."""
+        return self._run_queries(self._criteria_queries(criteria, values, user_id, limit), batched=True)
+
+    async def _get_recommendations_by_criteria_async(self, criteria, values, user_id=None, limit=5):
+        """Versión asíncrona de ``_get_recommendations_by_criteria``, con las mismas consultas."""
+        return await self._run_queries_async(self._criteria_queries(criteria, values, user_id, limit), batched=True)
+
+    def _criteria_queries(self, criteria, values, user_id=None, limit=5):
         if not values:
             return []
 
+        if criteria == 'modelo':
+            return (yield from self._model_queries(user_id or values[0], limit))
+
         if criteria == 'genero':
-            allowed = self.get_all_genres()
-            values = [v for v in values if v in allowed]
+            values = self.catalog.valid_genres(values)
         elif criteria == 'director':
-            allowed = self.get_all_directors()
-            values = [v for v in values if v in allowed]
+            values = self.catalog.valid_directors(values)
         elif criteria == 'pelicula_similar':
-            query = "MATCH (p:Pelicula) WHERE p.id IN $valores RETURN p.id AS id"
-            result = self.execute_query(query, {"valores": values})
-            valid_ids = [record["id"] for record in result]
-            values = valid_ids
+            values = self.catalog.valid_movie_ids(values)
 
         if not values:
             return []
@@ -67,11 +266,12 @@ class CriteriaRecommendationsMixin:
             """
 
         elif criteria == 'pelicula_similar':
+            # Las películas similares se precalculan (preprocesamiento/item_similarity.py) como aristas
+            # (p)-[:SIMILAR_A {score}]->(similar); sin ellas se recurre a los géneros compartidos.
             query = """
-            MATCH (pelicula_origen:Pelicula)
+            MATCH (pelicula_origen:Pelicula)-[s:SIMILAR_A]->(p:Pelicula)
             WHERE pelicula_origen.id IN $valores
-            MATCH (pelicula_origen)-[:PERTENECE_A]->(g:Genero)<-[:PERTENECE_A]-(p:Pelicula)
-            WHERE p <> pelicula_origen
+              AND NOT p.id IN $valores
             """
             if user_id:
                 query += """
@@ -80,7 +280,7 @@ class CriteriaRecommendationsMixin:
                 }
                 """
             query += """
-            WITH p, COUNT(DISTINCT g) AS coincidencias
+            WITH p, SUM(s.score) AS coincidencias
             MATCH (p)<-[v:VALORA]-(u:Usuario)
             WITH p, coincidencias, AVG(v.puntuacion) AS promedio_valoracion, COUNT(v) AS num_valoraciones
             WHERE num_valoraciones > 5
@@ -96,7 +296,10 @@ class CriteriaRecommendationsMixin:
                 return []
             query = """
             MATCH (u:Usuario {id: $usuario_id})-[sim:SIMILAR]->(u2:Usuario)
-            WHERE sim.score > 0.3
+            WHERE sim.score > $score_minimo
+            WITH u, u2
+            ORDER BY sim.score DESC
+            LIMIT $max_vecinos
             MATCH (u2)-[v:VALORA]->(p:Pelicula)
             WHERE v.puntuacion > 3.5
               AND NOT (u)-[:VALORA]->(p)
@@ -119,8 +322,97 @@ class CriteriaRecommendationsMixin:
         }
         if user_id:
             params["usuario_id"] = user_id
+        if criteria == 'usuario_similar':
+            params["score_minimo"] = self.score_minimo_similar
+            params["max_vecinos"] = self.max_vecinos_similares
+
+        results = yield query, params
+        if not results and criteria == 'pelicula_similar':
+            return (yield from self._similar_by_genre_queries(values, user_id, limit))
+        return results
+
+    def _model_queries(self, user_id, limit=5):
+        """
+        Recomendaciones del modelo de factores: el top-N sale de NumPy y Neo4j solo aporta
+        título y año de esos ids y descarta lo valorado después del entrenamiento.
+        """
+        if self.factor_model is None:
+            return []
+        # Se piden candidatos de sobra por si el usuario ha valorado alguno desde el entrenamiento
+        candidatos = self.factor_model.recommend(user_id, limit * 2)
+        if not candidatos:
+            return []
+        query = """
+        UNWIND $candidatos AS candidato
+        MATCH (p:Pelicula {id: candidato[0]})
+        WHERE NOT EXISTS {
+            MATCH (u:Usuario {id: $usuario_id})-[:VALORA]->(p)
+        }
+        RETURN p.id AS id, p.titulo AS titulo, p.año AS año,
+               candidato[1] AS score_coincidencia,
+               candidato[2] AS promedio_valoracion
+        ORDER BY score_coincidencia DESC
+        LIMIT $limite
+        """
+        params = {"candidatos": [list(c) for c in candidatos], "usuario_id": user_id, "limite": limit}
+        return (yield query, params)
+
+    def _similar_by_genre_queries(self, values, user_id=None, limit=5):
+        """Películas que comparten géneros con las dadas, para las que no tienen vecinos SIMILAR_A."""
+        query = """
+        MATCH (pelicula_origen:Pelicula)
+        WHERE pelicula_origen.id IN $valores
+        MATCH (pelicula_origen)-[:PERTENECE_A]->(g:Genero)<-[:PERTENECE_A]-(p:Pelicula)
+        WHERE p <> pelicula_origen
+        """
+        if user_id:
+            query += """
+            AND NOT EXISTS {
+                MATCH (u:Usuario {id: $usuario_id})-[:VALORA]->(p)
+            }
+            """
+        query += """
+        WITH p, COUNT(DISTINCT g) AS coincidencias
+        MATCH (p)<-[v:VALORA]-(u:Usuario)
+        WITH p, coincidencias, AVG(v.puntuacion) AS promedio_valoracion, COUNT(v) AS num_valoraciones
+        WHERE num_valoraciones > 5
+        RETURN p.id AS id, p.titulo AS titulo, p.año AS año, 
+               coincidencias AS score_coincidencia,
+               promedio_valoracion
+        ORDER BY score_coincidencia DESC, promedio_valoracion DESC
+        LIMIT $limite
+        """
+        params = {"valores": values, "limite": limit}
+        if user_id:
+            params["usuario_id"] = user_id
+        return (yield query, params)
+
+    def _get_personalized_candidates(self, preferences, user_id, limit=5):
+        """
+        Candidatos de todos los criterios personalizados y sus detalles en una sola consulta.
 
-        return self.execute_query(query, params)
+        Cada subconsulta de ``QUERY_PERSONALIZADA`` valida sus valores al buscarlos (un género o
+        película inexistente no produce filas) y devuelve hasta ``limit`` películas; cada fila
+        es una película con sus detalles y ``origenes``, la lista de criterios que la proponen
+        con su ``score_coincidencia`` y ``promedio_valoracion``.
+        """
+        return self._run_queries(self._personalized_queries(preferences, user_id, limit))
+
+    def _personalized_queries(self, preferences, user_id, limit=5):
+        modelo = []
+        if self.factor_model is not None:
+            modelo = [list(c) for c in self.factor_model.recommend(user_id, limit * 2)]
+        params = {
+            "generos": preferences['favorite_genres'] or [],
+            "directores": preferences['favorite_directors'] or [],
+            "peliculas": preferences['favorite_movies'] or [],
+            "usuario_id": user_id,
+            "score_minimo": self.score_minimo_similar,
+            "max_vecinos": self.max_vecinos_similares,
+            "modelo": modelo,
+            "limite": limit
+        }
+        return (yield QUERY_PERSONALIZADA, params)
 
     def _get_combined_recommendations(self, criteria_values, user_id=None, limit=10):
         """
@@ -153,9 +445,13 @@ class CriteriaRecommendationsMixin:
         if 'pelicula_similar' in criteria_values and criteria_values['pelicula_similar']:
             if ('genero' in criteria_values and criteria_values['genero']) or ('director' in criteria_values and criteria_values['director']):
                 query += ", "
-            query += "(origen:Pelicula)-[:PERTENECE_A]->(gen:Genero)<-[:PERTENECE_A]-(p) "
+            if self._has_similar_edges(criteria_values['pelicula_similar']):
+                query += "(origen:Pelicula)-[:SIMILAR_A]->(p) "
+            else:
+                # Sin SIMILAR_A precalculadas se recurre a los géneros compartidos, como en el criterio individual
+                query += "(origen:Pelicula)-[:PERTENECE_A]->(:Genero)<-[:PERTENECE_A]-(p:Pelicula) "
             where_clauses.append("origen.id IN $peliculas_similares")
-            where_clauses.append("p <> origen")
+            where_clauses.append("NOT p.id IN $peliculas_similares")
             params["peliculas_similares"] = criteria_values['pelicula_similar']
 
         if where_clauses:
@@ -194,8 +490,24 @@ class CriteriaRecommendationsMixin:
 
         return formatted_results
 
+    def _has_similar_edges(self, movie_ids):
+        """Indica si alguna de las películas tiene vecinas SIMILAR_A precalculadas."""
+        query = """
+        RETURN EXISTS {
+            MATCH (o:Pelicula)-[:SIMILAR_A]->()
+            WHERE o.id IN $peliculas
+        } AS tiene_similares
+        """
+        return self.execute_query(query, {"peliculas": movie_ids})[0]['tiene_similares']
+
     def _get_movie_details(self, titles):
         """Obtiene los detalles completos de un conjunto de películas a partir de sus títulos."""
+        return self._run_queries(self._movie_details_queries(titles))
+
+    async def _get_movie_details_async(self, titles):
+        return await self._run_queries_async(self._movie_details_queries(titles))
+
+    def _movie_details_queries(self, titles):
         if not titles:
             return []
 
@@ -219,4 +531,4 @@ class CriteriaRecommendationsMixin:
                promedio_valoracion,
                num_valoraciones
         """
-        return self.execute_query(details_query, {"titulos": titles})
\ No newline at end of file
+        return (yield details_query, {"titulos": titles})
\ No newline at end of file
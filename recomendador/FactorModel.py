@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Latencias de las últimas llamadas a ``recommend`` que se conservan: el proceso de la app vive
+# mucho y los percentiles no necesitan más
+MAX_LATENCIAS = 10000
+
+
+class FactorModel:
+    """
+    Factores ALS de usuarios y películas entrenados por ``preprocesamiento/als_model.py``.
+
+    Las puntuaciones de un usuario se obtienen con un único producto matriz-vector sobre
+    los factores de todas las películas y el top-N con ``argpartition``. Los factores de
+    usuario se leen con memory-map; los de película se cargan en memoria.
+    """
+
+    def __init__(self, directorio, min_valoraciones=5):
+        self.directorio = directorio
+        self.min_valoraciones = min_valoraciones
+        with open(os.path.join(directorio, "modelo.json")) as f:
+            self.metricas = json.load(f)
+        self.media = self.metricas['media']
+        self.minimo, self.maximo = self.metricas['minimo'], self.metricas['maximo']
+
+        cargar = lambda nombre, mmap=None: np.load(os.path.join(directorio, nombre), mmap_mode=mmap)
+        self.factores_usuarios = cargar("factores_usuarios.npy", "r")
+        self.factores_peliculas = cargar("factores_peliculas.npy")
+        self.user_ids = cargar("usuarios.npy")
+        self.movie_ids = cargar("peliculas.npy")
+        self.valoradas_indptr = cargar("valoradas_indptr.npy", "r")
+        self.valoradas_indices = cargar("valoradas_indices.npy", "r")
+        self.promedios = cargar("promedios.npy")
+        # Igual que los demás criterios, solo se recomiendan películas con más de ``min_valoraciones``
+        self.descartadas = np.flatnonzero(cargar("num_valoraciones.npy") <= min_valoraciones)
+
+        self._lock = threading.Lock()
+        self._latencias = deque(maxlen=MAX_LATENCIAS)
+
+    @classmethod
+    def cargar_si_existe(cls, directorio, **kwargs):
+        """Devuelve el modelo del directorio o None si todavía no se ha entrenado."""
+        if not os.path.exists(os.path.join(directorio, "modelo.json")):
+            return None
+        return cls(directorio, **kwargs)
+
+    def _indice_usuario(self, user_id):
+        posicion = int(np.searchsorted(self.user_ids, user_id))
+        if posicion < len(self.user_ids) and self.user_ids[posicion] == user_id:
+            return posicion
+        return None
+
+    def recommend(self, user_id, limit=10):
+        """
+        Top-``limit`` películas para el usuario según los factores.
+
+        Returns:
+            list: tuplas (movie_id, valoración prevista, valoración media) de mayor a menor;
+                  vacía si el usuario no estaba en el entrenamiento.
+        """
+        inicio = time.perf_counter()
+        usuario = self._indice_usuario(user_id)
+        if usuario is None:
+            return []
+
+        puntuaciones = self.factores_peliculas @ self.factores_usuarios[usuario]
+        puntuaciones[self.valoradas_indices[self.valoradas_indptr[usuario]:self.valoradas_indptr[usuario + 1]]] = -np.inf
+        puntuaciones[self.descartadas] = -np.inf
+        limit = min(limit, int(np.isfinite(puntuaciones).sum()))
+        if limit <= 0:
+            return []
+        candidatos = np.argpartition(-puntuaciones, limit - 1)[:limit]
+        candidatos = candidatos[np.argsort(-puntuaciones[candidatos])]
+        previstas = np.clip(self.media + puntuaciones[candidatos], self.minimo, self.maximo)
+
+        with self._lock:
+            self._latencias.append((time.perf_counter() - inicio) * 1000)
+        return list(zip(self.movie_ids[candidatos].tolist(), previstas.tolist(),
+                        self.promedios[candidatos].tolist()))
+
+    def latency_report(self):
+        """
+        Percentiles (ms) de la latencia de las últimas ``MAX_LATENCIAS`` llamadas a ``recommend``
+        en este proceso y métricas del entrenamiento.
+        """
+        with self._lock:
+            latencias = list(self._latencias)
+        informe = {
+            'rmse_test': self.metricas.get('rmse_test'),
+            'segundos_entrenamiento': self.metricas.get('segundos_entrenamiento'),
+            'consultas': len(latencias)
+        }
+        if latencias:
+            informe['p50_ms'] = float(np.percentile(latencias, 50))
+            informe['p99_ms'] = float(np.percentile(latencias, 99))
+        return informe
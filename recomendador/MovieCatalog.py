@@ -0,0 +1,179 @@
+import asyncio
+import re
+import threading
+import time
+
+# Sello de versión barato: los recuentos por etiqueta salen del almacén de recuentos de Neo4j sin
+# recorrer nodos, y el nodo (:Catalogo {version}) lo actualiza preprocesamiento/graph_loader.py
+# al cargar, para detectar también cambios que no alteran los recuentos (títulos renombrados...).
+CONSULTA_VERSION = """
+CALL { MATCH (g:Genero) RETURN count(g) AS generos }
+CALL { MATCH (d:Director) RETURN count(d) AS directores }
+CALL { MATCH (p:Pelicula) RETURN count(p) AS peliculas }
+OPTIONAL MATCH (c:Catalogo)
+RETURN generos, directores, peliculas, max(c.version) AS version
+"""
+
+CONSULTAS = {
+    'generos': "MATCH (n:Genero) RETURN n.nombre AS nombre",
+    'directores': "MATCH (n:Director) RETURN n.nombre AS nombre",
+    'peliculas': "MATCH (p:Pelicula) RETURN p.id AS id, p.titulo AS titulo",
+}
+
+
+def _clave(texto):
+    """Nombre normalizado para buscarlo dentro de una frase: palabras en minúsculas."""
+    return " ".join(re.findall(r"\w+", texto.lower()))
+
+
+class _Nombres:
+    """Lista ordenada, conjunto e índice por nombre normalizado de un tipo de nodo."""
+
+    def __init__(self, nombres):
+        self.ordenados = sorted({n for n in nombres if n})
+        self.conjunto = frozenset(self.ordenados)
+        self.por_clave = {}
+        for nombre in self.ordenados:
+            self.por_clave.setdefault(_clave(nombre), nombre)
+        self.max_palabras = max((clave.count(" ") + 1 for clave in self.por_clave), default=0)
+
+    def buscar_en(self, texto):
+        """Nombres que aparecen como palabras completas en ``texto``, por n-gramas de palabras."""
+        palabras = re.findall(r"\w+", texto.lower())
+        encontrados = set()
+        for inicio in range(len(palabras)):
+            for fin in range(inicio + 1, min(inicio + self.max_palabras, len(palabras)) + 1):
+                nombre = self.por_clave.get(" ".join(palabras[inicio:fin]))
+                if nombre is not None:
+                    encontrados.add(nombre)
+        return sorted(encontrados)
+
+
+class _Peliculas:
+    def __init__(self, ids, titulos):
+        self.ids = frozenset(i for i in ids if i)
+        self.ids_por_titulo = {}
+        for id_pelicula, titulo in zip(ids, titulos):
+            if id_pelicula and titulo:
+                self.ids_por_titulo.setdefault(titulo, []).append(id_pelicula)
+        self.titulos = sorted(self.ids_por_titulo)
+        self.titulos_minusculas = [titulo.lower() for titulo in self.titulos]
+
+
+class MovieCatalog:
+    """
+    Catálogo en memoria de géneros, directores y películas, compartido por todo el proceso.
+
+    Cada parte se guarda como lista ordenada y como conjunto, así que validar los valores de un
+    criterio o buscar nombres en una consulta del chatbot no toca la base de datos. Como mucho
+    cada ``check_interval`` segundos se consulta el sello de versión y solo se recargan las
+    partes cuyo sello ha cambiado. Dentro del bucle de eventos del conector esa comprobación
+    nunca bloquea: se lanza en el executor del bucle y mientras tanto se usa el catálogo
+    actual (por eso ``RecommendationSystem`` lo carga al crearse).
+    """
+
+    def __init__(self, connector, check_interval=60):
+        self.connector = connector
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._sellos = {}
+        self._comprobado = 0.0
+        self._refrescando = False
+        self._generos = _Nombres([])
+        self._directores = _Nombres([])
+        self._peliculas = _Peliculas([], [])
+
+    def refresh(self, force=False):
+        """Recarga las partes cuyo sello de versión ha cambiado (todas la primera vez)."""
+        if not force and time.monotonic() - self._comprobado < self.check_interval:
+            return self
+        with self._lock:
+            if not force and time.monotonic() - self._comprobado < self.check_interval:
+                return self
+            fila = self.connector.execute_read(CONSULTA_VERSION)[0]
+            for parte in CONSULTAS:
+                sello = (fila[parte], fila['version'])
+                if force or self._sellos.get(parte) != sello:
+                    self._cargar(parte)
+                    self._sellos[parte] = sello
+            self._comprobado = time.monotonic()
+        return self
+
+    def _vigente(self):
+        if not self._sellos:
+            return self.refresh()
+        if time.monotonic() - self._comprobado < self.check_interval:
+            return self
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.refresh()
+        if not self._refrescando:
+            self._refrescando = True
+            loop.run_in_executor(None, self._refrescar_en_segundo_plano)
+        return self
+
+    def _refrescar_en_segundo_plano(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error actualizando el catálogo: {e}")
+        finally:
+            self._refrescando = False
+
+    def _cargar(self, parte):
+        columnas = self.connector.read_columns(CONSULTAS[parte])
+        # Cada parte se sustituye entera para que los lectores nunca vean una a medio cargar
+        if parte == 'generos':
+            self._generos = _Nombres(columnas.get('nombre', []))
+        elif parte == 'directores':
+            self._directores = _Nombres(columnas.get('nombre', []))
+        else:
+            self._peliculas = _Peliculas(columnas.get('id', []), columnas.get('titulo', []))
+
+    def genres(self):
+        return self._vigente()._generos.ordenados
+
+    def directors(self):
+        return self._vigente()._directores.ordenados
+
+    def titles(self):
+        """Títulos distintos, ordenados."""
+        return self._vigente()._peliculas.titulos
+
+    def valid_genres(self, values):
+        generos = self._vigente()._generos.conjunto
+        return [v for v in values if v in generos]
+
+    def valid_directors(self, values):
+        directores = self._vigente()._directores.conjunto
+        return [v for v in values if v in directores]
+
+    def valid_movie_ids(self, values):
+        ids = self._vigente()._peliculas.ids
+        return [v for v in values if v in ids]
+
+    def find_genres(self, text):
+        """Géneros del catálogo mencionados en ``text``."""
+        return self._vigente()._generos.buscar_en(text)
+
+    def find_directors(self, text):
+        """Directores del catálogo mencionados en ``text``."""
+        return self._vigente()._directores.buscar_en(text)
+
+    def movie_ids_for_titles(self, titles, partial_limit=3):
+        """
+        Ids de las películas con esos títulos exactos; si no hay ninguno, de las primeras
+        ``partial_limit`` cuyo título contiene alguno de ellos (sin distinguir mayúsculas).
+        """
+        peliculas = self._vigente()._peliculas
+        ids = [i for titulo in titles for i in peliculas.ids_por_titulo.get(titulo, [])]
+        if ids:
+            return ids
+        buscados = [titulo.lower() for titulo in titles if titulo]
+        for titulo, minusculas in zip(peliculas.titulos, peliculas.titulos_minusculas):
+            if any(buscado in minusculas for buscado in buscados):
+                ids.extend(peliculas.ids_por_titulo[titulo])
+                if len(ids) >= partial_limit:
+                    return ids[:partial_limit]
+        return ids
@@ -1,23 +1,110 @@
-from neo4j import GraphDatabase
+import asyncio
+import threading
+
+from neo4j import AsyncGraphDatabase, GraphDatabase, READ_ACCESS
+
+
+def _records(tx, query, parameters):
+    return [record.data() for record in tx.run(query, parameters or {})]
+
+
+async def _records_async(tx, query, parameters):
+    result = await tx.run(query, parameters or {})
+    return [record.data() async for record in result]
+
+
+def _columns(tx, query, parameters):
+    result = tx.run(query, parameters or {})
+    keys = result.keys()
+    values = result.values()
+    return {key: [row[i] for row in values] for i, key in enumerate(keys)}
+
 
 class Neo4jConector:
-    """Clase para manejar conexiones con Neo4j."""
+    """
+    Clase para manejar conexiones con Neo4j.
 
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    El driver mantiene un pool de conexiones (tamaño, tiempo de adquisición y comprobación de
+    conexiones inactivas configurables). Las lecturas van por ``execute_read`` y las escrituras
+    por ``execute_write``, de modo que con un clúster (``neo4j://`` con routing) las lecturas
+    se reparten entre los seguidores; ambas reintentan los errores transitorios.
+
+    Las lecturas asíncronas (``execute_read_async``) usan un AsyncDriver que vive en un único
+    bucle de eventos en segundo plano, creado la primera vez que se usa; ``run_coroutine``
+    ejecuta una corrutina en ese bucle y espera su resultado desde código síncrono.
+    """
+
+    def __init__(self, uri, user, password, database=None, max_connection_pool_size=50,
+                 connection_acquisition_timeout=30.0, liveness_check_timeout=30.0, max_connection_lifetime=3600,
+                 fetch_size=1000):
+        self._uri = uri
+        self._driver_config = {
+            'auth': (user, password),
+            'max_connection_pool_size': max_connection_pool_size,
+            'connection_acquisition_timeout': connection_acquisition_timeout,
+            'liveness_check_timeout': liveness_check_timeout,
+            'max_connection_lifetime': max_connection_lifetime
+        }
+        self.driver = GraphDatabase.driver(uri, **self._driver_config)
+        self.database = database
+        self.fetch_size = fetch_size
+        self.async_driver = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
 
     def close(self):
         self.driver.close()
+        if self._loop is not None:
+            if self.async_driver is not None:
+                self.run_coroutine(self.async_driver.close())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+    def _event_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="neo4j-async", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run_coroutine(self, coroutine):
+        """Ejecuta ``coroutine`` en el bucle de eventos del conector y devuelve su resultado."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._event_loop()).result()
+
+    def _session(self, fetch_size=None, **kwargs):
+        return self.driver.session(database=self.database, fetch_size=fetch_size or self.fetch_size, **kwargs)
+
+    def execute_read(self, query, parameters=None):
+        """Ejecuta una consulta de lectura y devuelve una lista de diccionarios."""
+        with self._session() as session:
+            return session.execute_read(_records, query, parameters)
+
+    def execute_write(self, query, parameters=None):
+        """Ejecuta una consulta de escritura y devuelve una lista de diccionarios."""
+        with self._session() as session:
+            return session.execute_write(_records, query, parameters)
+
+    async def execute_read_async(self, query, parameters=None):
+        """Como ``execute_read`` pero sobre el AsyncDriver; debe ejecutarse en el bucle del conector."""
+        if self.async_driver is None:
+            self.async_driver = AsyncGraphDatabase.driver(self._uri, **self._driver_config)
+        async with self.async_driver.session(database=self.database, fetch_size=self.fetch_size) as session:
+            return await session.execute_read(_records_async, query, parameters)
 
-    def execute_query(self, query, parameters=None):
-        with self.driver.session() as session:
-            result = session.run(query, parameters)
-            return [record.data() for record in result]
+    def read_columns(self, query, parameters=None):
+        """Ejecuta una consulta de lectura y devuelve {columna: lista de valores} en lugar de un dict por fila."""
+        with self._session() as session:
+            return session.execute_read(_columns, query, parameters)
 
-    def run_query(self, query, parameters=None):
-        return self.execute_query(query, parameters)
+    def stream(self, query, parameters=None, fetch_size=None):
+        """
+        Generador de diccionarios para resultados grandes: el servidor los envía en lotes de
+        ``fetch_size`` filas a medida que se consumen, sin materializar la lista.
 
-    def ejecutar_consulta(self, query, params=None):
-        with self.driver.session() as session:
-            result = session.run(query, params or {})
-            return [record for record in result]
\ No newline at end of file
+        Al no poder reintentarse a mitad de la iteración, usa una transacción de lectura
+        autocommit (también enrutada a los lectores del clúster).
+        """
+        with self._session(fetch_size, default_access_mode=READ_ACCESS) as session:
+            for record in session.run(query, parameters or {}):
+                yield record.data()
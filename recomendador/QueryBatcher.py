@@ -0,0 +1,81 @@
+import concurrent.futures
+import threading
+import time
+
+
+class QueryBatcher:
+    """
+    Agrupa peticiones concurrentes con la misma clave durante una ventana de unos milisegundos.
+
+    ``submit(key, request)`` devuelve un Future. La primera petición de una clave abre su
+    ventana (``window`` segundos); al cerrarse, o al llegar a ``max_batch_size`` peticiones,
+    el lote se ejecuta con ``run_batch(key, requests)``, que debe devolver un resultado por
+    petición y en el mismo orden. Los lotes se ejecutan en un pool fijo de ``num_workers``
+    hilos, creado una sola vez.
+    """
+
+    def __init__(self, run_batch, window=0.005, max_batch_size=64, num_workers=4):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = {}
+        self._deadlines = {}
+        self._cond = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers,
+                                                               thread_name_prefix="query-batcher")
+        self.batches = 0
+        self.requests = 0
+        threading.Thread(target=self._dispatcher, name="query-batcher-dispatcher", daemon=True).start()
+
+    def submit(self, key, request):
+        future = concurrent.futures.Future()
+        with self._cond:
+            batch = self._pending.setdefault(key, [])
+            if not batch:
+                self._deadlines[key] = time.monotonic() + self.window
+            batch.append((request, future))
+            if len(batch) >= self.max_batch_size:
+                self._deadlines[key] = time.monotonic()
+            self._cond.notify()
+        return future
+
+    def _dispatcher(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    ready = [key for key, deadline in self._deadlines.items() if deadline <= now]
+                    if ready:
+                        break
+                    timeout = min(self._deadlines.values()) - now if self._deadlines else None
+                    self._cond.wait(timeout)
+                batches = []
+                for key in ready:
+                    del self._deadlines[key]
+                    batches.append((key, self._pending.pop(key)))
+            for key, batch in batches:
+                self._executor.submit(self._run, key, batch)
+
+    def _run(self, key, batch):
+        futures = [future for _, future in batch]
+        try:
+            results = list(self.run_batch(key, [request for request, _ in batch]))
+            if len(results) != len(batch):
+                raise RuntimeError(f"El lote devolvió {len(results)} resultados para {len(batch)} peticiones")
+        except Exception as e:
+            # Ningún llamante puede quedarse esperando un Future sin resolver
+            for future in futures:
+                future.set_exception(e)
+            return
+        with self._cond:
+            self.batches += 1
+            self.requests += len(batch)
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    def stats(self):
+        """Lotes ejecutados y tamaño medio de lote."""
+        with self._cond:
+            batches, requests = self.batches, self.requests
+        return {'lotes': batches, 'peticiones': requests,
+                'tam_medio': requests / batches if batches else 0.0}
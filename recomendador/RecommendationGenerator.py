@@ -1,42 +1,89 @@
-import concurrent.futures
+import asyncio
 import time
 
 class RecommendationGeneratorMixin:
+    # Peso de cada criterio al sumar la puntuación de una película recomendada por varios
+    criteria_weights = {
+        'genero': 0.3,
+        'director': 0.25,
+        'pelicula_similar': 0.25,
+        'usuario_similar': 0.2,
+        'modelo': 0.25,
+        # Filas de la consulta combinada que cumplen varios criterios a la vez
+        'multi': 0.5
+    }
+    # True: las recomendaciones personalizadas salen de una sola consulta (QUERY_PERSONALIZADA)
+    # con los candidatos de todos los criterios y sus detalles, en lugar de una por criterio
+    combined_query_mode = False
+
+    def _criteria_score(self, criteria, base_score, rating):
+        return (base_score * 0.7 + rating * 0.3) * self.criteria_weights.get(criteria, 0.1)
+
+    async def _gather_criteria_async(self, tasks):
+        """
+        Lanza a la vez, en el bucle de eventos del conector, la consulta de cada tarea
+        (criterio, valores, user_id, límite) y etiqueta cada resultado con su criterio.
+        """
+        results = await asyncio.gather(
+            *(self._get_recommendations_by_criteria_async(c, v, user_id, l) for c, v, user_id, l in tasks),
+            return_exceptions=True
+        )
+        combined_results = []
+        for (criteria, _, _, _), result in zip(tasks, results):
+            if isinstance(result, Exception):
+                print(f"Error obteniendo recomendaciones por {criteria}: {result}")
+                continue
+            for r in result:
+                result_dict = dict(r)
+                result_dict['criteria_origin'] = criteria
+                combined_results.append(result_dict)
+        return combined_results
+
+    def generate_personalized_recommendations(self, user_id, limit=20, use_store=True):
+        """
+        Genera recomendaciones personalizadas usando paralelización.
 
-    def generate_personalized_recommendations(self, user_id, limit=20):
-        """Genera recomendaciones personalizadas usando paralelización."""
+        Si hay un almacén precalculado (``recommendation_store``) con una entrada vigente del
+        usuario se sirve desde él; ``use_store=False`` fuerza el cálculo en línea.
+        """
         cache_key = f"{user_id}_{limit}"
         with self._cache_lock:
             cache_entry = self._recommendations_cache.get(cache_key)
             if cache_entry and (time.time() - cache_entry['timestamp'] < self.cache_expiration_time):
                 return cache_entry['data']
 
+        if use_store and self.recommendation_store is not None:
+            stored = self.recommendation_store.get(user_id, limit)
+            if stored is not None:
+                with self._cache_lock:
+                    self._recommendations_cache[cache_key] = {
+                        'data': stored,
+                        'timestamp': time.time()
+                    }
+                return stored
+
         preferences = self._get_user_preferences(user_id)
 
+        if self.combined_query_mode:
+            final_result = self._generate_combined_personalized(preferences, user_id, limit)
+            if final_result:
+                with self._cache_lock:
+                    self._recommendations_cache[cache_key] = {
+                        'data': final_result,
+                        'timestamp': time.time()
+                    }
+            return final_result
+
         tasks = [
             ('genero', preferences['favorite_genres'], user_id, 5),
             ('director', preferences['favorite_directors'], user_id, 5),
             ('pelicula_similar', preferences['favorite_movies'], user_id, 5),
             ('usuario_similar', [user_id], user_id, 5)
         ]
+        if self.factor_model is not None:
+            tasks.append(('modelo', [user_id], user_id, 5))
 
-        combined_results = []
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            futures = {
-                executor.submit(self._get_recommendations_by_criteria, c, v, user_id, l): c
-                for c, v, user_id, l in tasks
-            }
-            for future in concurrent.futures.as_completed(futures):
-                criteria = futures[future]
-                try:
-                    results = future.result()
-                    for r in results:
-                        result_dict = dict(r)
-                        result_dict['criteria_origin'] = criteria
-                        combined_results.append(result_dict)
-                except Exception as e:
-                    print(f"Error obteniendo recomendaciones por {criteria}: {e}")
+        combined_results = self.run_async(self._gather_criteria_async(tasks))
 
         if combined_results:
             unique_movies = {}
@@ -53,13 +100,7 @@ class RecommendationGeneratorMixin:
                 base_score = r.get('score_coincidencia', 0)
                 rating = r.get('promedio_valoracion', 0)
 
-                weights = {
-                    'genero': 0.3,
-                    'director': 0.25,
-                    'pelicula_similar': 0.25,
-                    'usuario_similar': 0.2
-                }
-                score = (base_score * 0.7 + rating * 0.3) * weights.get(criteria_val, 0.1)
+                score = self._criteria_score(criteria_val, base_score, rating)
                 unique_movies[title]['puntaje_total'] += score
                 unique_movies[title]['criterios'].append(criteria_val)
 
@@ -70,7 +111,7 @@ class RecommendationGeneratorMixin:
             )[:limit]
 
             recommended_titles = [r['titulo'] for r in sorted_recommendations]
-            details = self._get_movie_details(recommended_titles)
+            details = self.run_async(self._get_movie_details_async(recommended_titles))
 
             final_result = []
             for detail in details:
@@ -94,6 +135,27 @@ class RecommendationGeneratorMixin:
 
         return []
 
+    def _generate_combined_personalized(self, preferences, user_id, limit=20):
+        """
+        Modo de una sola consulta: los candidatos etiquetados con su criterio y sus detalles
+        llegan juntos y se puntúan igual que en el modo por criterio.
+        """
+        unique_movies = {}
+        for row in self._get_personalized_candidates(preferences, user_id, 5):
+            movie = unique_movies.get(row['titulo'])
+            if movie is None:
+                movie = {k: v for k, v in dict(row).items() if k != 'origenes'}
+                movie['recommendation_score'] = 0
+                movie['recommendation_criteria'] = []
+                unique_movies[row['titulo']] = movie
+            for origin in row['origenes']:
+                movie['recommendation_score'] += self._criteria_score(
+                    origin['criterio'], origin['score_coincidencia'], origin['promedio_valoracion'] or 0
+                )
+                movie['recommendation_criteria'].append(origin['criterio'])
+
+        return sorted(unique_movies.values(), key=lambda x: x['recommendation_score'], reverse=True)[:limit]
+
     def get_recommendations_by_criteria_combination(self, criteria_dict, user_id=None, limit=10):
         """
         Obtiene recomendaciones basadas en una combinación de criterios.
@@ -129,21 +191,8 @@ class RecommendationGeneratorMixin:
         else:
             if user_id and 'usuario_similar' not in criteria_dict:
                 criteria_dict['usuario_similar'] = [user_id]
-            with concurrent.futures.ThreadPoolExecutor(max_workers=len(criteria_dict)) as executor:
-                futures = {}
-                for criteria, values in criteria_dict.items():
-                    if values:
-                        futures[executor.submit(self._get_recommendations_by_criteria, criteria, values, user_id, limit)] = criteria
-                for future in concurrent.futures.as_completed(futures):
-                    criteria = futures[future]
-                    try:
-                        results = future.result()
-                        for r in results:
-                            result_dict = dict(r)
-                            result_dict['criteria_origin'] = criteria
-                            combined_results.append(result_dict)
-                    except Exception as e:
-                        print(f"Error obteniendo recomendaciones por {criteria}: {e}")
+            tasks = [(criteria, values, user_id, limit) for criteria, values in criteria_dict.items() if values]
+            combined_results.extend(self.run_async(self._gather_criteria_async(tasks)))
 
         if combined_results:
             unique_movies = {}
@@ -164,19 +213,10 @@ class RecommendationGeneratorMixin:
                 base_score = r.get('score_coincidencia', 0)
                 rating = r.get('promedio_valoracion', 0)
 
-                weights = {
-                    'genero': 0.3,
-                    'director': 0.25,
-                    'pelicula_similar': 0.25,
-                    'usuario_similar': 0.2,
-                    'multi': 0.5
-                }
                 if should_use_combined_query and not isinstance(criteria_val, str):
-                    base_score = 3.0 * len(criteria_list)
-                    weight = weights.get('multi', 0.5)
+                    score = self._criteria_score('multi', 3.0 * len(criteria_list), rating)
                 else:
-                    weight = weights.get(criteria_list[0], 0.1)
-                score = (base_score * 0.7 + rating * 0.3) * weight
+                    score = self._criteria_score(criteria_list[0], base_score, rating)
                 unique_movies[title]['puntaje_total'] += score
                 for c in criteria_list:
                     if c not in unique_movies[title]['criterios']:
@@ -189,7 +229,7 @@ class RecommendationGeneratorMixin:
             )[:limit]
 
             recommended_titles = [r['titulo'] for r in sorted_recommendations]
-            details = self._get_movie_details(recommended_titles)
+            details = self.run_async(self._get_movie_details_async(recommended_titles))
 
             final_result = []
             for detail in details:
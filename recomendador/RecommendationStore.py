@@ -0,0 +1,81 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS recomendaciones (
+    usuario PRIMARY KEY,
+    limite INTEGER NOT NULL,
+    generado REAL NOT NULL,
+    datos BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class RecommendationStore:
+    """
+    Almacén SQLite con el top-N precalculado de cada usuario (``recomendador/precompute.py``).
+
+    Cada fila guarda la lista final de ``generate_personalized_recommendations`` (detalles,
+    ``recommendation_score`` y ``recommendation_criteria``) como JSON comprimido con zlib.
+    Una entrada se sirve si tiene menos de ``max_age`` segundos y al menos tantas
+    recomendaciones como se piden; en otro caso se calcula en línea.
+    """
+
+    def __init__(self, ruta, max_age=86400):
+        self.ruta = ruta
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript(ESQUEMA)
+
+    def close(self):
+        self.conexion.close()
+
+    def __len__(self):
+        return self.conexion.execute("SELECT COUNT(*) FROM recomendaciones").fetchone()[0]
+
+    @staticmethod
+    def _codificar(recomendaciones):
+        return zlib.compress(json.dumps(recomendaciones, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def get(self, user_id, limit):
+        """Devuelve las ``limit`` primeras recomendaciones guardadas o None si no hay una entrada vigente."""
+        with self._lock:
+            fila = self.conexion.execute(
+                "SELECT limite, generado, datos FROM recomendaciones WHERE usuario = ?", (user_id,)
+            ).fetchone()
+        if fila is None:
+            return None
+        limite, generado, datos = fila
+        if limite < limit or time.time() - generado > self.max_age:
+            return None
+        return json.loads(zlib.decompress(datos))[:limit]
+
+    def put_many(self, entradas, generado=None):
+        """
+        Guarda (o sustituye) entradas ``(user_id, limit, recomendaciones)`` en una transacción.
+
+        Returns:
+            int: bytes comprimidos escritos
+        """
+        generado = generado or time.time()
+        filas = [(user_id, limit, generado, self._codificar(recomendaciones))
+                 for user_id, limit, recomendaciones in entradas]
+        with self._lock, self.conexion:
+            self.conexion.executemany(
+                "INSERT OR REPLACE INTO recomendaciones (usuario, limite, generado, datos) VALUES (?, ?, ?, ?)", filas
+            )
+        return sum(len(fila[3]) for fila in filas)
+
+    def put(self, user_id, limit, recomendaciones):
+        return self.put_many([(user_id, limit, recomendaciones)])
+
+    def invalidate(self, user_id):
+        """Descarta la entrada de un usuario (p. ej. tras guardar nuevas valoraciones)."""
+        with self._lock, self.conexion:
+            self.conexion.execute("DELETE FROM recomendaciones WHERE usuario = ?", (user_id,))
@@ -1,37 +1,55 @@
 import threading
 
+from recomendador.MovieCatalog import MovieCatalog
+
 
 class RecommendationSystem:
     _cache_lock = threading.Lock()
     _preferences_cache = {}
     _recommendations_cache = {}
+    # Géneros, directores y títulos en memoria (recomendador.MovieCatalog), uno por proceso
+    _catalog = None
 
     def __init__(self, db_connection, cache_expiration_time=3600):
         self.db_connection = db_connection
         self.cache_expiration_time = cache_expiration_time
+        # Factores ALS (recomendador.FactorModel) para el criterio "modelo"; None lo desactiva
+        self.factor_model = None
+        # Top-N precalculado por usuario (recomendador.RecommendationStore); None calcula siempre en línea
+        self.recommendation_store = None
+        # Se carga aquí para que las consultas asíncronas nunca esperen la primera carga del catálogo
+        self.catalog.refresh()
 
     def execute_query(self, query, params=None):
-        """Ejecuta una consulta en la base de datos Neo4j."""
-        return self.db_connection.execute_query(query, params)
-
-
-    def get_all_genres(self):
-        """Obtiene la lista de todos los géneros desde la base de datos."""
-        query = "MATCH (n:Genero) RETURN n.nombre AS genero"
-        result = self.execute_query(query)
-        return [record["genero"] for record in result if record.get("genero")]
-
-    def get_all_directors(self):
-        """Obtiene la lista de todos los directores desde la base de datos."""
-        query = "MATCH (n:Director) RETURN n.nombre AS director"
-        result = self.execute_query(query)
-        return [record["director"] for record in result if record.get("director")]
-
-    def get_all_movies_titles(self):
-        """Obtiene la lista de todos los títulos de películas desde la base de datos."""
-        query = "MATCH (n:Pelicula) RETURN n.titulo AS titulo"
-        result = self.execute_query(query)
-        return [record["titulo"] for record in result if record.get("titulo")]
+        """Ejecuta una consulta de lectura en la base de datos Neo4j."""
+        return self.db_connection.execute_read(query, params)
+
+    async def execute_query_async(self, query, params=None):
+        """Ejecuta una consulta de lectura en el AsyncDriver (dentro de ``run_async``)."""
+        return await self.db_connection.execute_read_async(query, params)
+
+    def run_async(self, coroutine):
+        """Envoltorio síncrono: ejecuta la corrutina en el bucle de eventos del conector."""
+        return self.db_connection.run_coroutine(coroutine)
+
+    @property
+    def catalog(self):
+        with self._cache_lock:
+            if RecommendationSystem._catalog is None:
+                RecommendationSystem._catalog = MovieCatalog(self.db_connection)
+            return RecommendationSystem._catalog
+
+    def invalidate_user(self, user_id):
+        """Descarta las preferencias y recomendaciones cacheadas (y precalculadas) de un usuario."""
+        prefix = f"{user_id}_"
+        with self._cache_lock:
+            self._preferences_cache.pop(user_id, None)
+            for key in [k for k in self._recommendations_cache if k.startswith(prefix)]:
+                del self._recommendations_cache[key]
+        # lru_cache no permite descartar una sola entrada
+        self._get_user_preferences.cache_clear()
+        if self.recommendation_store is not None:
+            self.recommendation_store.invalidate(user_id)
 
     def clear_cache(self):
         with self._cache_lock:
@@ -0,0 +1,113 @@
+"""
+Precalcula el top-N personalizado de todos los usuarios con un pool de procesos.
+
+Cada proceso abre su propia conexión a Neo4j y ejecuta ``generate_personalized_recommendations``
+(todos los criterios, incluido ``modelo`` si hay factores ALS) para bloques de usuarios; el
+proceso principal escribe los resultados en un ``RecommendationStore`` que la app sirve
+mientras las entradas sean recientes:
+
+    python recomendador/precompute.py --procesos 8 --limite 20
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from recomendador.Neo4jConector import Neo4jConector
+from recomendador.CompleteRecommendationSystem import Neo4jRecommendationSystem
+from recomendador.FactorModel import FactorModel
+from recomendador.RecommendationStore import RecommendationStore
+
+RECOMENDACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recomendaciones.sqlite")
+MODELO_ALS = os.path.join(project_root, "preprocesamiento", "modelo_als")
+
+_system = None
+
+
+def _init_worker(uri, user, password, modelo_als):
+    global _system
+    factor_model = FactorModel.cargar_si_existe(modelo_als) if modelo_als else None
+    _system = Neo4jRecommendationSystem(Neo4jConector(uri, user, password), factor_model=factor_model)
+    _system.combined_query_mode = True
+
+
+def _recommend_chunk(args):
+    user_ids, limit = args
+    entries = []
+    for user_id in user_ids:
+        try:
+            entries.append((user_id, limit, _system.generate_personalized_recommendations(user_id, limit,
+                                                                                          use_store=False)))
+        except Exception as e:
+            print(f"Error precalculando las recomendaciones del usuario {user_id}: {e}")
+    # Las cachés en memoria solo sirven dentro de una petición; se vacían para no acumular usuarios
+    _system.clear_cache()
+    return entries
+
+
+def get_user_ids(connector):
+    """Ids de todos los usuarios del grafo."""
+    return [record["id"] for record in connector.stream("MATCH (u:Usuario) RETURN u.id AS id")]
+
+
+def precompute_recommendations(uri, user, password, store_path=RECOMENDACIONES, limit=20, processes=None,
+                               chunk_size=100, modelo_als=MODELO_ALS, user_ids=None):
+    """
+    Calcula y guarda el top-``limit`` de ``user_ids`` (por defecto, todos los usuarios).
+
+    Returns:
+        dict: usuarios, segundos, usuarios_por_segundo y bytes (comprimidos) escritos
+    """
+    if user_ids is None:
+        connector = Neo4jConector(uri, user, password)
+        try:
+            user_ids = get_user_ids(connector)
+        finally:
+            connector.close()
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    print(f"Precalculando el top-{limit} de {len(user_ids)} usuarios en {len(chunks)} bloques...")
+
+    store = RecommendationStore(store_path)
+    start = time.time()
+    done, written = 0, 0
+    try:
+        with multiprocessing.Pool(processes, initializer=_init_worker,
+                                  initargs=(uri, user, password, modelo_als)) as pool:
+            for entries in pool.imap_unordered(_recommend_chunk, ((chunk, limit) for chunk in chunks)):
+                written += store.put_many(entries)
+                done += len(entries)
+                elapsed = time.time() - start
+                print(f"{done}/{len(user_ids)} usuarios ({done / elapsed:.1f} usuarios/s)")
+    finally:
+        store.close()
+
+    elapsed = time.time() - start
+    stats = {'usuarios': done, 'segundos': elapsed, 'usuarios_por_segundo': done / elapsed if elapsed else 0.0,
+             'bytes': written}
+    print(f"Top-{limit} de {done} usuarios guardado en {store_path} en {elapsed:.2f} segundos "
+          f"({written / max(done, 1):.0f} bytes por usuario)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcula las recomendaciones personalizadas de todos los usuarios")
+    parser.add_argument("--uri", default="neo4j://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="Virt1234*")
+    parser.add_argument("--salida", default=RECOMENDACIONES)
+    parser.add_argument("--limite", type=int, default=20)
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--bloque", type=int, default=100)
+    parser.add_argument("--modelo-als", default=MODELO_ALS)
+    args = parser.parse_args()
+
+    precompute_recommendations(args.uri, args.user, args.password, args.salida, args.limite, args.procesos,
+                               args.bloque, args.modelo_als)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import os
+import sys
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Los módulos de preprocesamiento se importan entre sí sin paquete (``from columnar_ratings import ...``)
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, "preprocesamiento")]
+
+from app.similarity_calculator import calculate_pearson_similarity  # noqa: E402
+
+
+def generar_valoraciones(num_usuarios=60, num_peliculas=40, densidad=0.3, semilla=0, prefijo_pelicula=None):
+    """Lista de tuplas (user_id, movie_id, rating) aleatorias con valoraciones de 0.5 a 5 en pasos de 0.5."""
+    rng = np.random.default_rng(semilla)
+    valoraciones = []
+    for usuario in range(1, num_usuarios + 1):
+        for pelicula in np.flatnonzero(rng.random(num_peliculas) < densidad):
+            id_pelicula = f"{prefijo_pelicula}{pelicula}" if prefijo_pelicula else int(pelicula) + 1
+            valoraciones.append((usuario, id_pelicula, float(rng.integers(1, 11)) / 2))
+    return valoraciones
+
+
+def pearson_referencia(valoraciones, min_peliculas=3):
+    """Similitudes {(user1, user2): pearson} con user1 < user2, calculadas con el Pearson de la app."""
+    por_usuario = {}
+    for usuario, pelicula, rating in valoraciones:
+        por_usuario.setdefault(usuario, {})[pelicula] = rating
+    referencia = {}
+    for u1, u2 in combinations(sorted(por_usuario), 2):
+        pearson = calculate_pearson_similarity(por_usuario[u1], por_usuario[u2], min_peliculas)
+        if pearson is not None:
+            referencia[(u1, u2)] = pearson
+    return referencia
+
+
+def comprobar_igual_a_referencia(referencia, similitudes, tolerancia=1e-6):
+    """``similitudes`` es un iterable de (user1, user2, pearson) que debe coincidir con la referencia."""
+    assert referencia, "los datos de prueba no generan ningún par"
+    obtenidas = {(u1, u2): s for u1, u2, s in similitudes}
+    assert obtenidas.keys() == referencia.keys()
+    for par, pearson in referencia.items():
+        assert obtenidas[par] == pytest.approx(pearson, abs=tolerancia)
+
+
+@pytest.fixture
+def valoraciones():
+    return generar_valoraciones()
+
+
+def escribir_shards(valoraciones, directorio, num_shards=3):
+    """Reparte las valoraciones, en orden, entre ``num_shards`` CSV con las columnas del dataset."""
+    os.makedirs(directorio, exist_ok=True)
+    archivos = []
+    for shard, parte in enumerate(np.array_split(np.arange(len(valoraciones)), num_shards)):
+        archivo = os.path.join(directorio, f"ratings_{shard}.csv")
+        with open(archivo, "w") as f:
+            f.write("userId,id,rating\n")
+            for i in parte:
+                usuario, pelicula, rating = valoraciones[i]
+                f.write(f"{usuario},{pelicula},{rating}\n")
+        archivos.append(archivo)
+    return archivos
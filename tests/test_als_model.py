@@ -0,0 +1,77 @@
+import numpy as np
+
+from als_model import entrenar_als, guardar_modelo, recomendar
+import recomendador.FactorModel
+from recomendador.FactorModel import FactorModel
+
+
+def _valoraciones_bajo_rango(num_usuarios=200, num_peliculas=80, densidad=0.3, semilla=0):
+    """Valoraciones generadas por factores de dimensión 3 más ruido, en la escala 0.5-5."""
+    rng = np.random.default_rng(semilla)
+    usuarios = rng.normal(size=(num_usuarios, 3))
+    peliculas = rng.normal(size=(num_peliculas, 3))
+    valoraciones = []
+    for u, p in zip(*np.nonzero(rng.random((num_usuarios, num_peliculas)) < densidad)):
+        rating = np.clip(3 + 0.5 * usuarios[u] @ peliculas[p] + rng.normal(scale=0.2), 0.5, 5)
+        valoraciones.append((int(u) + 1, int(p) + 1, float(np.round(rating * 2) / 2)))
+    return valoraciones
+
+
+def test_als_mejora_a_predecir_la_media():
+    valoraciones = _valoraciones_bajo_rango()
+
+    modelo = entrenar_als(valoraciones, factores=3, regularizacion=0.05, iteraciones=10, fraccion_test=0.2)
+
+    metricas = modelo['metricas']
+    matriz = modelo['matriz'].tocoo()
+    test = np.random.default_rng(0).random(matriz.nnz) < 0.2
+    rmse_media = float(np.sqrt(np.mean((matriz.data[test] - metricas['media']) ** 2)))
+    assert metricas['valoraciones_test'] == int(test.sum())
+    assert metricas['rmse_test'] < 0.7 * rmse_media
+    assert metricas['rmse_entrenamiento'] <= metricas['rmse_test']
+
+
+def test_recomendar_excluye_valoradas_y_ordena():
+    rng = np.random.default_rng(1)
+    factores_peliculas = rng.normal(size=(30, 4))
+    factores_usuario = rng.normal(size=4)
+    valoradas = np.array([0, 5, 7])
+
+    indices, puntuaciones = recomendar(factores_usuario, factores_peliculas, valoradas, limite=5)
+
+    esperadas = factores_peliculas @ factores_usuario
+    esperadas[valoradas] = -np.inf
+    np.testing.assert_array_equal(indices, np.argsort(-esperadas)[:5])
+    np.testing.assert_allclose(puntuaciones, esperadas[indices])
+
+
+def test_factor_model_sirve_lo_guardado(tmp_path):
+    valoraciones = _valoraciones_bajo_rango()
+    modelo = entrenar_als(valoraciones, factores=3, iteraciones=5)
+    guardar_modelo(modelo, tmp_path)
+
+    factor_model = FactorModel(str(tmp_path), min_valoraciones=60)
+    recomendaciones = factor_model.recommend(1, limit=10)
+
+    vistas = {pelicula for usuario, pelicula, _ in valoraciones if usuario == 1}
+    conteos = {}
+    for _, pelicula, _ in valoraciones:
+        conteos[pelicula] = conteos.get(pelicula, 0) + 1
+    assert recomendaciones
+    assert all(pelicula not in vistas and conteos[pelicula] > 60 for pelicula, _, _ in recomendaciones)
+    previstas = [prevista for _, prevista, _ in recomendaciones]
+    assert previstas == sorted(previstas, reverse=True)
+    assert factor_model.recommend(10 ** 6) == []
+
+
+def test_factor_model_solo_guarda_las_ultimas_latencias(tmp_path, monkeypatch):
+    guardar_modelo(entrenar_als(_valoraciones_bajo_rango(), factores=3, iteraciones=1), tmp_path)
+    monkeypatch.setattr(recomendador.FactorModel, "MAX_LATENCIAS", 5)
+    factor_model = FactorModel(str(tmp_path))
+
+    for usuario in range(1, 9):
+        factor_model.recommend(usuario)
+
+    informe = factor_model.latency_report()
+    assert informe['consultas'] == 5
+    assert informe['p50_ms'] <= informe['p99_ms']
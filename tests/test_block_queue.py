@@ -0,0 +1,110 @@
+import functools
+import os
+import time
+
+import numpy as np
+import pytest
+
+import block_queue
+from block_queue import ARCHIVO_COLA, ColaBloques, coordinar
+from conftest import comprobar_igual_a_referencia, escribir_shards, pearson_referencia
+from similarity_shards import LectorShards
+
+# Con las valoraciones de prueba, 4 bloques de usuarios y 10 tiles (4 diagonales y 6 cruzados)
+PRESUPUESTO_4_BLOQUES = 40000
+
+
+@pytest.fixture(autouse=True)
+def espera_corta(monkeypatch):
+    # El coordinador consulta la cola cada 10 s; en las pruebas basta con unas centésimas
+    monkeypatch.setattr(block_queue, "esperar_bloques",
+                        functools.partial(block_queue.esperar_bloques, intervalo=0.05))
+
+
+def _similitudes(directorio):
+    return [s for _, lote in LectorShards(directorio).iterar_lotes() for s in lote]
+
+
+def test_cola_igual_que_pearson_de_referencia(valoraciones, tmp_path):
+    archivos = escribir_shards(valoraciones, tmp_path / "csv")
+
+    coordinar(str(tmp_path / "trabajo"), archivos, str(tmp_path / "salida"), min_peliculas=3, presupuesto_mb=1,
+              workers_locales=1)
+
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones, min_peliculas=3),
+                                 _similitudes(tmp_path / "salida"), tolerancia=1e-5)
+
+
+def test_varios_tiles_igual_que_pearson_de_referencia(valoraciones, tmp_path):
+    archivos = escribir_shards(valoraciones, tmp_path / "csv")
+    trabajo = str(tmp_path / "trabajo")
+
+    coordinar(trabajo, archivos, str(tmp_path / "salida"), min_peliculas=3, presupuesto_bytes=PRESUPUESTO_4_BLOQUES,
+              workers_locales=2)
+
+    cola = ColaBloques(os.path.join(trabajo, ARCHIVO_COLA))
+    assert cola.resumen() == {'pendiente': 0, 'en_curso': 0, 'hecho': 10}
+    assert len(LectorShards(tmp_path / "salida").shards) == 10
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones, min_peliculas=3),
+                                 _similitudes(tmp_path / "salida"), tolerancia=1e-5)
+
+
+def test_top_k_por_tiles_igual_que_top_k_de_referencia(valoraciones, tmp_path):
+    archivos = escribir_shards(valoraciones, tmp_path / "csv")
+
+    coordinar(str(tmp_path / "trabajo"), archivos, str(tmp_path / "salida"), min_peliculas=3, top_k=4,
+              score_minimo=0.1, presupuesto_bytes=PRESUPUESTO_4_BLOQUES, workers_locales=1)
+
+    referencia = pearson_referencia(valoraciones, min_peliculas=3)
+    esperados = {}
+    for (u1, u2), score in referencia.items():
+        if score > 0.1:
+            esperados.setdefault(u1, []).append(score)
+            esperados.setdefault(u2, []).append(score)
+    obtenidos = {}
+    for usuario, vecino, score in _similitudes(tmp_path / "salida"):
+        assert score == pytest.approx(referencia[(min(usuario, vecino), max(usuario, vecino))], abs=1e-5)
+        obtenidos.setdefault(usuario, []).append(score)
+    # Con empates los vecinos pueden variar, pero no las mejores puntuaciones de cada usuario
+    assert obtenidos.keys() == esperados.keys()
+    for usuario, scores in esperados.items():
+        assert sorted(obtenidos[usuario], reverse=True) == pytest.approx(sorted(scores, reverse=True)[:4], abs=1e-5)
+
+
+def test_bloque_sin_latido_vuelve_a_la_cola(tmp_path):
+    cola = ColaBloques(str(tmp_path / ARCHIVO_COLA), timeout_latido=0.2)
+    cola.publicar([("0-5-0-5", 0, 5, 0, 5), ("0-5-5-9", 0, 5, 5, 9)])
+    assert cola.reclamar("caido")[0] == "0-5-0-5"
+    assert cola.latido("0-5-0-5", "caido")
+
+    time.sleep(0.3)
+    assert cola.reclamar("relevo")[0] == "0-5-0-5"
+
+    # El worker original ya no puede renovar ni completar el bloque reasignado
+    assert not cola.latido("0-5-0-5", "caido")
+    assert not cola.completar("0-5-0-5", "caido", "bloque.npy", 1)
+    assert cola.completar("0-5-0-5", "relevo", "bloque.npy", 1)
+    assert cola.resumen() == {'pendiente': 1, 'en_curso': 0, 'hecho': 1}
+
+
+def test_republicar_con_otros_parametros_no_reutiliza_resultados(valoraciones, tmp_path):
+    archivos = escribir_shards(valoraciones, tmp_path / "csv")
+    trabajo = str(tmp_path / "trabajo")
+    coordinar(trabajo, archivos, str(tmp_path / "salida_3"), min_peliculas=3, presupuesto_mb=1, workers_locales=1)
+
+    coordinar(trabajo, archivos, str(tmp_path / "salida_6"), min_peliculas=6, presupuesto_mb=1, workers_locales=1)
+
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones, min_peliculas=6),
+                                 _similitudes(tmp_path / "salida_6"), tolerancia=1e-5)
+
+
+def test_fusion_en_float16(valoraciones, tmp_path):
+    archivos = escribir_shards(valoraciones, tmp_path / "csv")
+
+    coordinar(str(tmp_path / "trabajo"), archivos, str(tmp_path / "salida"), min_peliculas=3, presupuesto_mb=1,
+              workers_locales=1, dtype_score="float16")
+
+    lector = LectorShards(tmp_path / "salida")
+    assert all(lector.abrir(archivo)['similitud'].dtype == np.float16 for archivo in lector.shards)
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones, min_peliculas=3),
+                                 _similitudes(tmp_path / "salida"), tolerancia=1e-3)
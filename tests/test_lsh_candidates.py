@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from conftest import pearson_referencia
+from lsh_candidates import firmas_minhash, iterar_similitudes_lsh
+from sparse_similarity import preparar_matrices
+
+
+def test_firmas_no_dependen_del_tamano_de_lote(valoraciones):
+    _, binaria, _ = preparar_matrices(valoraciones)
+
+    firmas = firmas_minhash(binaria, 24)
+
+    for valores_por_lote in (1, 50, 1000):
+        np.testing.assert_array_equal(firmas_minhash(binaria, 24, valores_por_lote=valores_por_lote), firmas)
+
+
+def test_firma_es_el_minimo_de_los_hashes_de_sus_peliculas(valoraciones):
+    _, binaria, _ = preparar_matrices(valoraciones)
+    num_peliculas = binaria.shape[1]
+    # Con la misma semilla, la firma de la identidad es el hash de cada película por separado
+    hashes = firmas_minhash(sparse.identity(num_peliculas, format="csr"), 8)
+    con_fila_vacia = sparse.vstack([binaria, sparse.csr_matrix((1, num_peliculas))], format="csr")
+
+    firmas = firmas_minhash(con_fila_vacia, 8, valores_por_lote=64)
+
+    for fila in range(binaria.shape[0]):
+        columnas = binaria.indices[binaria.indptr[fila]:binaria.indptr[fila + 1]]
+        np.testing.assert_array_equal(firmas[fila], hashes[columnas].min(axis=0))
+    assert (firmas[-1] > hashes.max()).all()
+
+
+def test_pares_lsh_con_el_pearson_de_referencia(valoraciones):
+    centrada, binaria, user_ids = preparar_matrices(valoraciones)
+    referencia = pearson_referencia(valoraciones, min_peliculas=3)
+
+    similitudes = [s for _, _, lote in iterar_similitudes_lsh(centrada, binaria, user_ids, bandas=10,
+                                                              filas_por_banda=2) for s in lote]
+
+    assert similitudes
+    for u1, u2, score in similitudes:
+        assert score == pytest.approx(referencia[(u1, u2)])
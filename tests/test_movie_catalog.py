@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+from recomendador.MovieCatalog import CONSULTA_VERSION, CONSULTAS, MovieCatalog
+
+
+class GrafoCatalogo:
+    """Conector de prueba con los nodos del catálogo en listas y el sello de versión de Neo4j."""
+
+    def __init__(self, generos, directores, peliculas, version=1):
+        self.nodos = {'generos': generos, 'directores': directores, 'peliculas': peliculas}
+        self.version = version
+        self.cargas = []
+        self.espera = 0.0
+        self.consultado = threading.Event()
+
+    def execute_read(self, query, params=None):
+        assert query == CONSULTA_VERSION
+        self.consultado.set()
+        time.sleep(self.espera)
+        return [dict({parte: len(nodos) for parte, nodos in self.nodos.items()}, version=self.version)]
+
+    def read_columns(self, query, params=None):
+        parte = next(parte for parte, consulta in CONSULTAS.items() if consulta == query)
+        self.cargas.append(parte)
+        if parte == 'peliculas':
+            return {'id': [i for i, _ in self.nodos[parte]], 'titulo': [t for _, t in self.nodos[parte]]}
+        return {'nombre': list(self.nodos[parte])}
+
+
+def _grafo():
+    return GrafoCatalogo(
+        generos=["Drama", "Ciencia ficción", "Crimen"],
+        directores=["Ana", "J.J. Abrams", "Quentin Tarantino", "Tarantino", "Bong Joon-ho"],
+        peliculas=[("tt1", "Alien"), ("tt2", "Aliens"), ("tt3", "Alien 3"), ("tt4", "Parásitos"),
+                   ("tt5", "Alien Resurrection"), ("tt6", "Parásitos")],
+    )
+
+
+def test_busca_nombres_como_palabras_completas():
+    catalogo = MovieCatalog(_grafo())
+
+    assert catalogo.find_directors("una película tipo banana") == []
+    assert catalogo.find_directors("algo de ANA, o de j.j. abrams") == ["Ana", "J.J. Abrams"]
+    assert catalogo.find_directors("me gusta quentin tarantino") == ["Quentin Tarantino", "Tarantino"]
+    assert catalogo.find_directors("lo último de Bong Joon-ho") == ["Bong Joon-ho"]
+    assert catalogo.find_genres("ciencia ficción o un drama") == ["Ciencia ficción", "Drama"]
+    assert catalogo.find_genres("ciencia a secas") == []
+
+
+def test_valida_y_resuelve_titulos():
+    catalogo = MovieCatalog(_grafo())
+
+    assert catalogo.valid_genres(["Drama", "Western"]) == ["Drama"]
+    assert catalogo.valid_movie_ids(["tt4", "tt9"]) == ["tt4"]
+    assert catalogo.titles() == ["Alien", "Alien 3", "Alien Resurrection", "Aliens", "Parásitos"]
+    assert catalogo.movie_ids_for_titles(["Parásitos"]) == ["tt4", "tt6"]
+    assert catalogo.movie_ids_for_titles(["alien"], partial_limit=3) == ["tt1", "tt3", "tt5"]
+    assert catalogo.movie_ids_for_titles(["Inexistente"]) == []
+
+
+def test_solo_recarga_las_partes_que_cambian():
+    grafo = _grafo()
+    catalogo = MovieCatalog(grafo, check_interval=0)
+    catalogo.genres()
+    assert sorted(grafo.cargas) == ["directores", "generos", "peliculas"]
+
+    grafo.cargas.clear()
+    grafo.nodos['directores'] = grafo.nodos['directores'] + ["Agnès Varda"]
+    assert "Agnès Varda" in catalogo.directors()
+    assert grafo.cargas == ["directores"]
+
+    # Un título renombrado no cambia los recuentos, pero sí el sello del nodo (:Catalogo)
+    grafo.cargas.clear()
+    grafo.nodos['peliculas'] = [("tt1", "Alien, el octavo pasajero")] + grafo.nodos['peliculas'][1:]
+    grafo.version = 2
+    assert "Alien, el octavo pasajero" in catalogo.titles()
+    assert sorted(grafo.cargas) == ["directores", "generos", "peliculas"]
+
+    grafo.cargas.clear()
+    catalogo.genres()
+    assert grafo.cargas == []
+
+
+def test_no_bloquea_el_bucle_de_eventos():
+    grafo = _grafo()
+    catalogo = MovieCatalog(grafo, check_interval=0).refresh()
+    grafo.consultado.clear()
+    grafo.nodos['generos'] = grafo.nodos['generos'] + ["Western"]
+    grafo.espera = 0.5
+
+    async def consultar():
+        inicio = time.monotonic()
+        generos = catalogo.genres()
+        duracion = time.monotonic() - inicio
+        await asyncio.get_running_loop().run_in_executor(None, grafo.consultado.wait, 5)
+        while catalogo._refrescando:
+            await asyncio.sleep(0.01)
+        return generos, duracion
+
+    generos, duracion = asyncio.run(consultar())
+
+    assert duracion < 0.25
+    assert "Western" not in generos
+    # Sin volver a comprobar el sello: la recarga en segundo plano ya dejó el género nuevo
+    catalogo.check_interval = 3600
+    assert "Western" in catalogo.genres()
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from columnar_ratings import leer_shards_valoraciones
+from conftest import comprobar_igual_a_referencia, escribir_shards, generar_valoraciones, pearson_referencia
+from out_of_core import CSREnDisco, iterar_tiles, volcar_csr_en_disco
+
+
+@pytest.fixture(params=[None, "tt"], ids=["ids_enteros", "ids_imdb"])
+def valoraciones_con_repetidas(request):
+    valoraciones = generar_valoraciones(prefijo_pelicula=request.param)
+    # Una valoración repetida más adelante: se conserva la última, como en el resto de motores
+    usuario, pelicula, rating = valoraciones[5]
+    return valoraciones + [(usuario, pelicula, 5.5 - rating)]
+
+
+def test_csr_en_disco_igual_que_en_memoria(valoraciones_con_repetidas, tmp_path):
+    archivos = escribir_shards(valoraciones_con_repetidas, tmp_path / "csv")
+
+    # Lotes pequeños: cada uno tiene su propio diccionario de ids
+    meta = volcar_csr_en_disco(archivos, tmp_path / "csr", batch_size=50)
+
+    esperada = leer_shards_valoraciones(archivos).a_matriz_csr()
+    csr = CSREnDisco(tmp_path / "csr")
+    obtenida = csr.bloque(0, csr.shape[0])
+    assert meta['nnz'] == esperada.nnz
+    np.testing.assert_array_equal(obtenida.indptr, esperada.indptr)
+    np.testing.assert_array_equal(obtenida.indices, esperada.indices)
+    np.testing.assert_array_equal(obtenida.data, esperada.data)
+    assert sorted(p.name for p in (tmp_path / "csr").iterdir()) == [
+        "csr.json", "data.npy", "indices.npy", "indptr.npy", "peliculas.npy", "usuarios.npy"]
+
+
+def test_tiles_igual_que_pearson_de_referencia(valoraciones_con_repetidas, tmp_path):
+    archivos = escribir_shards(valoraciones_con_repetidas, tmp_path / "csv")
+    volcar_csr_en_disco(archivos, tmp_path / "csr", batch_size=50)
+    csr = CSREnDisco(tmp_path / "csr")
+
+    # Presupuesto mínimo para forzar muchos tiles, diagonales y no diagonales
+    resultados = list(iterar_tiles(csr, presupuesto_bytes=20000, min_peliculas=3))
+
+    assert resultados[0][1] > 3
+    similitudes = [(u1, u2, s) for _, _, filas, columnas, pearson in resultados
+                   for u1, u2, s in zip(csr.user_ids[filas].tolist(), csr.user_ids[columnas].tolist(),
+                                        pearson.tolist())]
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones_con_repetidas, min_peliculas=3), similitudes,
+                                 tolerancia=1e-5)
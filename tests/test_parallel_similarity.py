@@ -0,0 +1,25 @@
+from conftest import comprobar_igual_a_referencia, pearson_referencia
+from parallel_similarity import iterar_similitudes_multiproceso
+from sparse_similarity import preparar_matrices
+
+
+def test_multiproceso_igual_que_pearson_de_referencia(valoraciones):
+    centrada, binaria, user_ids = preparar_matrices(valoraciones)
+
+    similitudes = [s for _, _, bloque in iterar_similitudes_multiproceso(centrada, binaria, user_ids,
+                                                                         min_peliculas=3, num_procesos=2)
+                   for s in bloque]
+
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones, min_peliculas=3), similitudes)
+
+
+def test_multiproceso_omite_bloques_ya_calculados(valoraciones):
+    centrada, binaria, user_ids = preparar_matrices(valoraciones)
+    bloques = {(inicio, fin): bloque for inicio, fin, bloque in
+               iterar_similitudes_multiproceso(centrada, binaria, user_ids, num_procesos=2)}
+    omitidos = set(list(bloques)[:len(bloques) // 2])
+
+    reanudados = {(inicio, fin) for inicio, fin, _ in
+                  iterar_similitudes_multiproceso(centrada, binaria, user_ids, num_procesos=2, omitir=omitidos)}
+
+    assert omitidos and reanudados == bloques.keys() - omitidos
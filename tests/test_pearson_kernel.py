@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import pearson_kernel
+from columnar_ratings import ValoracionesColumnares
+from conftest import comprobar_igual_a_referencia, pearson_referencia
+from pearson_kernel import KernelPearson
+
+IMPLEMENTACIONES = [
+    pytest.param(True, id="numpy"),
+    pytest.param(False, id="cython", marks=pytest.mark.skipif(not pearson_kernel.KERNEL_COMPILADO,
+                                                              reason="similarity_kernel no compilado")),
+]
+
+
+def _similitudes(kernel, user_ids, min_peliculas, tam_bloque=9):
+    for inicio in range(0, len(user_ids), tam_bloque):
+        filas, columnas, pearson = kernel.similitudes_bloque(inicio, min(inicio + tam_bloque, len(user_ids)),
+                                                             min_peliculas)
+        yield from zip(user_ids[filas].tolist(), user_ids[columnas].tolist(), pearson.tolist())
+
+
+@pytest.mark.parametrize("forzar_numpy", IMPLEMENTACIONES)
+def test_kernel_igual_que_pearson_de_referencia(valoraciones, forzar_numpy):
+    columnares = ValoracionesColumnares.desde_tuplas(valoraciones)
+    kernel = KernelPearson(columnares.a_matriz_csr(), num_hilos=2, forzar_numpy=forzar_numpy)
+
+    similitudes = list(_similitudes(kernel, columnares.user_ids, min_peliculas=3))
+
+    # La matriz del kernel es float32: las valoraciones en pasos de 0.5 son exactas, las sumas no
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones, min_peliculas=3), similitudes, tolerancia=1e-5)
+
+
+def test_kernel_numpy_por_tramos(valoraciones, monkeypatch):
+    columnares = ValoracionesColumnares.desde_tuplas(valoraciones)
+    kernel = KernelPearson(columnares.a_matriz_csr(), forzar_numpy=True)
+    filas, columnas = kernel.pares_candidatos(0, columnares.num_usuarios, min_peliculas=3)
+    completo = kernel.calcular(filas, columnas)
+
+    monkeypatch.setattr(pearson_kernel, "PARES_POR_TRAMO_NUMPY", 7)
+    por_tramos = kernel.calcular(filas, columnas)
+
+    for esperado, obtenido in zip(completo, por_tramos):
+        np.testing.assert_allclose(obtenido, esperado)
+
+
+def test_pares_candidatos_respetan_min_peliculas(valoraciones):
+    columnares = ValoracionesColumnares.desde_tuplas(valoraciones)
+    kernel = KernelPearson(columnares.a_matriz_csr(), forzar_numpy=True)
+    peliculas = {}
+    for usuario, pelicula, _ in valoraciones:
+        peliculas.setdefault(usuario, set()).add(pelicula)
+    user_ids = columnares.user_ids
+
+    filas, columnas = kernel.pares_candidatos(0, columnares.num_usuarios, min_peliculas=4)
+
+    esperados = {(u1, u2) for u1 in peliculas for u2 in peliculas
+                 if u1 < u2 and len(peliculas[u1] & peliculas[u2]) >= 4}
+    assert set(zip(user_ids[filas].tolist(), user_ids[columnas].tolist())) == esperados
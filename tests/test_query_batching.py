@@ -0,0 +1,155 @@
+import re
+import threading
+import time
+
+import pytest
+
+from recomendador.CriteriaRecommendations import CriteriaRecommendationsMixin
+from recomendador.QueryBatcher import QueryBatcher
+
+# Grafo de prueba: géneros de cada película y valoraciones {usuario: puntuación}
+GENEROS = {
+    "m1": {"Drama"},
+    "m2": {"Drama", "Crimen"},
+    "m3": {"Comedia"},
+    "m4": {"Crimen"},
+    "m5": {"Comedia", "Drama"},
+    "m6": {"Comedia"},
+}
+VALORACIONES = {
+    "m1": {u: 4.0 for u in range(1, 8)},
+    "m2": {u: 3.0 + (u % 3) for u in range(1, 10)},
+    "m3": {u: 5.0 for u in range(1, 5)},  # Solo 4 valoraciones: nunca se recomienda
+    "m4": {u: 2.5 for u in range(2, 9)},
+    "m5": {u: 3.5 for u in range(1, 7)},
+    "m6": {u: 4.5 for u in range(3, 12)},
+}
+
+
+def consulta_por_genero(valores, usuario_id, limite):
+    """Lo que devuelve Neo4j para la consulta del criterio 'genero' sobre el grafo de prueba."""
+    filas = []
+    for pelicula, generos in GENEROS.items():
+        coincidencias = len(generos & set(valores))
+        valoraciones = VALORACIONES[pelicula]
+        if not coincidencias or usuario_id in valoraciones or len(valoraciones) <= 5:
+            continue
+        filas.append({'id': pelicula, 'titulo': pelicula.upper(), 'año': 2000,
+                      'score_coincidencia': coincidencias,
+                      'promedio_valoracion': sum(valoraciones.values()) / len(valoraciones)})
+    filas.sort(key=lambda f: (-f['score_coincidencia'], -f['promedio_valoracion']))
+    return filas[:limite]
+
+
+class ConectorGrafo:
+    """Sustituye a ``execute_query``: evalúa la consulta por género, suelta o en micro-lote."""
+
+    def __init__(self):
+        self.consultas = []
+        self._lock = threading.Lock()
+
+    def __call__(self, query, params):
+        with self._lock:
+            self.consultas.append((query, params))
+        assert "g.nombre IN" in query
+        if "UNWIND $peticiones AS peticion_lote" not in query:
+            return consulta_por_genero(params["valores"], params.get("usuario_id"), params["limite"])
+
+        # Dentro del lote los parámetros por petición se leen de ``peticion_lote``
+        assert not re.search(r"\$(valores|usuario_id)\b", query)
+        assert "peticion_lote.valores" in query
+        filas = []
+        # Las filas de cada petición conservan su ORDER BY, pero el lote se recorre al revés
+        for peticion in reversed(params["peticiones"]):
+            for fila in consulta_por_genero(peticion["valores"], peticion.get("usuario_id"), params["limite"]):
+                filas.append(dict(fila, peticion_lote=peticion))
+        return filas
+
+
+class CatalogoFijo:
+    def valid_genres(self, values):
+        return [v for v in values if v in {"Drama", "Crimen", "Comedia"}]
+
+
+class Recomendador(CriteriaRecommendationsMixin):
+    catalog = CatalogoFijo()
+
+    def __init__(self, micro_batching, conector):
+        self.micro_batching = micro_batching
+        self.execute_query = conector
+
+
+@pytest.fixture(autouse=True)
+def agrupador_nuevo(monkeypatch):
+    # El agrupador es uno por proceso: cada prueba crea el suyo con su ventana
+    monkeypatch.setattr(CriteriaRecommendationsMixin, "_query_batcher", None)
+    monkeypatch.setattr(CriteriaRecommendationsMixin, "batch_window", 0.05)
+
+
+PETICIONES = [(["Drama"], None), (["Drama"], 1), (["Comedia", "Drama"], 3), (["Crimen"], 2), (["Comedia"], 11),
+              (["Western"], None), (["Crimen", "Drama"], 8)]
+
+
+def test_run_query_batch_reparte_las_filas_por_peticion():
+    conector = ConectorGrafo()
+    recomendador = Recomendador(True, conector)
+    query, params = next(recomendador._criteria_queries("genero", ["Drama"], user_id=1, limit=2))
+    peticiones = [dict(params, valores=["Drama"], usuario_id=1), dict(params, valores=["Comedia"], usuario_id=3),
+                  dict(params, valores=["Crimen"], usuario_id=2), dict(params, valores=["Drama"], usuario_id=2)]
+
+    resultados = recomendador._run_query_batch((query, ""), peticiones)
+
+    assert len(conector.consultas) == 1
+    assert resultados == [consulta_por_genero(p["valores"], p["usuario_id"], 2) for p in peticiones]
+    assert resultados[2] == []
+
+
+def test_peticiones_concurrentes_igual_que_sin_lotes():
+    esperados = [Recomendador(False, ConectorGrafo())._get_recommendations_by_criteria("genero", valores, usuario, 3)
+                 for valores, usuario in PETICIONES]
+    conector = ConectorGrafo()
+    recomendador = Recomendador(True, conector)
+    resultados = [None] * len(PETICIONES)
+
+    def pedir(i):
+        valores, usuario = PETICIONES[i]
+        resultados[i] = recomendador._get_recommendations_by_criteria("genero", valores, usuario, 3)
+
+    hilos = [threading.Thread(target=pedir, args=(i,)) for i in range(len(PETICIONES))]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert resultados == esperados
+    # "Western" no está en el catálogo y no llega a consultarse; con y sin usuario son consultas distintas
+    assert len(conector.consultas) < len(PETICIONES) - 1
+
+
+def test_lote_con_menos_resultados_falla_en_todas_las_peticiones():
+    def ejecutar_lote(key, requests):
+        return [[request] for request in requests[:-1]]
+
+    batcher = QueryBatcher(ejecutar_lote, window=0.05)
+    futuros = [batcher.submit("clave", i) for i in range(3)]
+
+    for futuro in futuros:
+        with pytest.raises(RuntimeError):
+            futuro.result(timeout=5)
+
+
+def test_lote_lleno_se_ejecuta_sin_esperar_la_ventana():
+    lotes = []
+
+    def ejecutar_lote(key, requests):
+        lotes.append(list(requests))
+        return requests
+
+    batcher = QueryBatcher(ejecutar_lote, window=60, max_batch_size=4)
+    inicio = time.monotonic()
+    futuros = [batcher.submit("clave", i) for i in range(4)]
+
+    assert [futuro.result(timeout=5) for futuro in futuros] == [0, 1, 2, 3]
+    assert time.monotonic() - inicio < 5
+    assert lotes == [[0, 1, 2, 3]]
+    assert batcher.stats() == {'lotes': 1, 'peticiones': 4, 'tam_medio': 4.0}
@@ -0,0 +1,47 @@
+import pytest
+
+from conftest import comprobar_igual_a_referencia, pearson_referencia
+from sparse_similarity import comparar_similitudes, iterar_similitudes_sparse, pearson_para_pares, preparar_matrices
+
+
+def test_motor_disperso_igual_que_pearson_de_referencia(valoraciones):
+    centrada, binaria, user_ids = preparar_matrices(valoraciones)
+
+    similitudes = [s for _, _, bloque in iterar_similitudes_sparse(centrada, binaria, user_ids, min_peliculas=3,
+                                                                   block_size=7)
+                   for s in bloque]
+
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones, min_peliculas=3), similitudes)
+
+
+def test_min_peliculas_descarta_pares_con_pocas_en_comun(valoraciones):
+    centrada, binaria, user_ids = preparar_matrices(valoraciones)
+
+    similitudes = [s for _, _, bloque in iterar_similitudes_sparse(centrada, binaria, user_ids, min_peliculas=8)
+                   for s in bloque]
+
+    comprobar_igual_a_referencia(pearson_referencia(valoraciones, min_peliculas=8), similitudes)
+
+
+def test_pearson_para_pares_sin_varianza():
+    # El usuario 2 valora todo igual: Pearson no está definido y el par no se devuelve
+    valoraciones = [(1, 1, 1.0), (1, 2, 3.0), (1, 3, 5.0), (2, 1, 4.0), (2, 2, 4.0), (2, 3, 4.0),
+                    (3, 1, 2.0), (3, 2, 3.0), (3, 3, 4.5)]
+    centrada, binaria, _ = preparar_matrices(valoraciones)
+
+    filas, columnas, pearson = pearson_para_pares(centrada, binaria, [0, 0, 1], [1, 2, 2])
+
+    assert list(zip(filas, columnas)) == [(0, 2)]
+    assert pearson[0] == pytest.approx(pearson_referencia(valoraciones)[(1, 3)])
+
+
+def test_comparar_similitudes_detecta_diferencias(valoraciones):
+    centrada, binaria, user_ids = preparar_matrices(valoraciones)
+    referencia = [s for _, _, bloque in iterar_similitudes_sparse(centrada, binaria, user_ids) for s in bloque]
+    (u1, u2, s), *resto = referencia
+
+    assert comparar_similitudes(referencia, referencia)['coinciden']
+    informe = comparar_similitudes(referencia, [(u1, u2, s + 1e-3)] + resto[1:])
+    assert not informe['coinciden']
+    assert (informe['faltan'], informe['sobran']) == (1, 0)
+    assert informe['diferencia_maxima'] == pytest.approx(1e-3)